@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -44,8 +45,8 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticated',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
+        'loans.authentication.ApiKeyAuthentication',
         'rest_framework.authentication.SessionAuthentication',
-        'rest_framework.authentication.BasicAuthentication',
     ],
     'EXCEPTION_HANDLER': 'loans.exceptions.custom_exception_handler',
 }
@@ -58,8 +59,23 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'loans.routers.PrimaryPinMiddleware',
 ]
 
+# Seconds a process trusts an API key it has already verified, and how many
+# verified keys it remembers.
+LOAN_API_KEY_CACHE_TTL = 60
+LOAN_API_KEY_CACHE_SIZE = 10000
+
+# Opt-in request profiling: Server-Timing headers, /api/metrics/ and sampled
+# cProfile dumps of requests slower than LOAN_PROFILE_SLOW_MS.
+LOAN_PROFILING = os.environ.get('LOAN_PROFILING', '') == '1'
+LOAN_PROFILE_SAMPLE_RATE = float(os.environ.get('LOAN_PROFILE_SAMPLE_RATE', '0'))
+LOAN_PROFILE_SLOW_MS = 500
+LOAN_PROFILE_DIR = os.environ.get('LOAN_PROFILE_DIR', str(BASE_DIR / 'profiles'))
+if LOAN_PROFILING:
+    MIDDLEWARE.insert(0, 'loans.profiling.ProfilingMiddleware')
+
 ROOT_URLCONF = 'bank_system.urls'
 
 TEMPLATES = [
@@ -82,16 +98,125 @@ WSGI_APPLICATION = 'bank_system.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.postgresql',
-        'NAME': 'bank_system_db',      
-        'USER': 'myuser',              
-        'PASSWORD': 'your_correct_password', 
-        'HOST': 'localhost',
-        'PORT': '5432',
+# The DATABASE_* variables documented in readme.md override these defaults,
+# e.g. DATABASE_ENGINE=django.db.backends.sqlite3 to run offline.
+DATABASE_ENGINE = os.environ.get('DATABASE_ENGINE', 'django.db.backends.postgresql')
+
+if DATABASE_ENGINE.endswith('sqlite3'):
+    DATABASES = {
+        'default': {
+            'ENGINE': DATABASE_ENGINE,
+            'NAME': os.environ.get('DATABASE_NAME', BASE_DIR / 'db.sqlite3'),
+        }
     }
-}
+    # A second SQLite file stands in for a read replica, to run the routing
+    # locally.
+    if os.environ.get('DATABASE_REPLICA_NAME'):
+        DATABASES['replica'] = {
+            'ENGINE': DATABASE_ENGINE,
+            'NAME': os.environ['DATABASE_REPLICA_NAME'],
+        }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': DATABASE_ENGINE,
+            'NAME': os.environ.get('DATABASE_NAME', 'bank_system_db'),
+            'USER': os.environ.get('DATABASE_USERNAME', 'myuser'),
+            'PASSWORD': os.environ.get('DATABASE_PASSWORD', 'your_correct_password'),
+            'HOST': os.environ.get('DATABASE_HOST', 'localhost'),
+            'PORT': os.environ.get('DATABASE_PORT', '5432'),
+        }
+    }
+    if os.environ.get('DATABASE_REPLICA_HOST'):
+        DATABASES['replica'] = {
+            **DATABASES['default'],
+            'HOST': os.environ['DATABASE_REPLICA_HOST'],
+            'PORT': os.environ.get('DATABASE_REPLICA_PORT', DATABASES['default']['PORT']),
+        }
+
+# Keep connections open between requests (DATABASE_CONN_MAX_AGE seconds) and
+# check them before reuse, so a dropped connection is replaced instead of
+# failing the request.
+for database in DATABASES.values():
+    database['CONN_MAX_AGE'] = int(os.environ.get('DATABASE_CONN_MAX_AGE', '60'))
+    database['CONN_HEALTH_CHECKS'] = True
+
+if 'replica' in DATABASES:
+    # Tests read the replica from the test primary.
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+
+# List, schedule and analytics reads go to the replica when one is
+# configured; see loans.routers.
+DATABASE_ROUTERS = ['loans.routers.ReplicaRouter']
+
+# Seconds a user's reads stay on the primary after they write, covering the
+# replica's lag.
+LOAN_REPLICA_PIN_SECONDS = 5
+
+# Cache
+# Shared between worker processes when REDIS_URL is set, per-process otherwise.
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Seconds each process keeps the active LoanConfig in memory.
+LOAN_CONFIG_LOCAL_TTL = 5
+
+# Seconds the LoanConfig catalog is kept in the shared cache. Publishing a
+# version drops it at once; this bounds how long a missed drop goes unseen.
+LOAN_CONFIG_CACHE_TTL = 300
+
+# Rows fetched per round trip by the streaming export endpoints.
+LOAN_EXPORT_CHUNK_SIZE = 2000
+
+# Seconds the portfolio analytics report is cached.
+LOAN_ANALYTICS_CACHE_TTL = 300
+
+# Cache rendered list and schedule responses. Writes invalidate them through
+# counters in the default cache, so this needs a cache shared by every worker
+# process; it is on when REDIS_URL is set.
+LOAN_RESPONSE_CACHE = bool(os.environ.get('REDIS_URL'))
+
+# Seconds a rendered list or schedule response is cached. Writes invalidate
+# it earlier, so this only bounds how long an unused entry lingers.
+LOAN_RESPONSE_CACHE_TTL = 300
+
+# Most amounts (and most terms) one loan quote may price.
+LOAN_QUOTE_MAX_AXIS = 50
+
+# Longest term, in months, a quote may price.
+LOAN_QUOTE_MAX_TERM = 600
+
+# Most loans or funds one bulk approval request may decide.
+LOAN_BULK_DECISION_MAX = 5000
+
+# Days an installment may stay unpaid after its due date before
+# scan_overdue flags the loan as delinquent.
+LOAN_OVERDUE_GRACE_DAYS = 0
+
+# Build payment schedules in integer cents, with the last installment
+# absorbing the rounding residual, instead of floats rounded per row.
+LOAN_EXACT_AMORTIZATION = os.environ.get('LOAN_EXACT_AMORTIZATION', '') == '1'
+
+# Background jobs (manage.py runworker): attempts before a job is marked
+# failed, the first retry delay in seconds (doubled on every retry, up to
+# the max), how often a running job's worker reports it is alive, and how
+# long it may go without doing so before the job is requeued.
+LOAN_JOB_MAX_ATTEMPTS = 5
+LOAN_JOB_BACKOFF = 5
+LOAN_JOB_BACKOFF_MAX = 3600
+LOAN_JOB_HEARTBEAT = 30
+LOAN_JOB_TIMEOUT = 600
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
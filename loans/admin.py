@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import User, LoanFund, LoanConfig, Loan, Payment
+from .models import User, LoanFund, LoanConfig, Loan, Payment, Installment, CapacityLedger, Job, ApiKey
 
 class CustomUserAdmin(UserAdmin):
     
@@ -15,8 +15,20 @@ class CustomUserAdmin(UserAdmin):
         }),
     )
 
+class LoanConfigAdmin(admin.ModelAdmin):
+    list_display = ('product', 'version', 'compound_frequency', 'interest_rate', 'created_at')
+    list_filter = ('product',)
+
+    # Versions are immutable; new ones are added, never edited.
+    def has_change_permission(self, request, obj=None):
+        return False
+
 admin.site.register(User, CustomUserAdmin)
 admin.site.register(LoanFund)
-admin.site.register(LoanConfig)
+admin.site.register(LoanConfig, LoanConfigAdmin)
 admin.site.register(Loan)
 admin.site.register(Payment)
+admin.site.register(Installment)
+admin.site.register(CapacityLedger)
+admin.site.register(Job)
+admin.site.register(ApiKey)
@@ -0,0 +1,344 @@
+"""
+Vectorized amortization engine.
+
+Schedules are computed in closed form as NumPy columns instead of one
+installment at a time. Results stay columnar until ``to_records()`` turns them
+into the JSON-friendly rows stored on ``Loan.payment_schedule``.
+
+The exact mode keeps money in integer cents (int64 arrays): interest is
+rounded to the cent on the actual outstanding balance each period and the
+last installment absorbs whatever residual is left, so payments always sum
+to principal plus interest without any clamping.
+"""
+import math
+from datetime import date
+
+import numpy as np
+
+# Months between two installments for each LoanConfig.compound_frequency.
+PAYMENT_INTERVAL_MONTHS = {
+    'M': 1,
+    'Q': 3,
+    'A': 12,
+}
+
+# Every installment is spaced by this many days per interval month.
+DAYS_PER_MONTH = 30
+
+# Compounding periods per year, as used by Loan.calculate_sophisticated_emi.
+COMPOUND_PERIODS_PER_YEAR = {
+    'M': 12,
+    'Q': 4,
+    'A': 1,
+}
+
+
+def payment_interval(compound_frequency):
+    """
+    Returns the number of months between installments for a frequency code.
+    """
+    return PAYMENT_INTERVAL_MONTHS.get(compound_frequency, 1)
+
+
+def level_payment(principal, periodic_rate, periods):
+    """
+    Level installment for an annuity. Works on scalars and NumPy arrays.
+    """
+    principal = np.asarray(principal, dtype=float)
+    periodic_rate = np.asarray(periodic_rate, dtype=float)
+    periods = np.asarray(periods, dtype=float)
+    growth = np.power(1 + periodic_rate, periods)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        payment = principal * periodic_rate * growth / (growth - 1)
+    return np.where(periodic_rate == 0, principal / periods, payment)
+
+
+def sophisticated_emi(principals, annual_rates, terms_months, compound_frequency='M'):
+    """
+    EMI for any number of loans at once, rounded to cents.
+
+    The periodic rate is the annual rate divided by the compounding periods
+    per year, applied over ``terms_months`` installments.
+    """
+    periods_per_year = COMPOUND_PERIODS_PER_YEAR.get(compound_frequency, 12)
+    rates = (np.asarray(annual_rates, dtype=float) / 100) / periods_per_year
+    return np.round(level_payment(principals, rates, terms_months), 2)
+
+
+def to_cents(amounts):
+    """
+    Converts money amounts (Decimal, float or arrays of either) to int64 cents.
+    """
+    return np.rint(np.asarray(amounts, dtype=float) * 100).astype(np.int64)
+
+
+def _exact_columns(principal_cents, periodic_rates, periods, level=None):
+    """
+    Integer-cent installments for N loans, as (N, max periods) int64 arrays.
+
+    ``level`` fixes the installment in cents; by default it is the level
+    payment that repays each loan over its periods. Each period's interest is
+    rounded on the balance the previous one left, so periods are stepped one
+    at a time: vectorized over the loans of a batch, and in plain integers for
+    a single loan, where NumPy's per-call overhead would dominate (about 7ms
+    instead of 0.3ms for 360 periods).
+    """
+    if level is None:
+        level = np.rint(level_payment(principal_cents, periodic_rates, periods)).astype(np.int64)
+    if principal_cents.size == 1:
+        return _exact_single(int(principal_cents[0]), float(periodic_rates[0]), int(periods[0]), int(np.ravel(level)[0]))
+
+    count = principal_cents.size
+    width = int(periods.max()) if periods.size else 0
+    payment = np.zeros((count, width), dtype=np.int64)
+    principal = np.zeros((count, width), dtype=np.int64)
+    interest = np.zeros((count, width), dtype=np.int64)
+    balance = np.zeros((count, width), dtype=np.int64)
+    outstanding = principal_cents.copy()
+    for k in range(width):
+        active = k < periods
+        due = np.where(active, np.floor(outstanding * periodic_rates + 0.5).astype(np.int64), 0)
+        repaid = np.where(k == periods - 1, outstanding, np.minimum(level - due, outstanding))
+        repaid = np.where(active, repaid, 0)
+        outstanding = outstanding - repaid
+        interest[:, k] = due
+        principal[:, k] = repaid
+        payment[:, k] = due + repaid
+        balance[:, k] = np.where(active, outstanding, 0)
+    return payment, principal, interest, balance
+
+
+def _exact_single(outstanding, periodic_rate, periods, level):
+    """
+    ``_exact_columns`` for one loan, as (1, periods) arrays.
+    """
+    interest = []
+    principal = []
+    balance = []
+    for k in range(periods):
+        due = math.floor(outstanding * periodic_rate + 0.5)
+        repaid = outstanding if k == periods - 1 else min(level - due, outstanding)
+        outstanding -= repaid
+        interest.append(due)
+        principal.append(repaid)
+        balance.append(outstanding)
+    interest = np.array([interest], dtype=np.int64)
+    principal = np.array([principal], dtype=np.int64)
+    return interest + principal, principal, interest, np.array([balance], dtype=np.int64)
+
+
+def _balances(principal, periodic_rate, payment, k):
+    """
+    Outstanding balance after ``k`` installments, in closed form.
+    """
+    growth = np.power(1 + periodic_rate, k)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        balance = principal * growth - payment * (growth - 1) / periodic_rate
+    return np.where(periodic_rate == 0, principal - payment * k, balance)
+
+
+class Schedule:
+    """
+    Columnar amortization schedule for a single loan.
+    """
+
+    def __init__(self, installment, due_date, payment, principal, interest, balance):
+        self.installment = installment
+        self.due_date = due_date
+        self.payment = payment
+        self.principal = principal
+        self.interest = interest
+        self.balance = balance
+
+    def __len__(self):
+        return len(self.installment)
+
+    def _money(self, column):
+        return np.round(column, 2)
+
+    def to_records(self):
+        """
+        Converts the columns into the list-of-dicts format served by the API.
+        """
+        columns = zip(
+            self.installment.tolist(),
+            self.due_date.astype(str).tolist(),
+            self._money(self.payment).tolist(),
+            self._money(self.principal).tolist(),
+            self._money(self.interest).tolist(),
+            self._money(np.maximum(self.balance, 0)).tolist(),
+        )
+        return [
+            {
+                'installment': installment,
+                'due_date': due_date,
+                'total_installment': payment,
+                'principal_payment': principal,
+                'interest_payment': interest,
+                'remaining_balance': balance,
+            }
+            for installment, due_date, payment, principal, interest, balance in columns
+        ]
+
+
+class ExactSchedule(Schedule):
+    """
+    Schedule whose money columns are int64 cents.
+    """
+
+    def _money(self, column):
+        return column / 100
+
+
+class BatchSchedule:
+    """
+    Amortization schedules for many loans as 2-D arrays.
+
+    Row ``i`` holds loan ``i``; columns past ``periods[i]`` are padding and are
+    zero in every money array and ``False`` in ``mask``. Money arrays hold
+    int64 cents when built with ``exact=True``.
+    """
+
+    def __init__(self, periods, payment, principal, interest, balance, mask):
+        self.periods = periods
+        self.payment = payment
+        self.principal = principal
+        self.interest = interest
+        self.balance = balance
+        self.mask = mask
+
+    def __len__(self):
+        return len(self.periods)
+
+
+def _schedule(principal, periodic_rate, installment, due_date, payment=None, exact=False):
+    """
+    Amortizes ``principal`` over ``len(installment)`` periods. With ``payment``
+    the installment is fixed and the last one settles whatever is left.
+    """
+    n = len(installment)
+    fixed = payment is not None
+    if exact:
+        level = None if not fixed else to_cents([payment])
+        payment, principal_paid, interest, balance = _exact_columns(
+            to_cents([principal]), np.array([periodic_rate]), np.array([n]), level=level,
+        )
+        return ExactSchedule(
+            installment=installment,
+            due_date=due_date,
+            payment=payment[0],
+            principal=principal_paid[0],
+            interest=interest[0],
+            balance=balance[0],
+        )
+
+    principal = float(principal)
+    level = float(payment) if fixed else float(level_payment(principal, periodic_rate, n))
+    payment = np.full(n, level)
+    balance = _balances(principal, periodic_rate, level, np.arange(1, n + 1))
+    opening = np.concatenate(([principal], balance[:-1]))
+    if n and fixed:
+        payment[-1] = opening[-1] * (1 + periodic_rate)
+        balance[-1] = 0.0
+    interest = opening * periodic_rate
+    principal_paid = payment - interest
+
+    return Schedule(
+        installment=installment,
+        due_date=due_date,
+        payment=payment,
+        principal=principal_paid,
+        interest=interest,
+        balance=balance,
+    )
+
+
+def amortize(principal, annual_rate, term_months, compound_frequency='M', start_date=None, exact=False):
+    """
+    Builds the amortization schedule of one loan.
+
+    ``annual_rate`` is a percentage, as stored on ``Loan.interest_rate``. With
+    ``exact`` the result is an ``ExactSchedule`` in integer cents.
+    """
+    interval = payment_interval(compound_frequency)
+    n = -(-int(term_months) // interval)
+    r = (float(annual_rate) / 100) / (12 / interval)
+    k = np.arange(1, n + 1)
+    first = np.datetime64(start_date or date.today(), 'D')
+    due_date = first + k * np.timedelta64(interval * DAYS_PER_MONTH, 'D')
+    return _schedule(principal, r, k, due_date, exact=exact)
+
+
+def reamortize(balance, annual_rate, remaining_periods, compound_frequency='M', first_installment=1,
+               first_due_date=None, payment=None, exact=False):
+    """
+    Recomputes only the tail of a schedule, from ``first_installment`` (due on
+    ``first_due_date``) onwards, for an outstanding ``balance``.
+
+    Without ``payment`` the balance is spread over ``remaining_periods`` level
+    installments ("reduce EMI"). With ``payment`` the installment is kept and
+    the term shrinks to the periods needed to repay the balance ("reduce
+    term"), never beyond ``remaining_periods``.
+    """
+    interval = payment_interval(compound_frequency)
+    r = (float(annual_rate) / 100) / (12 / interval)
+    n = int(remaining_periods)
+    if payment is not None:
+        ratio = r * float(balance) / float(payment)
+        if r == 0:
+            needed = float(balance) / float(payment)
+        elif ratio < 1:
+            needed = -np.log(1 - ratio) / np.log(1 + r)
+        else:
+            needed = n
+        n = max(1, min(n, int(np.ceil(needed - 1e-9))))
+
+    k = np.arange(first_installment, first_installment + n)
+    first = np.datetime64(first_due_date or date.today(), 'D')
+    due_date = first + (k - first_installment) * np.timedelta64(interval * DAYS_PER_MONTH, 'D')
+    return _schedule(balance, r, k, due_date, payment=payment, exact=exact)
+
+
+def amortize_batch(principals, annual_rates, terms_months, compound_frequency='M', exact=False):
+    """
+    Amortizes N loans in one call.
+
+    ``principals``, ``annual_rates`` and ``terms_months`` are equal-length
+    sequences; the result is a ``BatchSchedule`` of shape (N, max periods).
+    """
+    interval = payment_interval(compound_frequency)
+    rates = (np.asarray(annual_rates, dtype=float).reshape(-1, 1) / 100) / (12 / interval)
+    periods = -(-np.asarray(terms_months, dtype=np.int64) // interval)
+
+    if exact:
+        payment, principal_paid, interest, balance = _exact_columns(to_cents(principals), rates[:, 0], periods)
+        k = np.arange(1, payment.shape[1] + 1).reshape(1, -1)
+        return BatchSchedule(
+            periods=periods,
+            payment=payment,
+            principal=principal_paid,
+            interest=interest,
+            balance=balance,
+            mask=k <= periods.reshape(-1, 1),
+        )
+
+    principals = np.asarray(principals, dtype=float).reshape(-1, 1)
+    width = int(periods.max()) if periods.size else 0
+    k = np.arange(1, width + 1).reshape(1, -1)
+    n = periods.reshape(-1, 1)
+    mask = k <= n
+
+    payment = level_payment(principals, rates, n)
+    balance = _balances(principals, rates, payment, k)
+    opening = np.concatenate((principals, balance[:, :-1]), axis=1)
+    interest = opening * rates
+    principal_paid = payment - interest
+
+    return BatchSchedule(
+        periods=periods,
+        payment=np.where(mask, payment, 0.0),
+        principal=np.where(mask, principal_paid, 0.0),
+        interest=np.where(mask, interest, 0.0),
+        balance=np.where(mask, balance, 0.0),
+        mask=mask,
+    )
@@ -0,0 +1,195 @@
+"""
+Portfolio analytics for bank personnel.
+
+Totals come from database aggregates. Cash-flow projections are computed for
+all approved loans at once with the batch amortization engine, a chunk of
+loans at a time so memory stays bounded, and bucketed by month. Loans
+re-amortized by prepayments are projected from their own schedules.
+Delinquency is read from the stored installments, the same overdue
+installments ``scan_overdue`` flags loans for. Results are cached for
+``LOAN_ANALYTICS_CACHE_TTL`` seconds.
+"""
+from collections import defaultdict
+from datetime import date
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, FloatField, Max, Sum
+from django.db.models.functions import Cast
+
+from .amortization import DAYS_PER_MONTH, amortize_batch, payment_interval
+from .cache import get_config
+from .installments import overdue_installments
+from .models import CapacityLedger, Loan
+
+ANALYTICS_CACHE_KEY = 'loans:portfolio-analytics'
+
+
+def _money(value):
+    return round(float(value or 0), 2)
+
+
+def _add_at(totals, offsets, weights):
+    """
+    Adds ``weights`` into ``totals`` at ``offsets``, growing ``totals`` as needed.
+    """
+    if offsets.size == 0:
+        return totals
+    bucketed = np.bincount(offsets, weights=weights)
+    if bucketed.size > totals.size:
+        totals = np.pad(totals, (0, bucketed.size - totals.size))
+    totals[:bucketed.size] += bucketed
+    return totals
+
+
+def _project(chunk, compound_frequency, today, this_month, totals):
+    amounts, rates, terms, starts = zip(*chunk)
+    interval = payment_interval(compound_frequency)
+    batch = amortize_batch(amounts, rates, terms, compound_frequency)
+
+    start = np.array([s or today for s in starts], dtype='datetime64[D]').reshape(-1, 1)
+    k = np.arange(1, batch.mask.shape[1] + 1).reshape(1, -1)
+    due = start + k * np.timedelta64(interval * DAYS_PER_MONTH, 'D')
+
+    future = batch.mask & (due > np.datetime64(today, 'D'))
+    offsets = (due[future].astype('datetime64[M]') - this_month).astype(np.int64)
+    totals['principal'] = _add_at(totals['principal'], offsets, batch.principal[future])
+    totals['interest'] = _add_at(totals['interest'], offsets, batch.interest[future])
+
+
+def _project_prepaid(loans, today, this_month, totals):
+    """
+    Like ``_project``, for loans re-amortized by prepayments: their rows are
+    read from each loan's own schedule rather than from its original terms.
+    """
+    due, principal, interest = [], [], []
+    for loan in loans:
+        schedule = loan.current_payment_schedule(get_config(loan.config_id))
+        for row in schedule:
+            if row['due_date'] > today.isoformat():
+                due.append(row['due_date'])
+                principal.append(row['principal_payment'])
+                interest.append(row['interest_payment'])
+
+    offsets = (np.array(due, dtype='datetime64[D]').astype('datetime64[M]') - this_month).astype(np.int64)
+    totals['principal'] = _add_at(totals['principal'], offsets, np.array(principal, dtype=float))
+    totals['interest'] = _add_at(totals['interest'], offsets, np.array(interest, dtype=float))
+
+
+def _delinquency(today):
+    """
+    Returns ``(loans, arrears)`` over the loans with overdue installments. An
+    installment is settled once ``total_paid`` reaches its ``cumulative_due``,
+    so a loan owes that of its latest overdue installment less what it paid.
+    """
+    loans, arrears = 0, 0.0
+    rows = (
+        overdue_installments(as_of=today).order_by().values('loan_id')
+        .annotate(due=Max('cumulative_due'), paid=Max('loan__total_paid')).values_list('due', 'paid')
+    )
+    for due, paid in rows.iterator():
+        loans += 1
+        arrears += float(due - paid)
+    return loans, arrears
+
+
+def portfolio_summary(today=None, chunk_size=5000):
+    """
+    Builds the portfolio report: loan totals per status, fund utilization,
+    delinquency and a month-by-month projection of scheduled cash flows.
+    """
+    today = today or date.today()
+    by_status = {
+        row['status']: {
+            'count': row['count'],
+            'amount': _money(row['amount']),
+            'outstanding': _money(row['outstanding']),
+            'paid': _money(row['paid']),
+        }
+        for row in Loan.objects.order_by().values('status').annotate(
+            count=Count('id'),
+            amount=Sum('amount'),
+            outstanding=Sum('remaining_amount'),
+            paid=Sum('total_paid'),
+        )
+    }
+
+    ledger = CapacityLedger.objects.filter(pk=CapacityLedger.SINGLETON_ID).first()
+    approved_funds = ledger.approved_funds if ledger else 0
+    approved_loans = ledger.approved_loans if ledger else 0
+
+    this_month = np.datetime64(today, 'M')
+    totals = {'principal': np.zeros(0), 'interest': np.zeros(0)}
+    # Money is read as floats: the projection is float math anyway and this
+    # skips building a Decimal per column per row. Loans are batched per
+    # compounding frequency of their product version. Loans with prepayments
+    # no longer follow their original terms and are projected on their own.
+    approved = Loan.objects.filter(status='A', config__isnull=False).order_by()
+    rows = (
+        approved.filter(prepayments=[])
+        .values_list(
+            Cast('amount', FloatField()), Cast('interest_rate', FloatField()), 'term_months',
+            'start_date', 'config__compound_frequency',
+        )
+        .iterator(chunk_size=chunk_size)
+    )
+    chunks = defaultdict(list)
+    for *row, compound_frequency in rows:
+        chunk = chunks[compound_frequency]
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            _project(chunk, compound_frequency, today, this_month, totals)
+            chunk.clear()
+    for compound_frequency, chunk in chunks.items():
+        if chunk:
+            _project(chunk, compound_frequency, today, this_month, totals)
+    prepaid = []
+    for loan in approved.exclude(prepayments=[]).iterator(chunk_size=chunk_size):
+        prepaid.append(loan)
+        if len(prepaid) == chunk_size:
+            _project_prepaid(prepaid, today, this_month, totals)
+            prepaid.clear()
+    if prepaid:
+        _project_prepaid(prepaid, today, this_month, totals)
+
+    cash_flow = []
+    for offset, (principal, interest) in enumerate(zip(totals['principal'], totals['interest'])):
+        if principal or interest:
+            cash_flow.append({
+                'month': str(this_month + offset),
+                'principal': round(float(principal), 2),
+                'interest': round(float(interest), 2),
+                'total': round(float(principal + interest), 2),
+            })
+
+    delinquent, arrears = _delinquency(today)
+    approved_count = by_status.get('A', {}).get('count', 0)
+    return {
+        'as_of': today.isoformat(),
+        'loans': by_status,
+        'outstanding_principal': by_status.get('A', {}).get('outstanding', 0.0),
+        'funds': {
+            'approved': _money(approved_funds),
+            'lent': _money(approved_loans),
+            'available': _money(approved_funds - approved_loans),
+            'utilization': round(float(approved_loans / approved_funds), 4) if approved_funds else None,
+        },
+        'delinquency': {
+            'loans': delinquent,
+            'arrears': round(arrears, 2),
+            'rate': round(delinquent / approved_count, 4) if approved_count else None,
+        },
+        'cash_flow': cash_flow,
+    }
+
+
+def cached_portfolio_summary(refresh=False):
+    """
+    Returns the cached report, rebuilding it when missing or ``refresh`` is set.
+    """
+    summary = None if refresh else cache.get(ANALYTICS_CACHE_KEY)
+    if summary is None:
+        summary = portfolio_summary()
+        cache.set(ANALYTICS_CACHE_KEY, summary, timeout=getattr(settings, 'LOAN_ANALYTICS_CACHE_TTL', 300))
+    return summary
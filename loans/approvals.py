@@ -0,0 +1,117 @@
+"""
+Bulk decisions on the loan and fund approval queues.
+
+A batch is decided in one transaction under the capacity ledger lock:
+capacity is read once and spent on pending loans in priority order (oldest
+request first). A loan that does not fit what is left is skipped, and later,
+smaller loans that still fit are approved (first fit). Each outcome is
+written with a single ``UPDATE ... WHERE id IN``, and the ledger moves by
+the batch total with one ``CapacityLedger.adjust``. Approved loans start on
+the day of the decision; their schedules and installments are stored by a
+background job. ``QuerySet.update`` skips ``save()``, so the ledger
+bookkeeping of ``LedgerTrackedModel`` and the cache-invalidating signals are
+done here by hand.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .emi import recompute_emis
+from .jobs import enqueue
+from .models import CapacityLedger, Loan, LoanFund
+from .response_cache import FUNDS, LOANS, invalidate
+
+APPROVE = 'A'
+REJECT = 'R'
+
+
+def _skipped(pk, message):
+    return {'id': pk, 'status': 'skipped', 'errors': {'status': [message]}}
+
+
+def _decide(model, rows, ids, decision, available=None):
+    """
+    Splits ``rows`` (``(id, status, amount, owner)`` in priority order) into
+    the ids to approve or reject and their results. ``available`` caps the
+    total amount approved. Requested ids without a row are reported missing.
+    """
+    results = {}
+    decided = []
+    total = Decimal('0')
+    for pk, status, amount, _ in rows:
+        if status != 'P':
+            results[pk] = _skipped(pk, "Not pending.")
+        elif decision == APPROVE and available is not None and total + amount > available:
+            results[pk] = _skipped(pk, "Approving this loan exceeds available funds.")
+        else:
+            decided.append(pk)
+            if decision == APPROVE:
+                total += amount
+            results[pk] = {'id': pk, 'status': 'approved' if decision == APPROVE else 'rejected'}
+    if ids is not None:
+        for pk in ids:
+            results.setdefault(pk, _skipped(pk, f"{model._meta.verbose_name.capitalize()} not found."))
+        ordered = [results[pk] for pk in dict.fromkeys(ids)]
+    else:
+        ordered = [results[pk] for pk, *_ in rows]
+    return decided, total, ordered
+
+
+def _rows(model, ids, queryset, limit, owner):
+    """
+    Locks and returns the candidate rows, oldest request first.
+    """
+    if ids is not None:
+        rows = model.objects.filter(pk__in=ids)
+    else:
+        rows = queryset.filter(status='P')
+    rows = rows.select_for_update().order_by('id').values_list('id', 'status', 'amount', owner)
+    return list(rows if limit is None else rows[:limit])
+
+
+def decide_loans(decision, ids=None, queryset=None, limit=None):
+    """
+    Approves or rejects the loans ``ids``, or the first ``limit`` pending
+    loans of ``queryset``. Approvals are first fit, oldest first: a loan larger
+    than the funds still available is skipped and stays pending, and the scan
+    goes on to later loans. Returns one result dict per loan.
+    """
+    with transaction.atomic():
+        ledger = CapacityLedger.lock()
+        rows = _rows(Loan, ids, queryset, limit, 'customer_id')
+        available = ledger.available if decision == APPROVE else None
+        decided, total, results = _decide(Loan, rows, ids, decision, available)
+        if decided:
+            fields = {'status': decision, 'updated_at': timezone.now()}
+            if decision == APPROVE:
+                fields['start_date'] = Coalesce('start_date', Value(timezone.localdate()))
+            Loan.objects.filter(pk__in=decided, status='P').update(**fields)
+            if decision == APPROVE:
+                CapacityLedger.adjust(loans=total)
+                # EMIs are stored on creation; this only fills the ones missing.
+                recompute_emis(Loan.objects.filter(pk__in=decided, emi__isnull=True))
+                enqueue('start_schedules', {'loan_ids': decided})
+            chosen = set(decided)
+            invalidate(LOANS, {customer for pk, _, _, customer in rows if pk in chosen})
+    return results
+
+
+def decide_funds(decision, ids=None, queryset=None, limit=None):
+    """
+    Approves or rejects the loan funds ``ids``, or the first ``limit``
+    pending funds of ``queryset``. Returns one result dict per fund.
+    """
+    with transaction.atomic():
+        CapacityLedger.lock()
+        rows = _rows(LoanFund, ids, queryset, limit, 'provider_id')
+        decided, total, results = _decide(LoanFund, rows, ids, decision)
+        if decided:
+            LoanFund.objects.filter(pk__in=decided, status='P').update(status=decision, updated_at=timezone.now())
+            if decision == APPROVE:
+                CapacityLedger.adjust(funds=total)
+            chosen = set(decided)
+            invalidate(FUNDS, {provider for pk, _, _, provider in rows if pk in chosen})
+    return results
@@ -0,0 +1,166 @@
+"""
+Async-native read endpoints for ASGI deployments.
+
+These mirror LoanListView, LoanFundListView and PaymentScheduleView. Rows are
+read with ``aiterator()``/``aget()`` and list pages are streamed, so a slow
+client never ties up a worker thread. Authentication reuses the DRF
+authentication classes from settings; it runs once per request in a thread.
+Errors go through the DRF exception handler, as on the sync views.
+"""
+import json
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views import View
+from rest_framework.exceptions import APIException, AuthenticationFailed, NotAuthenticated, ValidationError
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.utils.urls import replace_query_param
+
+from .models import Loan
+from .pagination import IdCursorPagination
+from .projection import FieldProjectionMixin
+from .serializers import LoanFundSerializer, LoanSerializer
+from .views import loan_funds_visible_to, loans_visible_to
+
+
+class AsyncAPIView(View):
+    authentication_classes = api_settings.DEFAULT_AUTHENTICATION_CLASSES
+    serializer_class = None
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.authenticators = [auth() for auth in self.authentication_classes]
+
+    def get_serializer_class(self):
+        return self.serializer_class
+
+    def get_serializer(self, *args, **kwargs):
+        return self.get_serializer_class()(*args, **kwargs)
+
+    def filter_queryset(self, queryset):
+        return queryset
+
+    def authenticate(self, request):
+        drf_request = Request(request, authenticators=self.authenticators)
+        drf_request.user  # Resolve the user here, inside the worker thread.
+        return drf_request
+
+    def handle_exception(self, exc, request):
+        """
+        Answers ``exc`` through the configured DRF exception handler, as
+        ``APIView.handle_exception`` does, so errors have the same status and
+        body as on the sync views.
+        """
+        if isinstance(exc, (NotAuthenticated, AuthenticationFailed)):
+            header = self.authenticators[0].authenticate_header(request) if self.authenticators else None
+            if header:
+                exc.auth_header = header
+            else:
+                exc.status_code = 403
+        response = api_settings.EXCEPTION_HANDLER(exc, {'view': self, 'args': self.args, 'kwargs': self.kwargs,
+                                                        'request': request})
+        error = JsonResponse(response.data, status=response.status_code, encoder=JSONEncoder)
+        for name, value in response.items():
+            if name != 'Content-Type':
+                error[name] = value
+        return error
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            self.request = await sync_to_async(self.authenticate)(request)
+            if not self.request.user or not self.request.user.is_authenticated:
+                raise NotAuthenticated()
+            return await super().dispatch(request, *args, **kwargs)
+        except APIException as exc:
+            return self.handle_exception(exc, request)
+
+
+class AsyncListView(FieldProjectionMixin, AsyncAPIView):
+    """
+    Streams one keyset page as ``{"results": [...], "next": url}``.
+
+    Pages are addressed with ``?after=<last id>&page_size=n``. Subclasses
+    set ``visible_to``, the function returning the rows a user may list.
+    """
+    page_size = IdCursorPagination.page_size
+    max_page_size = IdCursorPagination.max_page_size
+    render_chunk_size = 100
+    visible_to = None
+
+    def get_queryset(self):
+        return self.visible_to(self.request.user)
+
+    def _int_param(self, name, default, maximum=None):
+        value = self.request.query_params.get(name)
+        if value is None:
+            return default
+        try:
+            value = int(value)
+        except ValueError:
+            raise ValidationError({name: 'A valid integer is required.'})
+        if value < 0:
+            raise ValidationError({name: 'Must be zero or greater.'})
+        return min(value, maximum) if maximum else value
+
+    def render_rows(self, rows):
+        data = self.get_serializer(rows, many=True).data
+        return ','.join(json.dumps(item, cls=JSONEncoder) for item in data)
+
+    async def stream(self, queryset, size):
+        yield '{"results": ['
+        chunk = []
+        last_id = None
+        count = 0
+        has_more = False
+        separator = ''
+        async for obj in queryset.aiterator(chunk_size=self.render_chunk_size):
+            if count == size:
+                has_more = True
+                break
+            chunk.append(obj)
+            last_id = obj.pk
+            count += 1
+            if len(chunk) == self.render_chunk_size:
+                yield separator + await sync_to_async(self.render_rows)(chunk)
+                separator = ','
+                chunk = []
+        if chunk:
+            yield separator + await sync_to_async(self.render_rows)(chunk)
+
+        next_url = None
+        if has_more:
+            next_url = replace_query_param(self.request.build_absolute_uri(), 'after', last_id)
+        yield '], "next": ' + json.dumps(next_url) + '}'
+
+    async def get(self, request, *args, **kwargs):
+        size = self._int_param('page_size', self.page_size, self.max_page_size) or self.page_size
+        after = self._int_param('after', 0)
+        queryset = self.filter_queryset(self.get_queryset())
+        queryset = queryset.filter(pk__gt=after).order_by('pk')[:size + 1]
+        return StreamingHttpResponse(self.stream(queryset, size), content_type='application/json')
+
+
+class AsyncLoanFundListView(AsyncListView):
+    serializer_class = LoanFundSerializer
+    visible_to = staticmethod(loan_funds_visible_to)
+
+
+class AsyncLoanListView(AsyncListView):
+    serializer_class = LoanSerializer
+    deferred_fields = ('payment_schedule',)
+    visible_to = staticmethod(loans_visible_to)
+
+
+class AsyncPaymentScheduleView(AsyncAPIView):
+
+    async def get(self, request, loan_id, format=None):
+        try:
+            loan = await Loan.objects.aget(id=loan_id)
+        except Loan.DoesNotExist:
+            return JsonResponse({'error': 'Loan not found.'}, status=404)
+        if self.request.user.role == 'LC' and loan.customer_id != self.request.user.id:
+            return JsonResponse({'error': 'Not allowed.'}, status=403)
+        schedule = await sync_to_async(loan.get_payment_schedule)()
+        return JsonResponse({'schedule': schedule})
@@ -0,0 +1,105 @@
+"""
+API-key authentication for integration clients.
+
+Password authentication runs PBKDF2 on every request by design, which is
+far too slow for machine clients. API keys are long random secrets, so one
+SHA-256 comparison verifies them. Each process also remembers keys it has
+already verified for ``LOAN_API_KEY_CACHE_TTL`` seconds, so a repeat request
+authenticates without any database query. Revoking a key or deactivating its
+user evicts it from this process at once. Other processes drop it within
+the TTL.
+"""
+import hashlib
+import hmac
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework import authentication, exceptions
+
+from .models import ApiKey
+
+
+class VerifiedKeyCache:
+    """
+    Bounded LRU of ``sha256(raw key) -> (ApiKey with its user, expiry)``.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, fingerprint):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(fingerprint)
+            if entry is None:
+                return None
+            if entry[1] <= now:
+                del self._entries[fingerprint]
+                return None
+            self._entries.move_to_end(fingerprint)
+            return entry[0]
+
+    def put(self, fingerprint, api_key, ttl):
+        with self._lock:
+            self._entries[fingerprint] = (api_key, time.monotonic() + ttl)
+            self._entries.move_to_end(fingerprint)
+            while len(self._entries) > getattr(settings, 'LOAN_API_KEY_CACHE_SIZE', 10000):
+                self._entries.popitem(last=False)
+
+    def evict(self, key_ids=(), user_id=None):
+        with self._lock:
+            for fingerprint, (api_key, _) in list(self._entries.items()):
+                if api_key.pk in key_ids or api_key.user_id == user_id:
+                    del self._entries[fingerprint]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+verified_keys = VerifiedKeyCache()
+
+
+class ApiKeyAuthentication(authentication.BaseAuthentication):
+    """
+    ``Authorization: Bearer <prefix>.<secret>``.
+    """
+    keyword = 'Bearer'
+
+    def authenticate(self, request):
+        header = authentication.get_authorization_header(request).split()
+        if not header or header[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(header) != 2:
+            raise exceptions.AuthenticationFailed('Invalid API key header.')
+        try:
+            raw = header[1].decode()
+        except UnicodeError:
+            raise exceptions.AuthenticationFailed('Invalid API key header.')
+        return self.authenticate_credentials(raw)
+
+    def authenticate_credentials(self, raw):
+        fingerprint = hashlib.sha256(raw.encode()).hexdigest()
+        api_key = verified_keys.get(fingerprint)
+        if api_key is not None:
+            return api_key.user, api_key
+
+        prefix, _, secret = raw.partition('.')
+        api_key = ApiKey.objects.select_related('user').filter(prefix=prefix).first() if secret else None
+        if api_key is None or not hmac.compare_digest(api_key.digest, ApiKey.hash_secret(secret)):
+            raise exceptions.AuthenticationFailed('Invalid API key.')
+        if not api_key.is_usable() or not api_key.user.is_active:
+            raise exceptions.AuthenticationFailed('API key revoked, expired or its user is inactive.')
+
+        ttl = getattr(settings, 'LOAN_API_KEY_CACHE_TTL', 60)
+        if api_key.expires_at is not None:
+            ttl = min(ttl, (api_key.expires_at - timezone.now()).total_seconds())
+        verified_keys.put(fingerprint, api_key, ttl)
+        return api_key.user, api_key
+
+    def authenticate_header(self, request):
+        return self.keyword
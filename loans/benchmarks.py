@@ -0,0 +1,277 @@
+"""
+Query-count, latency and memory benchmarks for the endpoints in loans/urls.py.
+
+``seed_portfolio`` fills the database with a realistic portfolio using
+``bulk_create`` and ``run_benchmarks`` requests every URL name a number of
+times, recording queries per request, p50/p99 latency and peak memory.
+``compare`` checks the results against the stored baseline in
+``bench_baseline.json``. The ``benchmark`` management command wires these
+together; it works on SQLite as well as on PostgreSQL.
+"""
+import itertools
+import json
+import random
+import time
+import tracemalloc
+import uuid
+from datetime import date, timedelta
+from decimal import Decimal
+from pathlib import Path
+
+import numpy as np
+from asgiref.sync import async_to_sync
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from .emi import recompute_emis
+from .models import CapacityLedger, Loan, LoanConfig, LoanFund, Payment, User
+
+BASELINE_PATH = Path(__file__).resolve().parent / 'bench_baseline.json'
+
+
+class Portfolio:
+    """
+    Handles to the seeded users and rows the scenarios need.
+    """
+
+    def __init__(self, bp, lp, customers, loan_ids):
+        self.bp = bp
+        self.lp = lp
+        self.customers = customers
+        self.loan_ids = loan_ids
+
+
+def seed_portfolio(loans=10000, payments_per_loan=5, customers=100, seed=0, batch_size=5000):
+    """
+    Creates ``loans`` loans spread over ``customers`` customers, with
+    ``payments_per_loan`` payments each, an approved fund pool covering the
+    approved loans and a LoanConfig.
+    """
+    rng = random.Random(seed)
+    bp = User.objects.create_user(username=f'bench-bp-{seed}', password='bench', role='BP')
+    lp = User.objects.create_user(username=f'bench-lp-{seed}', password='bench', role='LP')
+    User.objects.bulk_create(
+        [User(username=f'bench-lc-{seed}-{i}', role='LC') for i in range(customers)],
+        batch_size=batch_size,
+    )
+    customer_ids = list(User.objects.filter(username__startswith=f'bench-lc-{seed}-').values_list('id', flat=True))
+    config = LoanConfig.latest() or LoanConfig.objects.create(
+        min_amount=1000, max_amount=500000, interest_rate=10, duration_months=360, compound_frequency='M',
+    )
+
+    today = date.today()
+    rows = []
+    for _ in range(loans):
+        amount = Decimal(rng.randrange(1000, 500000))
+        paid = Decimal(rng.randrange(0, 100)) * payments_per_loan
+        rows.append(Loan(
+            customer_id=rng.choice(customer_ids),
+            config=config,
+            amount=amount,
+            term_months=rng.choice((12, 24, 36, 60, 120, 240, 360)),
+            interest_rate=Decimal(rng.randrange(100, 2000)) / 100,
+            start_date=today - timedelta(days=rng.randrange(0, 3650)),
+            remaining_amount=amount - paid,
+            total_paid=paid,
+            status='A' if rng.random() < 0.7 else 'P',
+        ))
+    Loan.objects.bulk_create(rows, batch_size=batch_size)
+    recompute_emis(batch_size=batch_size)
+    loan_ids = list(Loan.objects.order_by('id').values_list('id', flat=True))
+
+    payments = []
+    for loan in rows:
+        if not loan.total_paid:
+            continue
+        for _ in range(payments_per_loan):
+            payments.append(Payment(loan_id=loan.pk, amount=loan.total_paid / payments_per_loan,
+                                    reference_number=f'SEED-{uuid.uuid4().hex[:20]}'))
+        if len(payments) >= batch_size:
+            Payment.objects.bulk_create(payments, batch_size=batch_size)
+            payments = []
+    Payment.objects.bulk_create(payments, batch_size=batch_size)
+
+    approved = sum((loan.amount for loan in rows if loan.status == 'A'), Decimal('0'))
+    LoanFund.objects.bulk_create([
+        LoanFund(provider=lp, amount=approved + Decimal('1000000000'), status='A'),
+        *[LoanFund(provider=lp, amount=10000) for _ in range(50)],
+    ])
+    CapacityLedger.rebuild()
+    return Portfolio(bp, lp, customer_ids, loan_ids)
+
+
+class Scenario:
+    """
+    One benchmarked request. ``build`` returns ``(method, path, data, extra)``
+    for the next iteration. Requests are sent as ``user``, or as the seeded
+    bank personnel user when it is None.
+    """
+
+    def __init__(self, name, build, user=None, format='json'):
+        self.name = name
+        self.build = build
+        self.user = user
+        self.format = format
+
+
+def _pending(queryset):
+    ids = iter(queryset.filter(status='P').order_by('id').values_list('id', flat=True))
+    return lambda: next(ids)
+
+
+def scenarios(portfolio):
+    """
+    One scenario per URL name in loans/urls.py.
+    """
+    customer_loan = Loan.objects.select_related('customer').order_by('id').first()
+    customer = customer_loan.customer
+    # Up to 120 installments fit in one INSERT on every backend (SQLite caps
+    # the parameters per statement), so the query count does not depend on
+    # which pending loans the portfolio happens to hold.
+    next_loan = _pending(Loan.objects.filter(term_months__lte=120))
+    next_fund = _pending(LoanFund.objects.all())
+    schedule_loan = portfolio.loan_ids[len(portfolio.loan_ids) // 2]
+
+    def bulk_decision(url_name, model):
+        # Cycles through the pending ids; once decided they come back skipped.
+        ids = itertools.cycle(model.objects.filter(status='P').order_by('-id').values_list('id', flat=True))
+        return lambda: ('post', reverse(url_name), {'ids': list(itertools.islice(ids, 50)), 'status': 'A'}, {})
+
+    def bulk_payments():
+        rows = [{'loan': customer_loan.id, 'amount': '0.01'} for _ in range(100)]
+        return 'post', reverse('payment-bulk-create'), rows, {}
+
+    return [
+        Scenario('sample', lambda: ('get', reverse('sample'), None, {})),
+        Scenario('loanfund-list', lambda: ('get', reverse('loanfund-list'), None, {})),
+        Scenario('loan-list', lambda: ('get', reverse('loan-list'), None, {})),
+        Scenario('loan-origination', lambda: (
+            'post', reverse('loan-origination'), {'amount': '25000', 'term_months': 60}, {}
+        ), user=customer),
+        Scenario('loan-quote', lambda: ('get', reverse('loan-quote'), {
+            'amounts': ','.join(str(5000 * i) for i in range(1, 51)),
+            'terms': ','.join(str(6 * i) for i in range(1, 51)),
+        }, {}), user=customer),
+        Scenario('payment-create', lambda: (
+            'post', reverse('payment-create'), {'loan': customer_loan.id, 'amount': '0.01'}, {}
+        ), user=customer),
+        Scenario('payment-bulk-create', bulk_payments),
+        Scenario('loanconfig-detail', lambda: ('get', reverse('loanconfig-detail'), None, {})),
+        Scenario('loanconfig-list', lambda: ('get', reverse('loanconfig-list'), None, {})),
+        Scenario('loanconfig-product-detail', lambda: (
+            'get', reverse('loanconfig-product-detail', args=[LoanConfig.DEFAULT_PRODUCT]), None, {}
+        )),
+        Scenario('loanapproval-detail', lambda: (
+            'patch', reverse('loanapproval-detail', args=[next_loan()]), {'status': 'A'}, {}
+        )),
+        Scenario('loanfundapproval-detail', lambda: (
+            'patch', reverse('loanfundapproval-detail', args=[next_fund()]), {'status': 'A'}, {}
+        )),
+        Scenario('loanapproval-bulk', bulk_decision('loanapproval-bulk', Loan)),
+        Scenario('loanfundapproval-bulk', bulk_decision('loanfundapproval-bulk', LoanFund)),
+        Scenario('paymentschedule', lambda: ('get', reverse('paymentschedule', args=[schedule_loan]), None, {})),
+        Scenario('export', lambda: ('get', reverse('export', args=['loans']), {'format': 'csv'}, {}), format=None),
+        Scenario('portfolio-analytics', lambda: ('get', reverse('portfolio-analytics'), None, {})),
+        Scenario('metrics', lambda: ('get', reverse('metrics'), None, {}), format=None),
+        Scenario('async-loanfund-list', lambda: ('get', reverse('async-loanfund-list'), None, {}), format=None),
+        Scenario('async-loan-list', lambda: ('get', reverse('async-loan-list'), None, {}), format=None),
+        Scenario('async-paymentschedule', lambda: (
+            'get', reverse('async-paymentschedule', args=[schedule_loan]), None, {}
+        ), format=None),
+    ]
+
+
+def _request(client, scenario):
+    method, path, data, extra = scenario.build()
+    kwargs = dict(extra)
+    if scenario.format:
+        kwargs['format'] = scenario.format
+    response = getattr(client, method)(path, data, **kwargs)
+    if response.status_code >= 400:
+        raise AssertionError(f"{scenario.name} returned {response.status_code}")
+    if getattr(response, 'streaming', False):
+        if response.is_async:
+            async_to_sync(_drain)(response.streaming_content)
+        else:
+            for _ in response.streaming_content:
+                pass
+    return response
+
+
+async def _drain(content):
+    async for _ in content:
+        pass
+
+
+def run_benchmarks(portfolio, iterations=20, names=None):
+    """
+    Runs every scenario ``iterations`` times after one warm-up request and
+    returns ``{url_name: {'queries', 'p50_ms', 'p99_ms', 'peak_kb'}}``.
+    Responses are never served from the response cache, so repeated requests
+    measure the endpoint rather than cache hits.
+    """
+    with override_settings(LOAN_RESPONSE_CACHE=False):
+        return _run(portfolio, iterations, names)
+
+
+def _run(portfolio, iterations, names):
+    results = {}
+    for scenario in scenarios(portfolio):
+        if names and scenario.name not in names:
+            continue
+        client = APIClient()
+        client.force_authenticate(user=scenario.user or portfolio.bp)
+        _request(client, scenario)
+
+        timings = []
+        queries = 0
+        for _ in range(iterations):
+            with CaptureQueriesContext(connection) as ctx:
+                started = time.perf_counter()
+                _request(client, scenario)
+                timings.append((time.perf_counter() - started) * 1000)
+            queries = max(queries, len(ctx.captured_queries))
+
+        tracemalloc.start()
+        try:
+            _request(client, scenario)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        results[scenario.name] = {
+            'queries': queries,
+            'p50_ms': round(float(np.percentile(timings, 50)), 2),
+            'p99_ms': round(float(np.percentile(timings, 99)), 2),
+            'peak_kb': round(peak / 1024, 1),
+        }
+    return results
+
+
+def load_baseline(path=BASELINE_PATH):
+    with open(path) as handle:
+        return json.load(handle)
+
+
+def compare(results, baseline, tolerance=0.25, check_latency=False, check_memory=False):
+    """
+    Returns a list of human-readable regressions. Query counts must not exceed
+    the baseline at all. Latency and memory depend on the machine the baseline
+    was recorded on, so they are only compared when asked for, and may exceed
+    it by ``tolerance``.
+    """
+    regressions = []
+    for name, measured in results.items():
+        expected = baseline.get(name)
+        if expected is None:
+            regressions.append(f"{name}: no baseline recorded")
+            continue
+        if measured['queries'] > expected['queries']:
+            regressions.append(f"{name}: {measured['queries']} queries > baseline {expected['queries']}")
+        if check_latency and measured['p99_ms'] > expected['p99_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p99 {measured['p99_ms']}ms > baseline {expected['p99_ms']}ms")
+        if check_memory and measured['peak_kb'] > expected['peak_kb'] * (1 + tolerance):
+            regressions.append(f"{name}: peak {measured['peak_kb']}KB > baseline {expected['peak_kb']}KB")
+    return regressions
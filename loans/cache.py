@@ -0,0 +1,87 @@
+"""
+Process-local cache of the LoanConfig product catalog.
+
+The latest version of every product is held in memory for
+``LOAN_CONFIG_LOCAL_TTL`` seconds and shared between worker processes through
+Django's cache framework, so listing many loans costs at most one catalog
+lookup instead of one per row. Committing a new or deleted version
+invalidates both layers (see ``loans.signals``), but only this process's copy
+of the first: other workers pick the new version up once their copy expires.
+The shared entry is kept for ``LOAN_CONFIG_CACHE_TTL`` seconds; with a
+per-process cache, where no other worker sees the invalidation, no longer
+than the in-memory copy.
+
+Versions never change once created, so ``get_config`` keeps every version it
+has fetched for the life of the process.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .checks import shared_cache
+
+CONFIG_CACHE_KEY = 'loans:config-catalog'
+
+_MISSING = object()
+_local = {'catalog': _MISSING, 'expires': 0.0}
+_versions = {}
+
+
+def get_catalog():
+    """
+    Returns ``{product: latest LoanConfig version}``.
+    """
+    now = time.monotonic()
+    if _local['catalog'] is not _MISSING and _local['expires'] > now:
+        return _local['catalog']
+
+    catalog = cache.get(CONFIG_CACHE_KEY, _MISSING)
+    if catalog is _MISSING:
+        from loans.models import LoanConfig
+        catalog = {config.product: config for config in LoanConfig.latest_versions()}
+        cache.set(CONFIG_CACHE_KEY, catalog, timeout=_shared_timeout())
+
+    _local['catalog'] = catalog
+    _local['expires'] = now + getattr(settings, 'LOAN_CONFIG_LOCAL_TTL', 5)
+    return catalog
+
+
+def _shared_timeout():
+    if shared_cache():
+        return getattr(settings, 'LOAN_CONFIG_CACHE_TTL', 300)
+    return getattr(settings, 'LOAN_CONFIG_LOCAL_TTL', 5)
+
+
+def get_active_config(product=None):
+    """
+    Returns the latest version of ``product`` (the default product when
+    omitted), or None when it has no version.
+    """
+    if product is None:
+        from loans.models import LoanConfig
+        product = LoanConfig.DEFAULT_PRODUCT
+    return get_catalog().get(product)
+
+
+def get_config(config_id):
+    """
+    Returns the LoanConfig version ``config_id``, or None when it does not exist.
+    """
+    config = _versions.get(config_id)
+    if config is None:
+        from loans.models import LoanConfig
+        config = LoanConfig.objects.filter(pk=config_id).first()
+        if config is not None:
+            _versions[config_id] = config
+    return config
+
+
+def invalidate_config_cache():
+    """
+    Drops the cached catalog in this process and in the shared cache.
+    """
+    _local['catalog'] = _MISSING
+    _local['expires'] = 0.0
+    _versions.clear()
+    cache.delete(CONFIG_CACHE_KEY)
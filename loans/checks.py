@@ -0,0 +1,42 @@
+"""
+System checks for settings that need a cache shared by every worker process.
+"""
+from django.conf import settings
+from django.core.checks import Error, Warning, register
+
+# Backends whose entries live in one process only.
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def shared_cache():
+    """
+    Whether the default cache is shared between worker processes.
+    """
+    return settings.CACHES['default']['BACKEND'] not in PROCESS_LOCAL_CACHES
+
+
+@register()
+def check_response_cache(app_configs, **kwargs):
+    if getattr(settings, 'LOAN_RESPONSE_CACHE', False) and not shared_cache():
+        return [Error(
+            'LOAN_RESPONSE_CACHE needs a cache shared by every worker process.',
+            hint='Set REDIS_URL, or turn LOAN_RESPONSE_CACHE off. With a per-process cache, '
+                 'writes would only invalidate the responses cached by the worker that made them.',
+            id='loans.E001',
+        )]
+    return []
+
+
+@register()
+def check_replica_pins(app_configs, **kwargs):
+    if 'replica' in settings.DATABASES and not shared_cache():
+        return [Warning(
+            'The replica database is not read: it needs a cache shared by every worker process.',
+            hint='Set REDIS_URL. Users are pinned to the primary after they write through the cache, '
+                 'and a per-process cache would let other workers serve them stale replica reads.',
+            id='loans.W001',
+        )]
+    return []
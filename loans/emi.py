@@ -0,0 +1,76 @@
+"""
+Stored EMI maintenance.
+
+``Loan.emi`` is set when a loan is created or approved so listings only read
+a column. Every loan is priced under an immutable product version, so a
+stored EMI only goes stale when the loans behind it are rewritten in bulk, or
+for loans created before any config existed. ``recompute_emis`` rebuilds
+them a chunk of loans at a time with the vectorized formula, one compounding
+frequency at a time, and writes each chunk with ``bulk_update``. The EMI of a
+loan with prepayments follows its re-amortized schedule and is left alone.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db.models import FloatField
+from django.db.models.functions import Cast
+from django.utils import timezone
+
+from .amortization import sophisticated_emi
+from .models import Loan
+from .response_cache import LOANS, invalidate
+
+
+def _write(rows, compound_frequency, batch_size):
+    ids, amounts, rates, terms = zip(*rows)
+    emis = sophisticated_emi(amounts, rates, terms, compound_frequency)
+    now = timezone.now()
+    Loan.objects.bulk_update(
+        [Loan(id=loan_id, emi=Decimal(str(emi)), updated_at=now) for loan_id, emi in zip(ids, emis.tolist())],
+        ['emi', 'updated_at'],
+        batch_size=batch_size,
+    )
+
+
+def attach_unpriced_loans(config):
+    """
+    Attaches the loans created while no config existed to ``config``.
+    Returns the number of loans attached.
+    """
+    count = Loan.objects.filter(config__isnull=True).update(config=config, emi=None, updated_at=timezone.now())
+    if count:
+        invalidate(LOANS)
+    return count
+
+
+def recompute_emis(loans=None, batch_size=2000):
+    """
+    Recomputes ``emi`` for ``loans`` (every loan by default) under the product
+    version each one is attached to. Returns the number of loans written.
+    """
+    if loans is None:
+        loans = Loan.objects.all()
+    rows = (
+        loans.filter(config__isnull=False, prepayments=[]).order_by('id')
+        .values_list(
+            'id', Cast('amount', FloatField()), Cast('interest_rate', FloatField()), 'term_months',
+            'config__compound_frequency',
+        )
+        .iterator(chunk_size=batch_size)
+    )
+    count = 0
+    chunks = defaultdict(list)
+    for *row, compound_frequency in rows:
+        chunk = chunks[compound_frequency]
+        chunk.append(row)
+        if len(chunk) == batch_size:
+            _write(chunk, compound_frequency, batch_size)
+            count += len(chunk)
+            chunk.clear()
+    for compound_frequency, chunk in chunks.items():
+        if chunk:
+            _write(chunk, compound_frequency, batch_size)
+            count += len(chunk)
+    if count:
+        invalidate(LOANS)
+    return count
@@ -0,0 +1,178 @@
+"""
+Installments of approved loans and the overdue scan.
+
+``Loan.payment_schedule`` is a JSON blob no query can look inside, so once a
+loan is approved its schedule is also stored as ``Installment`` rows, rewritten
+whenever the schedule is. Each row carries the ``total_paid`` at which it is
+settled: posting payments marks installments paid with one UPDATE per batch,
+and ``scan_overdue`` reads overdue installments as a range over the partial
+index of unpaid ones, in time proportional to the overdue installments rather
+than to the portfolio.
+"""
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db.models import Count, Min, OuterRef, Q, Subquery
+from django.utils import timezone
+
+from .models import Installment, Loan
+from .response_cache import LOANS, invalidate
+
+
+def build_installments(loan, rows):
+    """
+    Unsaved installments for the schedule ``rows`` of ``loan``, each settled
+    once the loan has been paid the installments up to it. Prepaid principal
+    counts towards every installment still unpaid when it was paid, so a
+    prepayment settles neither earlier overdue installments nor later ones.
+    """
+    prepaid = defaultdict(Decimal)
+    for prepayment in loan.prepayments:
+        prepaid[prepayment.get('unpaid', prepayment['installment'])] += Decimal(prepayment['amount'])
+    installments = []
+    cumulative = Decimal('0')
+    for row in rows:
+        amount = Decimal(str(row['total_installment']))
+        cumulative += prepaid[row['installment']] + amount
+        installments.append(Installment(
+            loan_id=loan.pk,
+            number=row['installment'],
+            due_date=row['due_date'],
+            amount=amount,
+            cumulative_due=cumulative,
+        ))
+    return installments
+
+
+def mark_paid(loan_ids):
+    """
+    Marks paid the unpaid installments of ``loan_ids`` covered by each loan's
+    ``total_paid``, and every installment of a repaid loan.
+    """
+    total_paid = Loan.objects.filter(pk=OuterRef('loan_id')).values('total_paid')
+    return Installment.objects.filter(loan_id__in=loan_ids, status=Installment.DUE).filter(
+        Q(cumulative_due__lte=Subquery(total_paid)) | Q(loan__remaining_amount__lte=0)
+    ).update(status=Installment.PAID, paid_at=timezone.now())
+
+
+def sync_installments(loan, schedule, keep=None):
+    """
+    Replaces the installments of ``loan`` with the rows of ``schedule``.
+
+    After a re-amortization, ``keep`` is the number of leading installments
+    left as they were; those still unpaid only have their settling total
+    moved by the prepayment.
+    """
+    keep = keep or 0
+    rebuilt = build_installments(loan, schedule)
+    installments = Installment.objects.filter(loan_id=loan.pk)
+    installments.filter(number__gt=keep).delete()
+    unpaid = list(installments.filter(number__lte=keep, status=Installment.DUE))
+    for installment in unpaid:
+        installment.cumulative_due = rebuilt[installment.number - 1].cumulative_due
+    Installment.objects.bulk_update(unpaid, ['cumulative_due'])
+    Installment.objects.bulk_create(rebuilt[keep:])
+    mark_paid([loan.pk])
+
+
+def replace_installments(loans, batch_size=1000):
+    """
+    Rewrites the installments of ``loans`` from their stored schedules.
+    """
+    ids = [loan.pk for loan in loans]
+    Installment.objects.filter(loan_id__in=ids).delete()
+    Installment.objects.bulk_create(
+        [installment for loan in loans for installment in build_installments(loan, loan.payment_schedule)],
+        batch_size=batch_size,
+    )
+    mark_paid(ids)
+
+
+def start_schedules(loans, start_date=None, batch_size=1000):
+    """
+    Stores the schedules and installments of newly approved ``loans``.
+
+    Loans without a start date start on ``start_date`` (today by default), so
+    their due dates no longer move with the day the schedule is read. The
+    loans are written with one ``bulk_update`` and their installments with one
+    ``bulk_create``. Returns the number of loans started.
+    """
+    start_date = start_date or timezone.localdate()
+    started = []
+    for loan in loans:
+        config = loan.pricing_config()
+        if config is None:
+            continue
+        loan.start_date = loan.start_date or start_date
+        loan.payment_schedule, loan.emi = loan.build_payment_schedule(config)
+        loan.schedule_key = loan.schedule_cache_key(config)
+        started.append(loan)
+    if started:
+        Loan.objects.bulk_update(started, ['start_date', 'payment_schedule', 'schedule_key', 'emi'], batch_size=batch_size)
+        replace_installments(started, batch_size=batch_size)
+    return len(started)
+
+
+def backfill_installments(batch_size=1000):
+    """
+    Stores installments for approved loans that have none yet, such as loans
+    approved before installments existed. A loan without a start date starts
+    on the day it was created. Returns the number of loans filled in.
+    """
+    count = 0
+    while True:
+        loans = list(
+            Loan.objects.filter(status='A', config__isnull=False, installments__isnull=True).order_by('id')
+            .defer('payment_schedule')[:batch_size]
+        )
+        if not loans:
+            return count
+        for loan in loans:
+            loan.start_date = loan.start_date or timezone.localdate(loan.created_at)
+        count += start_schedules(loans, batch_size=batch_size)
+
+
+def overdue_installments(as_of=None, grace_days=None):
+    """
+    The installments still unpaid ``grace_days`` (``LOAN_OVERDUE_GRACE_DAYS``
+    by default) after they fell due, as of ``as_of`` (today by default).
+    """
+    as_of = as_of or timezone.localdate()
+    if grace_days is None:
+        grace_days = getattr(settings, 'LOAN_OVERDUE_GRACE_DAYS', 0)
+    return Installment.objects.filter(status=Installment.DUE, due_date__lt=as_of - timedelta(days=grace_days))
+
+
+def scan_overdue(as_of=None, grace_days=None, dry_run=False):
+    """
+    Flags as delinquent the loans with an installment unpaid ``grace_days``
+    after it fell due, and clears the flag of loans that caught up.
+
+    Returns ``(delinquent, cured)``: ``{loan_id: (oldest overdue due date,
+    overdue installments)}`` and the list of cleared loan ids.
+    """
+    overdue = overdue_installments(as_of, grace_days)
+    delinquent = {
+        loan_id: (since, count)
+        for loan_id, since, count in overdue.order_by().values('loan_id')
+        .annotate(since=Min('due_date'), count=Count('id')).values_list('loan_id', 'since', 'count')
+    }
+    cured = list(
+        Loan.objects.filter(delinquent_since__isnull=False).exclude(pk__in=overdue.values('loan_id'))
+        .values_list('id', flat=True)
+    )
+    if dry_run:
+        return delinquent, cured
+
+    now = timezone.now()
+    oldest = overdue.filter(loan_id=OuterRef('pk')).order_by('due_date').values('due_date')[:1]
+    flagged = Loan.objects.filter(pk__in=overdue.values('loan_id'), delinquent_since__isnull=True).update(
+        delinquent_since=Subquery(oldest), updated_at=now,
+    )
+    if cured:
+        Loan.objects.filter(pk__in=cured).update(delinquent_since=None, updated_at=now)
+    if flagged or cured:
+        invalidate(LOANS)
+    return delinquent, cured
@@ -0,0 +1,233 @@
+"""
+Database-backed background jobs.
+
+Slow work is queued as ``Job`` rows with ``enqueue`` and picked up by the
+worker processes started with ``manage.py runworker``; no broker is needed.
+A worker claims a job with a conditional UPDATE, so two workers never claim
+the same job, and a failed job is retried with exponential backoff until it
+runs out of attempts. While a job runs, a heartbeat thread refreshes its
+``locked_at`` every ``LOAN_JOB_HEARTBEAT`` seconds; a job whose worker has
+not beaten for ``LOAN_JOB_TIMEOUT`` seconds (it crashed, or hung) is
+requeued, however long the job itself takes. A worker that was only stalled
+may then still finish its copy, so every task is written to be safe to run
+twice, and a worker only records the outcome of a job it still holds.
+"""
+import logging
+import os
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .emi import attach_unpriced_loans, recompute_emis
+from .installments import scan_overdue, start_schedules
+from .models import CapacityLedger, Job, Loan, LoanConfig
+from .payments import reconcile_balances
+from .schedules import regenerate_schedules
+
+logger = logging.getLogger(__name__)
+
+TASKS = {}
+
+
+def task(name):
+    """
+    Registers the decorated function as the job task ``name``. The job
+    payload is passed as keyword arguments.
+    """
+    def register(func):
+        TASKS[name] = func
+        return func
+    return register
+
+
+def enqueue(name, payload=None, delay=0, max_attempts=None, coalesce=False):
+    """
+    Queues task ``name``. With ``coalesce`` an identical job that is still
+    waiting to run is returned instead of queueing a second one.
+    """
+    if name not in TASKS:
+        raise KeyError(f"Unknown job task '{name}'.")
+    payload = payload or {}
+    if coalesce:
+        waiting = Job.objects.filter(task=name, payload=payload, status=Job.QUEUED).order_by('id').first()
+        if waiting:
+            return waiting
+    return Job.objects.create(
+        task=name,
+        payload=payload,
+        run_after=timezone.now() + timedelta(seconds=delay),
+        max_attempts=max_attempts or getattr(settings, 'LOAN_JOB_MAX_ATTEMPTS', 5),
+    )
+
+
+def retry_delay(attempts):
+    """
+    Seconds to wait before attempt ``attempts + 1``: doubles each time, capped.
+    """
+    base = getattr(settings, 'LOAN_JOB_BACKOFF', 5)
+    return min(base * 2 ** (attempts - 1), getattr(settings, 'LOAN_JOB_BACKOFF_MAX', 3600))
+
+
+@contextmanager
+def heartbeat(job):
+    """
+    Refreshes ``locked_at`` of the running ``job`` from a background thread
+    every ``LOAN_JOB_HEARTBEAT`` seconds until the block exits.
+    """
+    stop = threading.Event()
+    interval = getattr(settings, 'LOAN_JOB_HEARTBEAT', 30)
+
+    def beat():
+        try:
+            while not stop.wait(interval):
+                Job.objects.filter(pk=job.pk, status=Job.RUNNING, locked_by=job.locked_by).update(
+                    locked_at=timezone.now(),
+                )
+        except Exception:
+            logger.exception("Heartbeat of job %s #%s stopped", job.task, job.pk)
+        finally:
+            # The thread's own connection.
+            connections.close_all()
+
+    thread = threading.Thread(target=beat, name=f'job-{job.pk}-heartbeat', daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def release_stale():
+    """
+    Requeues jobs whose worker has not beaten for ``LOAN_JOB_TIMEOUT``.
+    """
+    cutoff = timezone.now() - timedelta(seconds=getattr(settings, 'LOAN_JOB_TIMEOUT', 600))
+    return Job.objects.filter(status=Job.RUNNING, locked_at__lt=cutoff).update(
+        status=Job.QUEUED, locked_by='', locked_at=None,
+    )
+
+
+def claim(worker, candidates=10):
+    """
+    Marks the next ready job as running for ``worker`` and returns it, or
+    None when nothing is ready.
+    """
+    now = timezone.now()
+    ready = Job.objects.filter(status=Job.QUEUED, run_after__lte=now).order_by('run_after', 'id')
+    for job_id in ready.values_list('id', flat=True)[:candidates]:
+        claimed = Job.objects.filter(pk=job_id, status=Job.QUEUED).update(
+            status=Job.RUNNING, locked_by=worker, locked_at=now, attempts=F('attempts') + 1,
+        )
+        if claimed:
+            return Job.objects.get(pk=job_id)
+    return None
+
+
+def run(job):
+    """
+    Runs a claimed job, recording success, a scheduled retry or the final
+    failure, unless the job was requeued from under this worker meanwhile.
+    """
+    worker = job.locked_by
+    try:
+        with heartbeat(job), transaction.atomic():
+            TASKS[job.task](**job.payload)
+    except Exception:
+        job.last_error = traceback.format_exc()
+        if job.attempts >= job.max_attempts:
+            job.status = Job.FAILED
+            job.finished_at = timezone.now()
+            logger.error("Job %s #%s failed after %s attempts", job.task, job.pk, job.attempts)
+        else:
+            job.status = Job.QUEUED
+            job.run_after = timezone.now() + timedelta(seconds=retry_delay(job.attempts))
+            logger.warning("Job %s #%s failed, retrying at %s", job.task, job.pk, job.run_after)
+    else:
+        job.status = Job.DONE
+        job.finished_at = timezone.now()
+    job.locked_by = ''
+    job.locked_at = None
+    fields = ['status', 'run_after', 'last_error', 'finished_at', 'locked_by', 'locked_at']
+    Job.objects.filter(pk=job.pk, status=Job.RUNNING, locked_by=worker).update(
+        **{field: getattr(job, field) for field in fields}
+    )
+    return job
+
+
+def run_pending(worker='inline', limit=None):
+    """
+    Runs ready jobs in this process until none is left (or ``limit`` ran).
+    Returns the jobs that ran.
+    """
+    done = []
+    while limit is None or len(done) < limit:
+        job = claim(worker)
+        if job is None:
+            break
+        done.append(run(job))
+    return done
+
+
+def work(worker=None, poll_interval=1.0, stop=None):
+    """
+    Worker loop: runs ready jobs, sleeping ``poll_interval`` seconds whenever
+    the queue is empty, until ``stop()`` returns true.
+    """
+    worker = worker or f'{os.uname().nodename}:{os.getpid()}'
+    while not (stop and stop()):
+        close_old_connections()
+        job = claim(worker)
+        if job is None:
+            release_stale()
+            time.sleep(poll_interval)
+            continue
+        run(job)
+
+
+@task('price_unpriced_loans')
+def price_unpriced_loans_task(batch_size=2000):
+    # Read from the database: this process's cached catalog may predate the
+    # version that queued the job.
+    config = LoanConfig.latest()
+    if config is not None and attach_unpriced_loans(config):
+        recompute_emis(Loan.objects.filter(emi__isnull=True), batch_size=batch_size)
+
+
+@task('start_schedules')
+def start_schedules_task(loan_ids, batch_size=1000):
+    for start in range(0, len(loan_ids), batch_size):
+        loans = Loan.objects.filter(pk__in=loan_ids[start:start + batch_size], status='A').defer('payment_schedule')
+        start_schedules(list(loans), batch_size=batch_size)
+
+
+@task('recompute_emis')
+def recompute_emis_task(batch_size=2000):
+    recompute_emis(batch_size=batch_size)
+
+
+@task('regenerate_schedules')
+def regenerate_schedules_task(batch_size=1000):
+    regenerate_schedules(batch_size=batch_size)
+
+
+@task('reconcile_balances')
+def reconcile_balances_task(batch_size=1000):
+    reconcile_balances(batch_size=batch_size)
+
+
+@task('rebuild_capacity_ledger')
+def rebuild_capacity_ledger_task():
+    CapacityLedger.rebuild()
+
+
+@task('scan_overdue')
+def scan_overdue_task(grace_days=None):
+    scan_overdue(grace_days=grace_days)
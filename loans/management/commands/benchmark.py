@@ -0,0 +1,66 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+
+from loans.benchmarks import BASELINE_PATH, compare, load_baseline, run_benchmarks, seed_portfolio
+
+
+class Command(BaseCommand):
+    help = (
+        "Seeds a throwaway test database and measures queries, p50/p99 latency and "
+        "peak memory per URL name, failing when the stored baseline query counts are "
+        "exceeded, and optionally its latency and memory."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loans', type=int, default=10000)
+        parser.add_argument('--payments-per-loan', type=int, default=5)
+        parser.add_argument('--customers', type=int, default=100)
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--only', nargs='*', help='URL names to benchmark.')
+        parser.add_argument('--baseline', default=str(BASELINE_PATH))
+        parser.add_argument('--check-latency', action='store_true',
+                            help='Also fail when p99 latency exceeds the baseline. Only meaningful against a '
+                                 'baseline recorded on the same machine.')
+        parser.add_argument('--check-memory', action='store_true',
+                            help='Also fail when peak memory exceeds the baseline.')
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help='Allowed relative excess over the baseline latency and memory (default 0.25).')
+        parser.add_argument('--update-baseline', action='store_true', help='Store these results as the new baseline.')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False, aliases={'default'})
+        try:
+            self.stdout.write(f"Seeding {options['loans']} loans...")
+            portfolio = seed_portfolio(
+                loans=options['loans'],
+                payments_per_loan=options['payments_per_loan'],
+                customers=options['customers'],
+            )
+            results = run_benchmarks(portfolio, iterations=options['iterations'], names=options['only'])
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+
+        self.stdout.write(f"{'url name':<26}{'queries':>8}{'p50 ms':>10}{'p99 ms':>10}{'peak KB':>10}")
+        for name, measured in results.items():
+            self.stdout.write(
+                f"{name:<26}{measured['queries']:>8}{measured['p50_ms']:>10}{measured['p99_ms']:>10}{measured['peak_kb']:>10}"
+            )
+
+        if options['update_baseline']:
+            with open(options['baseline'], 'w') as handle:
+                json.dump(results, handle, indent=2, sort_keys=True)
+                handle.write('\n')
+            self.stdout.write(self.style.SUCCESS(f"Baseline written to {options['baseline']}."))
+            return
+
+        regressions = compare(
+            results, load_baseline(options['baseline']), tolerance=options['tolerance'],
+            check_latency=options['check_latency'], check_memory=options['check_memory'],
+        )
+        if regressions:
+            raise CommandError("Benchmark regressions:\n" + "\n".join(regressions))
+        self.stdout.write(self.style.SUCCESS("All endpoints within baseline."))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from loans.models import ApiKey, User
+
+
+class Command(BaseCommand):
+    help = "Issues an API key for a user and prints it once."
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('--name', default='', help='Label to tell keys apart, e.g. the client system.')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f"User '{options['username']}' does not exist.")
+        api_key, raw = ApiKey.issue(user, name=options['name'])
+        self.stdout.write(raw)
+        self.stderr.write(f"Key {api_key.prefix} issued to {user.username}. It will not be shown again.")
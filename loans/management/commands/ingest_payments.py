@@ -0,0 +1,52 @@
+import json
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+
+from loans.parsers import read_csv, read_ndjson
+from loans.payments import ingest_payments
+
+READERS = {
+    'csv': read_csv,
+    'ndjson': read_ndjson,
+}
+
+
+class Command(BaseCommand):
+    help = "Posts a CSV or NDJSON settlement file of payments in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or NDJSON file with loan, amount and reference_number columns.')
+        parser.add_argument('--format', choices=sorted(READERS), help='Defaults to the file extension.')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows posted per transaction.')
+        parser.add_argument('--report', help='Write the per-row results to this NDJSON file.')
+
+    def handle(self, *args, **options):
+        fmt = options['format'] or options['path'].rsplit('.', 1)[-1].lower()
+        if fmt not in READERS:
+            raise CommandError(f"Unknown format '{fmt}'. Use --format csv or --format ndjson.")
+
+        created = rejected = 0
+        report = open(options['report'], 'w') if options['report'] else None
+        try:
+            with open(options['path'], 'rb') as stream:
+                rows = READERS[fmt](stream)
+                offset = 0
+                while True:
+                    batch = list(islice(rows, options['batch_size']))
+                    if not batch:
+                        break
+                    for result in ingest_payments(batch):
+                        result['row'] += offset
+                        if result['status'] == 'created':
+                            created += 1
+                        else:
+                            rejected += 1
+                        if report:
+                            report.write(json.dumps(result, default=str) + '\n')
+                    offset += len(batch)
+        finally:
+            if report:
+                report.close()
+
+        self.stdout.write(self.style.SUCCESS(f"Created {created} payments, rejected {rejected}."))
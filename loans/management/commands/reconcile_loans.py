@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from loans.payments import reconcile_balances
+
+
+class Command(BaseCommand):
+    help = "Recomputes Loan.total_paid and remaining_amount for every loan from the payments table."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report drift without writing.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        corrections = reconcile_balances(dry_run=options['dry_run'], batch_size=options['batch_size'])
+        for loan_id, field, old, new in corrections:
+            self.stdout.write(f"Loan {loan_id}: {field} {old} -> {new}")
+        verb = 'Found' if options['dry_run'] else 'Corrected'
+        loans = len({loan_id for loan_id, *_ in corrections})
+        self.stdout.write(self.style.SUCCESS(f"{verb} {loans} loans."))
@@ -0,0 +1,67 @@
+import multiprocessing
+import os
+import signal
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from loans.jobs import release_stale, run_pending, work
+
+
+def _serve(number, poll_interval, stopping):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    work(
+        worker=f'{os.uname().nodename}:{os.getpid()}:{number}',
+        poll_interval=poll_interval,
+        stop=stopping.is_set,
+    )
+
+
+class Command(BaseCommand):
+    help = "Runs queued background jobs with a pool of worker processes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=os.cpu_count() or 1,
+                            help='Worker processes to start. Defaults to the number of CPUs.')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds an idle worker waits before checking the queue again.')
+        parser.add_argument('--once', action='store_true',
+                            help='Run every ready job in this process and exit.')
+
+    def handle(self, *args, **options):
+        release_stale()
+        if options['once']:
+            jobs = run_pending()
+            failed = sum(1 for job in jobs if job.status != job.DONE)
+            self.stdout.write(self.style.SUCCESS(f"Ran {len(jobs)} jobs, {failed} not done."))
+            return
+
+        # Children must open their own database connections.
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        stopping = context.Event()
+
+        def start(number):
+            process = context.Process(target=_serve, args=(number, options['poll_interval'], stopping), daemon=True)
+            process.start()
+            return process
+
+        workers = [start(number) for number in range(options['processes'])]
+        self.stdout.write(f"Started {len(workers)} workers. Press CTRL-C to stop.")
+
+        # SIGTERM stops the pool like CTRL-C does.
+        signal.signal(signal.SIGTERM, signal.default_int_handler)
+        try:
+            while not stopping.is_set():
+                for number, process in enumerate(workers):
+                    if not process.is_alive():
+                        self.stderr.write(f"Worker {number} exited with {process.exitcode}; restarting.")
+                        workers[number] = start(number)
+                stopping.wait(1.0)
+        except KeyboardInterrupt:
+            pass
+        stopping.set()
+        # Workers finish the job they are running before exiting.
+        for process in workers:
+            process.join()
+        self.stdout.write(self.style.SUCCESS("Workers stopped."))
@@ -0,0 +1,35 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from loans.installments import backfill_installments, scan_overdue
+
+
+class Command(BaseCommand):
+    help = "Flags loans with overdue installments as delinquent and clears loans that caught up."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--as-of', help='Scan as of this date (YYYY-MM-DD). Defaults to today.')
+        parser.add_argument('--grace-days', type=int, help='Defaults to LOAN_OVERDUE_GRACE_DAYS.')
+        parser.add_argument('--dry-run', action='store_true', help='Report delinquent loans without flagging them.')
+        parser.add_argument('--backfill', action='store_true', help='First store installments for approved loans that have none.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        try:
+            as_of = date.fromisoformat(options['as_of']) if options['as_of'] else None
+        except ValueError:
+            raise CommandError(f"Invalid date '{options['as_of']}'. Use YYYY-MM-DD.")
+
+        if options['backfill'] and not options['dry_run']:
+            count = backfill_installments(batch_size=options['batch_size'])
+            self.stdout.write(f"Stored installments for {count} loans.")
+
+        with transaction.atomic():
+            delinquent, cured = scan_overdue(as_of=as_of, grace_days=options['grace_days'], dry_run=options['dry_run'])
+        for loan_id, (since, count) in sorted(delinquent.items()):
+            self.stdout.write(f"Loan {loan_id}: {count} overdue installments since {since}")
+        for loan_id in cured:
+            self.stdout.write(f"Loan {loan_id}: no longer delinquent")
+        self.stdout.write(self.style.SUCCESS(f"Found {len(delinquent)} delinquent loans, cleared {len(cured)}."))
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.7 on 2026-10-17 23:00
+
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def build_ledger(apps, schema_editor):
+    CapacityLedger = apps.get_model('loans', 'CapacityLedger')
+    LoanFund = apps.get_model('loans', 'LoanFund')
+    Loan = apps.get_model('loans', 'Loan')
+    CapacityLedger.objects.update_or_create(pk=1, defaults={
+        'approved_funds': LoanFund.objects.filter(status='A').aggregate(total=Sum('amount'))['total'] or 0,
+        'approved_loans': Loan.objects.filter(status='A').aggregate(total=Sum('amount'))['total'] or 0,
+    })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loans', '0002_loan_schedule_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CapacityLedger',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('approved_funds', models.DecimalField(decimal_places=2, default=0, max_digits=17)),
+                ('approved_loans', models.DecimalField(decimal_places=2, default=0, max_digits=17)),
+            ],
+        ),
+        migrations.RunPython(build_ledger, migrations.RunPython.noop),
+    ]
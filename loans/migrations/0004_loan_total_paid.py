@@ -0,0 +1,28 @@
+# Generated by Django 4.2.7 on 2026-10-17 23:03
+
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def fill_total_paid(apps, schema_editor):
+    Loan = apps.get_model('loans', 'Loan')
+    Payment = apps.get_model('loans', 'Payment')
+    totals = Payment.objects.order_by().values_list('loan').annotate(total=Sum('amount'))
+    for loan_id, total in totals.iterator():
+        Loan.objects.filter(pk=loan_id).update(total_paid=total)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loans', '0003_capacity_ledger'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='loan',
+            name='total_paid',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=15),
+        ),
+        migrations.RunPython(fill_total_paid, migrations.RunPython.noop),
+    ]
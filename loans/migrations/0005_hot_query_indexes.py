@@ -0,0 +1,41 @@
+# Generated by Django 4.2.7 on 2026-10-17 23:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loans', '0004_loan_total_paid'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='loan',
+            index=models.Index(fields=['status'], name='loan_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='loan',
+            index=models.Index(fields=['customer', 'status'], name='loan_customer_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='loan',
+            index=models.Index(condition=models.Q(('status', 'A')), fields=['amount'], name='loan_approved_amount_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='loanfund',
+            index=models.Index(fields=['status'], name='loanfund_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='loanfund',
+            index=models.Index(fields=['provider', 'status'], name='loanfund_provider_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='loanfund',
+            index=models.Index(condition=models.Q(('status', 'A')), fields=['amount'], name='loanfund_approved_amount_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['loan', 'payment_date'], name='payment_loan_date_idx'),
+        ),
+    ]
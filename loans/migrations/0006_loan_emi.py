@@ -0,0 +1,54 @@
+# Generated by Django 4.2.7 on 2026-10-17 23:40
+
+from decimal import Decimal
+
+import numpy as np
+from django.db import migrations, models
+
+# Frozen copy of loans.amortization.sophisticated_emi as of this migration, so
+# later changes to the engine do not change what it writes.
+COMPOUND_PERIODS_PER_YEAR = {'M': 12, 'Q': 4, 'A': 1}
+
+
+def emi(principal, annual_rate, term_months, compound_frequency):
+    rate = (float(annual_rate) / 100) / COMPOUND_PERIODS_PER_YEAR.get(compound_frequency, 12)
+    if rate == 0:
+        payment = float(principal) / float(term_months)
+    else:
+        growth = np.power(1 + rate, float(term_months))
+        payment = float(principal) * rate * growth / (growth - 1)
+    return Decimal(str(float(np.round(payment, 2))))
+
+
+def fill_emi(apps, schema_editor):
+    Loan = apps.get_model('loans', 'Loan')
+    LoanConfig = apps.get_model('loans', 'LoanConfig')
+    config = LoanConfig.objects.first()
+    if config is None:
+        return
+    batch_size = 2000
+    stale = []
+    for loan in Loan.objects.only('id', 'amount', 'interest_rate', 'term_months').iterator(chunk_size=batch_size):
+        loan.emi = emi(loan.amount, loan.interest_rate, loan.term_months, config.compound_frequency)
+        stale.append(loan)
+        if len(stale) == batch_size:
+            Loan.objects.bulk_update(stale, ['emi'])
+            stale = []
+    if stale:
+        Loan.objects.bulk_update(stale, ['emi'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loans', '0005_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='loan',
+            name='emi',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=15, null=True),
+        ),
+        migrations.RunPython(fill_emi, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 4.2.7 on 2026-10-18 00:20
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def number_versions(apps, schema_editor):
+    LoanConfig = apps.get_model('loans', 'LoanConfig')
+    # Every existing config becomes a version of the default product. The row
+    # that was in use, the lowest pk (LoanConfig.objects.first()), becomes the
+    # current version; the others come before it, in creation order.
+    configs = list(LoanConfig.objects.order_by('id'))
+    if not configs:
+        return
+    active, others = configs[0], configs[1:]
+    for version, config in enumerate([*others, active], start=1):
+        config.version = version
+        config.save(update_fields=['version'])
+
+
+def attach_loans(apps, schema_editor):
+    Loan = apps.get_model('loans', 'Loan')
+    LoanConfig = apps.get_model('loans', 'LoanConfig')
+    # Loans were priced with the config in use, the lowest pk.
+    config = LoanConfig.objects.order_by('id').first()
+    if config is not None:
+        Loan.objects.filter(config__isnull=True).update(config=config)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loans', '0009_loan_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='loanconfig',
+            name='product',
+            field=models.CharField(default='standard', max_length=50),
+        ),
+        migrations.AddField(
+            model_name='loanconfig',
+            name='version',
+            field=models.PositiveIntegerField(default=1, editable=False),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='loanconfig',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='loan',
+            name='config',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='loans', to='loans.loanconfig'),
+        ),
+        migrations.RunPython(number_versions, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='loanconfig',
+            constraint=models.UniqueConstraint(fields=('product', 'version'), name='loanconfig_product_version_uniq'),
+        ),
+        migrations.RunPython(attach_loans, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 4.2.7 on 2026-10-18 01:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loans', '0010_loanconfig_versions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Installment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.PositiveIntegerField()),
+                ('due_date', models.DateField()),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=15)),
+                ('cumulative_due', models.DecimalField(decimal_places=2, max_digits=17)),
+                ('status', models.CharField(choices=[('D', 'Due'), ('P', 'Paid')], default='D', max_length=1)),
+                ('paid_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='loan',
+            name='delinquent_since',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='loan',
+            index=models.Index(condition=models.Q(('delinquent_since__isnull', False)), fields=['delinquent_since'], name='loan_delinquent_idx'),
+        ),
+        migrations.AddField(
+            model_name='installment',
+            name='loan',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='installments', to='loans.loan'),
+        ),
+        migrations.AddIndex(
+            model_name='installment',
+            index=models.Index(condition=models.Q(('status', 'D')), fields=['due_date', 'status'], name='installment_due_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='installment',
+            constraint=models.UniqueConstraint(fields=('loan', 'number'), name='installment_loan_number_uniq'),
+        ),
+    ]
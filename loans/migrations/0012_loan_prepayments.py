@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 09:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loans', '0011_installments'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='loan',
+            name='prepayments',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
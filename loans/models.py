@@ -1,11 +1,29 @@
-from django.db import models
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, models, transaction
+from django.db.models import F, Max, OuterRef, Q, Subquery, Sum
+from django.utils import timezone
 from django.contrib.auth.models import AbstractUser, Group, Permission
 from django.core.validators import MinValueValidator
 import numpy_financial as npf
-import math
-from datetime import date, timedelta
-import numpy_financial as npf
-from django.db import models
+import hashlib
+import json
+import secrets
+from datetime import date
+from decimal import Decimal
+
+from .amortization import amortize, reamortize, sophisticated_emi
+from .profiling import profiled
+
+
+def exact_amortization():
+    """
+    Whether schedules are built in integer cents (``LOAN_EXACT_AMORTIZATION``).
+    """
+    return getattr(settings, 'LOAN_EXACT_AMORTIZATION', False)
+
+
+CENT = Decimal('0.01')
+
 
 class User(AbstractUser):
     ROLES = (
@@ -30,37 +48,234 @@ class User(AbstractUser):
         verbose_name='user permissions'
     )
 
-class LoanFund(models.Model):
+class CapacityLedger(models.Model):
+    """
+    Running totals of approved fund and approved loan amounts, kept in a
+    single row so approvals check capacity in O(1) instead of aggregating.
+    """
+    SINGLETON_ID = 1
+
+    approved_funds = models.DecimalField(max_digits=17, decimal_places=2, default=0)
+    approved_loans = models.DecimalField(max_digits=17, decimal_places=2, default=0)
+
+    @property
+    def available(self):
+        return self.approved_funds - self.approved_loans
+
+    @classmethod
+    def lock(cls):
+        """
+        Returns the ledger row locked with SELECT ... FOR UPDATE.
+        Must be called inside a transaction.
+        """
+        ledger, _ = cls.objects.select_for_update().get_or_create(pk=cls.SINGLETON_ID)
+        return ledger
+
+    @classmethod
+    def adjust(cls, funds=0, loans=0):
+        """
+        Atomically adds the given deltas to the running totals.
+        """
+        updated = cls.objects.filter(pk=cls.SINGLETON_ID).update(
+            approved_funds=F('approved_funds') + funds,
+            approved_loans=F('approved_loans') + loans,
+        )
+        if not updated:
+            cls.objects.get_or_create(pk=cls.SINGLETON_ID)
+            cls.adjust(funds=funds, loans=loans)
+
+    @classmethod
+    def rebuild(cls):
+        """
+        Recomputes both totals from the approved rows.
+        """
+        funds = LoanFund.objects.filter(status='A').aggregate(total=Sum('amount'))['total'] or 0
+        loans = Loan.objects.filter(status='A').aggregate(total=Sum('amount'))['total'] or 0
+        cls.objects.update_or_create(pk=cls.SINGLETON_ID, defaults={'approved_funds': funds, 'approved_loans': loans})
+
+
+class LedgerTrackedModel(models.Model):
+    """
+    Keeps CapacityLedger in step with the approved ``amount`` of a model.
+
+    ``ledger_field`` names the keyword accepted by ``CapacityLedger.adjust``.
+    A save that may change status or amount locks the ledger, then re-reads
+    the stored row with SELECT ... FOR UPDATE, so the delta is taken against
+    what is actually stored: two concurrent approvals of the same row, or two
+    saves from stale instances, move the ledger once.
+    """
+    ledger_field = None
+
+    class Meta:
+        abstract = True
+
+    def ledger_amount(self):
+        return self.amount if self.status == 'A' else Decimal('0')
+
+    def _locked_ledger_amount(self):
+        """
+        The amount the stored row has on the ledger. Must be called inside a
+        transaction; locks the ledger and the row.
+        """
+        if self._state.adding:
+            return Decimal('0')
+        CapacityLedger.lock()
+        stored = type(self).objects.select_for_update().filter(pk=self.pk).values_list('status', 'amount').first()
+        if stored is None:
+            return Decimal('0')
+        return stored[1] if stored[0] == 'A' else Decimal('0')
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and not {'status', 'amount'} & set(update_fields):
+            return super().save(*args, **kwargs)
+
+        with transaction.atomic():
+            previous = self._locked_ledger_amount()
+            super().save(*args, **kwargs)
+            current = Decimal(self.ledger_amount())
+            if current != previous:
+                CapacityLedger.adjust(**{self.ledger_field: current - previous})
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            previous = self._locked_ledger_amount()
+            result = super().delete(*args, **kwargs)
+            if previous:
+                CapacityLedger.adjust(**{self.ledger_field: -previous})
+        return result
+
+
+class LoanFund(LedgerTrackedModel):
+    ledger_field = 'funds'
+
+
     provider = models.ForeignKey(User, on_delete=models.PROTECT)
     amount = models.DecimalField(max_digits=15, decimal_places=2, validators=[MinValueValidator(1000)])
     status = models.CharField(max_length=1, choices=[('P', 'Pending'), ('A', 'Approved'), ('R', 'Rejected')], default='P')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['status'], name='loanfund_status_idx'),
+            models.Index(fields=['provider', 'status'], name='loanfund_provider_status_idx'),
+            # Covers SUM(amount) over approved funds.
+            models.Index(fields=['amount'], condition=Q(status='A'), name='loanfund_approved_amount_idx'),
+        ]
+
 class LoanConfig(models.Model):
+    """
+    One version of a loan product. Versions are immutable: editing a product
+    publishes its next version with ``revise``, and loans keep the version
+    they were priced under.
+    """
+    DEFAULT_PRODUCT = 'standard'
+
+    product = models.CharField(max_length=50, default=DEFAULT_PRODUCT)
+    # Numbered from 1 per product on creation.
+    version = models.PositiveIntegerField(editable=False)
     min_amount = models.DecimalField(max_digits=15, decimal_places=2)
     max_amount = models.DecimalField(max_digits=15, decimal_places=2)
     interest_rate = models.DecimalField(max_digits=5, decimal_places=2)
     duration_months = models.IntegerField()
     compound_frequency = models.CharField(max_length=10, choices=[('M', 'Monthly'), ('Q', 'Quarterly'), ('A', 'Annually')], default='M')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            # Its index also serves the latest-version lookup of a product.
+            models.UniqueConstraint(fields=['product', 'version'], name='loanconfig_product_version_uniq'),
+        ]
+
+    def __str__(self):
+        return f'{self.product} v{self.version}'
+
+    @classmethod
+    def latest(cls, product=DEFAULT_PRODUCT):
+        return cls.objects.filter(product=product).order_by('-version').first()
+
+    @classmethod
+    def latest_versions(cls):
+        """
+        The current version of every product.
+        """
+        newest = cls.objects.filter(product=OuterRef('product')).order_by('-version').values('pk')[:1]
+        return cls.objects.filter(pk=Subquery(newest))
 
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError("Loan config versions are immutable; publish a new one with revise().")
+        if self.version is None:
+            last = LoanConfig.objects.filter(product=self.product).aggregate(last=Max('version'))['last']
+            self.version = (last or 0) + 1
+        super().save(*args, **kwargs)
 
+    def revise(self, **changes):
+        """
+        Publishes the next version of this product with ``changes`` applied.
+        """
+        fields = {
+            field.name: getattr(self, field.name)
+            for field in self._meta.concrete_fields
+            if field.name not in ('id', 'version', 'created_at')
+        }
+        fields.update(changes, product=self.product)
+        return LoanConfig.objects.create(**fields)
+
+
+
+class Loan(LedgerTrackedModel):
+    ledger_field = 'loans'
+
+    # How a prepayment reshapes the rest of the schedule.
+    REDUCE_EMI = 'reduce_emi'
+    REDUCE_TERM = 'reduce_term'
+    PREPAYMENT_OPTIONS = [(REDUCE_EMI, 'Reduce EMI'), (REDUCE_TERM, 'Reduce term')]
 
-class Loan(models.Model):
     customer = models.ForeignKey('loans.User', on_delete=models.PROTECT)
+    # The product version the loan was priced under. Null only for loans
+    # created while no config existed; they are attached to the first one.
+    config = models.ForeignKey(LoanConfig, on_delete=models.PROTECT, null=True, blank=True, related_name='loans')
     amount = models.DecimalField(max_digits=15, decimal_places=2)
     term_months = models.IntegerField()
     interest_rate = models.DecimalField(max_digits=5, decimal_places=2)
     start_date = models.DateField(null=True)
     end_date = models.DateField(null=True)
     remaining_amount = models.DecimalField(max_digits=15, decimal_places=2)
+    # Sum of posted payments, maintained by the payment posting paths.
+    total_paid = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    # Set on creation and approval; recomputed in bulk when the config changes.
+    emi = models.DecimalField(max_digits=15, decimal_places=2, null=True, blank=True)
     status = models.CharField(
         max_length=1,
         choices=[('P', 'Pending'), ('A', 'Approved'), ('R', 'Rejected')],
         default='P'
     )
     payment_schedule = models.JSONField(default=dict)
+    # Principal prepayments in the order they were made, replayed over the
+    # amortized terms whenever payment_schedule is rebuilt.
+    prepayments = models.JSONField(default=list, blank=True)
+    # Fingerprint of the inputs payment_schedule was built from.
+    schedule_key = models.CharField(max_length=40, blank=True, default='')
+    # Due date of the oldest unpaid overdue installment, set by scan_overdue.
+    delinquent_since = models.DateField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['status'], name='loan_status_idx'),
+            models.Index(fields=['customer', 'status'], name='loan_customer_status_idx'),
+            # Covers SUM(amount) over approved loans.
+            models.Index(fields=['amount'], condition=Q(status='A'), name='loan_approved_amount_idx'),
+            # Covers MAX(updated_at), the Last-Modified of the portfolio.
+            models.Index(fields=['updated_at'], name='loan_updated_idx'),
+            # Covers the delinquent loans cleared by the overdue scan.
+            models.Index(fields=['delinquent_since'], condition=Q(delinquent_since__isnull=False), name='loan_delinquent_idx'),
+        ]
+
+    @profiled('calc')
     def calculate_emi(self):
         """
         Basic EMI calculation using numpy_financial.
@@ -68,92 +283,324 @@ class Loan(models.Model):
         rate = float(self.interest_rate) / 100 / 12
         return round(-npf.pmt(rate, self.term_months, float(self.amount)), 2)
 
+    def pricing_config(self):
+        """
+        The product version this loan is priced under: its own, or the active
+        one for a loan not attached to a version yet.
+        """
+        from loans.cache import get_active_config, get_config
+        if self.config_id is not None:
+            return get_config(self.config_id)
+        return get_active_config()
+
+    @profiled('calc')
     def calculate_sophisticated_emi(self):
         """
         Calculates EMI using compound frequency from LoanConfig.
         """
-        from loans.models import LoanConfig
-        config = LoanConfig.objects.first()  # Assume a single config object exists.
+        config = self.pricing_config()
         if not config:
             raise Exception("Loan configuration not set.")
 
-        # Determine compounding frequency
-        frequency_map = {
-            'M': 12,
-            'Q': 4,
-            'A': 1,
-        }
-        compound_periods = frequency_map.get(config.compound_frequency, 12)
+        return float(sophisticated_emi(self.amount, self.interest_rate, self.term_months, config.compound_frequency))
 
-        # Periodic interest rate (convert interest_rate to float)
-        r = (float(self.interest_rate) / 100) / compound_periods
-        n = self.term_months  # total number of months
-        
-        # EMI formula: If r is 0, avoid division by zero.
-        if r == 0:
-            return round(float(self.amount) / n, 2)
-        numerator = float(self.amount) * r * math.pow(1 + r, n)
-        denominator = math.pow(1 + r, n) - 1
-        emi = numerator / denominator
-        return round(emi, 2)
+    @profiled('calc')
+    def refresh_emi(self, config=None):
+        """
+        Stores the current EMI on the loan, or None when no config exists.
+        A loan not attached to a product version yet is attached to ``config``.
+        """
+        if config is None:
+            config = self.pricing_config()
+        if config is None:
+            self.emi = None
+        else:
+            if self.config_id is None:
+                self.config = config
+            self.emi = Decimal(str(sophisticated_emi(self.amount, self.interest_rate, self.term_months, config.compound_frequency)))
+        return self.emi
+
+    def save(self, *args, **kwargs):
+        if kwargs.get('update_fields') is None:
+            if self.emi is None or self.config_id is None:
+                self.refresh_emi()
+        else:
+            # Partial saves still move updated_at, which drives Last-Modified.
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'updated_at'}
+        super().save(*args, **kwargs)
+
+    def schedule_cache_key(self, config):
+        """
+        Fingerprint of every input the amortization schedule depends on.
+        """
+        start_date = self.start_date or date.today()
+        parts = [
+            Decimal(str(self.amount)).quantize(CENT),
+            self.term_months,
+            Decimal(str(self.interest_rate)).quantize(CENT),
+            start_date.isoformat(),
+            config.compound_frequency,
+        ]
+        if exact_amortization():
+            parts.append('exact')
+        if self.prepayments:
+            parts.append(json.dumps(self.prepayments, sort_keys=True))
+        raw = '|'.join(str(part) for part in parts)
+        return hashlib.sha1(raw.encode()).hexdigest()
+
+    def build_payment_schedule(self, config):
+        """
+        Amortizes the loan's terms under ``config`` and replays its recorded
+        prepayments, without storing anything.
+
+        Returns ``(schedule, emi)``: the EMI is the installment left by the
+        last ``REDUCE_EMI`` prepayment, or the loan's own without one.
+        """
+        exact = exact_amortization()
+        schedule = amortize(
+            self.amount,
+            self.interest_rate,
+            self.term_months,
+            compound_frequency=config.compound_frequency,
+            start_date=self.start_date,
+            exact=exact,
+        ).to_records()
+        emi = self.emi
+        for prepayment in self.prepayments:
+            schedule = self._reamortize(schedule, prepayment, config, exact)
+            if prepayment['option'] == self.REDUCE_EMI and len(schedule) >= prepayment['installment']:
+                emi = Decimal(str(schedule[prepayment['installment'] - 1]['total_installment']))
+        return schedule, emi
+
+    def _reamortize(self, schedule, prepayment, config, exact):
+        """
+        ``schedule`` with the installments from ``prepayment['installment']``
+        on recomputed for the balance left after the prepaid amount.
+        """
+        head = schedule[:prepayment['installment'] - 1]
+        tail = schedule[len(head):]
+        if not tail:
+            return schedule
+        first = tail[0]
+        opening = Decimal(str(first['principal_payment'])) + Decimal(str(first['remaining_balance']))
+        balance = opening - Decimal(prepayment['amount'])
+        if balance <= 0:
+            return head
+        return head + reamortize(
+            balance,
+            self.interest_rate,
+            len(tail),
+            compound_frequency=config.compound_frequency,
+            first_installment=first['installment'],
+            first_due_date=first['due_date'],
+            payment=first['total_installment'] if prepayment['option'] == self.REDUCE_TERM else None,
+            exact=exact,
+        ).to_records()
+
+    def current_payment_schedule(self, config):
+        """
+        The stored schedule while its inputs are unchanged, else a rebuilt one
+        that is not stored.
+        """
+        if self.payment_schedule and self.schedule_key == self.schedule_cache_key(config):
+            return self.payment_schedule
+        return self.build_payment_schedule(config)[0]
 
-    def update_remaining_amount(self):
+    def get_payment_schedule(self):
         """
-        Updates the remaining amount after payments.
+        Returns the stored schedule while its inputs are unchanged, rebuilding it otherwise.
         """
-        total_paid = sum(p.amount for p in self.payment_set.all())
-        self.remaining_amount = float(self.amount) * (1 + float(self.interest_rate) / 100) - total_paid
-        self.save()
+        config = self.pricing_config()
+        if not config:
+            raise Exception("Loan configuration not set.")
+
+        if self.payment_schedule and self.schedule_key == self.schedule_cache_key(config):
+            return self.payment_schedule
+        if self._state.db not in (None, DEFAULT_DB_ALIAS):
+            # A replica may lag behind: rebuild from the primary's row, never
+            # write a schedule derived from a stale copy over a newer one.
+            self.refresh_from_db(using=DEFAULT_DB_ALIAS)
+            return self.get_payment_schedule()
+        return self.generate_payment_schedule(config=config)
 
-    def generate_payment_schedule(self):
+    @profiled('calc')
+    def generate_payment_schedule(self, config=None):
         """
         Generates an amortization schedule for the loan.
         Returns a list of dictionaries, each representing a payment installment.
         """
-        schedule = []
-        from loans.models import LoanConfig
-        config = LoanConfig.objects.first()
+        if config is None:
+            config = self.pricing_config()
         if not config:
             raise Exception("Loan configuration not set.")
 
-        # Determine payment interval based on compound frequency (in months)
-        frequency_map = {
-            'M': 1,   # monthly: every 1 month
-            'Q': 3,   # quarterly: every 3 months
-            'A': 12,  # annually: every 12 months
-        }
-        interval = frequency_map.get(config.compound_frequency, 1)
-        n = math.ceil(self.term_months / interval)
-        # Calculate periodic interest rate; convert interest_rate to float for arithmetic
-        r = (float(self.interest_rate) / 100) / (12 / interval)
-        if r == 0:
-            emi = float(self.amount) / n
-        else:
-            emi = float(self.amount) * r * math.pow(1 + r, n) / (math.pow(1 + r, n) - 1)
-        remaining_balance = float(self.amount)
-        due_date = self.start_date if self.start_date else date.today()
-
-        for i in range(1, n + 1):
-            interest_payment = remaining_balance * r
-            principal_payment = emi - interest_payment
-            remaining_balance -= principal_payment
-            schedule.append({
-                'installment': i,
-                'due_date': (due_date + timedelta(days=interval * 30)).isoformat(),
-                'total_installment': round(emi, 2),
-                'principal_payment': round(principal_payment, 2),
-                'interest_payment': round(interest_payment, 2),
-                'remaining_balance': round(max(remaining_balance, 0), 2)
-            })
-            due_date = due_date + timedelta(days=interval * 30)
-        
+        schedule, self.emi = self.build_payment_schedule(config)
         self.payment_schedule = schedule
-        self.save()
+        self.schedule_key = self.schedule_cache_key(config)
+        if self.pk:
+            # Storing the derived schedule is not a change to the loan: skip
+            # save() so updated_at and the cached responses stay as they are.
+            Loan.objects.filter(pk=self.pk).update(payment_schedule=schedule, schedule_key=self.schedule_key, emi=self.emi)
+            if self.status == 'A':
+                from loans.installments import sync_installments
+                sync_installments(self, schedule)
         return schedule
 
+    @profiled('calc')
+    def apply_prepayment(self, amount, option=REDUCE_EMI, today=None):
+        """
+        Records a principal prepayment and re-amortizes the stored schedule.
+
+        Installments due up to ``today`` are kept as they are; only the tail
+        from the next installment on is recomputed, for the balance left after
+        ``amount``. ``REDUCE_EMI`` keeps the number of installments and lowers
+        them, ``REDUCE_TERM`` keeps the installment and drops periods. The
+        prepayment is stored in ``prepayments``, so rebuilding the schedule
+        later replays it.
+        """
+        config = self.pricing_config()
+        if not config:
+            raise Exception("Loan configuration not set.")
+
+        schedule = self.get_payment_schedule()
+        today = today or date.today()
+        head = [row for row in schedule if row['due_date'] <= today.isoformat()]
+        if len(head) == len(schedule):
+            return schedule
+
+        prepayment = {'installment': len(head) + 1, 'amount': str(Decimal(amount)), 'option': option}
+        unpaid = self.installments.filter(status=Installment.DUE).order_by('number').values_list('number', flat=True).first()
+        if unpaid and unpaid <= len(head):
+            # Overdue installments stay overdue: the prepayment is not theirs.
+            prepayment['unpaid'] = unpaid
+        self.prepayments = [*self.prepayments, prepayment]
+        # Due dates must not move under the recorded prepayment.
+        self.start_date = self.start_date or today
+        self.payment_schedule = self._reamortize(schedule, prepayment, config, exact_amortization())
+        self.schedule_key = self.schedule_cache_key(config)
+        update_fields = ['prepayments', 'start_date', 'payment_schedule', 'schedule_key']
+        if option == self.REDUCE_EMI and len(self.payment_schedule) > len(head):
+            self.emi = Decimal(str(self.payment_schedule[len(head)]['total_installment']))
+            update_fields.append('emi')
+        self.save(update_fields=update_fields)
+        if self.status == 'A':
+            from loans.installments import sync_installments
+            sync_installments(self, self.payment_schedule, keep=len(head))
+        return self.payment_schedule
+
 
 class Payment(models.Model):
     loan = models.ForeignKey(Loan, on_delete=models.PROTECT)
     amount = models.DecimalField(max_digits=15, decimal_places=2)
     payment_date = models.DateTimeField(auto_now_add=True)
     reference_number = models.CharField(max_length=50, unique=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['loan', 'payment_date'], name='payment_loan_date_idx'),
+        ]
+
+
+class Installment(models.Model):
+    """
+    One installment of an approved loan's payment schedule, kept in step with
+    ``Loan.payment_schedule`` (see ``loans.installments``).
+    """
+    DUE = 'D'
+    PAID = 'P'
+
+    loan = models.ForeignKey(Loan, on_delete=models.CASCADE, related_name='installments')
+    number = models.PositiveIntegerField()
+    due_date = models.DateField()
+    amount = models.DecimalField(max_digits=15, decimal_places=2)
+    # Loan.total_paid at which this installment is settled.
+    cumulative_due = models.DecimalField(max_digits=17, decimal_places=2)
+    status = models.CharField(max_length=1, choices=[(DUE, 'Due'), (PAID, 'Paid')], default=DUE)
+    paid_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=('loan', 'number'), name='installment_loan_number_uniq'),
+        ]
+        indexes = [
+            # Only unpaid installments are indexed, so the overdue scan is a
+            # range over the overdue ones alone.
+            models.Index(fields=['due_date', 'status'], condition=Q(status='D'), name='installment_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"Loan #{self.loan_id} installment {self.number} ({self.get_status_display()})"
+
+
+class Job(models.Model):
+    """
+    A unit of background work, queued in the database and run by
+    ``manage.py runworker`` (see ``loans.jobs``).
+    """
+    QUEUED = 'Q'
+    RUNNING = 'R'
+    DONE = 'D'
+    FAILED = 'F'
+
+    task = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(
+        max_length=1,
+        choices=[(QUEUED, 'Queued'), (RUNNING, 'Running'), (DONE, 'Done'), (FAILED, 'Failed')],
+        default=QUEUED,
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True, default='')
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Covers the worker's "next ready job" lookup.
+            models.Index(fields=['status', 'run_after'], name='job_ready_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.task} #{self.pk} ({self.get_status_display()})"
+
+
+class ApiKey(models.Model):
+    """
+    A credential for integration clients, sent as ``Authorization: Bearer
+    <prefix>.<secret>``. Only a SHA-256 digest of the secret is stored; the
+    secrets are random, so a fast hash is enough (see ``loans.authentication``).
+    """
+    user = models.ForeignKey('loans.User', on_delete=models.CASCADE, related_name='api_keys')
+    name = models.CharField(max_length=100, blank=True, default='')
+    prefix = models.CharField(max_length=16, unique=True)
+    digest = models.CharField(max_length=64)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(null=True, blank=True)
+    revoked = models.BooleanField(default=False)
+
+    def __str__(self):
+        return f"{self.prefix} ({self.user})"
+
+    @staticmethod
+    def hash_secret(secret):
+        return hashlib.sha256(secret.encode()).hexdigest()
+
+    @classmethod
+    def issue(cls, user, name='', expires_at=None):
+        """
+        Creates a key for ``user`` and returns ``(api_key, raw_key)``. The raw
+        key is not stored and cannot be shown again.
+        """
+        prefix = secrets.token_hex(6)
+        secret = secrets.token_urlsafe(32)
+        api_key = cls.objects.create(
+            user=user, name=name, prefix=prefix, digest=cls.hash_secret(secret), expires_at=expires_at,
+        )
+        return api_key, f'{prefix}.{secret}'
+
+    def is_usable(self):
+        return not self.revoked and (self.expires_at is None or self.expires_at > timezone.now())
@@ -0,0 +1,40 @@
+import codecs
+import csv
+import json
+
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+
+def read_csv(stream, encoding='utf-8'):
+    """
+    Yields one dict per CSV row, keyed by the header line.
+    """
+    yield from csv.DictReader(codecs.iterdecode(stream, encoding))
+
+
+def read_ndjson(stream, encoding='utf-8'):
+    """
+    Yields one dict per non-blank NDJSON line.
+    """
+    for number, line in enumerate(codecs.iterdecode(stream, encoding), start=1):
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as exc:
+            raise ParseError(f'NDJSON parse error on line {number} - {exc}')
+
+
+class CSVParser(BaseParser):
+    media_type = 'text/csv'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        return list(read_csv(stream))
+
+
+class NDJSONParser(BaseParser):
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        return list(read_ndjson(stream))
@@ -0,0 +1,183 @@
+"""
+Payment posting against a loan's remaining balance.
+
+Balances are changed with a single conditional UPDATE so concurrent payments
+never lose an update and never overdraw a loan.
+"""
+import uuid
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import connections, router, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.fields import empty
+
+from .installments import mark_paid
+from .models import CapacityLedger, Loan, Payment
+from .response_cache import LOANS, invalidate
+
+CENT = Decimal('0.01')
+
+
+def post_payment(loan, amount):
+    """
+    Subtracts ``amount`` from the loan's remaining balance and adds it to
+    ``total_paid``.
+
+    Returns the new balance, or None when the payment exceeds the balance, in
+    which case nothing is changed. Installments the loan has now paid for are
+    marked paid.
+    """
+    connection = connections[router.db_for_write(Loan)]
+    qn = connection.ops.quote_name
+    remaining = qn('remaining_amount')
+    total_paid = qn('total_paid')
+    sql = (
+        f"UPDATE {qn(Loan._meta.db_table)} SET {remaining} = {remaining} - %s, {total_paid} = {total_paid} + %s, "
+        f"{qn('updated_at')} = %s "
+        f"WHERE {qn('id')} = %s AND {remaining} >= %s RETURNING {remaining}"
+    )
+    amount = Decimal(amount)
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [amount, amount, now, loan.pk, amount])
+        row = cursor.fetchone()
+    if row is None:
+        return None
+    mark_paid([loan.pk])
+    return Decimal(str(row[0])).quantize(CENT)
+
+
+def new_reference_number():
+    return f"PAY-{uuid.uuid4().hex[:8].upper()}"
+
+
+def _validate_row(row, serializer, max_reference_length):
+    """
+    Applies the PaymentSerializer field rules to one raw row.
+    Returns ``(loan_id, amount, reference_number, errors)``.
+    """
+    errors = {}
+    values = {}
+    for name in ('loan', 'amount', 'reference_number'):
+        raw = row.get(name)
+        if raw in (None, ''):
+            raw = '' if name == 'reference_number' else empty
+        try:
+            value = serializer.fields[name].run_validation(raw)
+            validator = getattr(serializer, f'validate_{name}', None)
+            values[name] = validator(value) if validator else value
+        except serializers.ValidationError as exc:
+            errors[name] = exc.detail
+    reference = (values.get('reference_number') or '').strip()
+    if len(reference) > max_reference_length:
+        errors['reference_number'] = [f'Ensure this field has no more than {max_reference_length} characters.']
+    return values.get('loan'), values.get('amount'), reference, errors
+
+
+def ingest_payments(rows):
+    """
+    Posts a batch of payments.
+
+    Rows are validated against the PaymentSerializer rules, grouped by loan
+    and written with one ``bulk_create`` plus one balance update per loan.
+    Payments are applied in row order and a row that would overdraw its loan
+    is rejected; the installments paid for are marked with one more UPDATE.
+    Returns one result dict per input row.
+    """
+    from .serializers import PaymentSerializer
+
+    # Loans are looked up for the whole batch at once, so only the id is
+    # validated per row instead of the serializer's per-row PK lookup.
+    serializer = PaymentSerializer()
+    serializer.fields['loan'] = serializers.IntegerField(min_value=1)
+    max_reference_length = Payment._meta.get_field('reference_number').max_length
+
+    results = []
+    candidates = []
+    for index, row in enumerate(rows):
+        loan_id, amount, reference, errors = _validate_row(row, serializer, max_reference_length)
+        result = {'row': index, 'reference_number': reference or None}
+        results.append(result)
+        if errors:
+            result.update(status='rejected', errors=errors)
+        else:
+            candidates.append((result, loan_id, amount, reference or new_reference_number()))
+
+    with transaction.atomic():
+        loans = Loan.objects.select_for_update().only('id', 'customer', 'amount', 'status', 'remaining_amount').in_bulk(
+            {loan_id for _, loan_id, _, _ in candidates}
+        )
+        seen = set(Payment.objects.filter(
+            reference_number__in=[reference for _, _, _, reference in candidates]
+        ).values_list('reference_number', flat=True))
+
+        balances = {loan_id: loan.remaining_amount for loan_id, loan in loans.items()}
+        totals = defaultdict(Decimal)
+        payments = []
+        for result, loan_id, amount, reference in candidates:
+            if loan_id not in loans:
+                result.update(status='rejected', errors={'loan': ['Loan not found.']})
+            elif reference in seen:
+                result.update(status='rejected', errors={'reference_number': ['Duplicate reference number.']})
+            elif amount > balances[loan_id]:
+                result.update(status='rejected', errors={'amount': ['Payment exceeds remaining loan balance.']})
+            else:
+                seen.add(reference)
+                balances[loan_id] -= amount
+                totals[loan_id] += amount
+                payments.append(Payment(loan_id=loan_id, amount=amount, reference_number=reference))
+                result.update(status='created', reference_number=reference, loan=loan_id, amount=str(amount))
+
+        Payment.objects.bulk_create(payments, batch_size=1000)
+        now = timezone.now()
+        for loan_id, total in totals.items():
+            Loan.objects.filter(pk=loan_id).update(
+                remaining_amount=F('remaining_amount') - total,
+                total_paid=F('total_paid') + total,
+                updated_at=now,
+            )
+
+        paid_off = [loan_id for loan_id in totals if balances[loan_id] <= 0]
+        if paid_off:
+            released = sum((loans[loan_id].amount for loan_id in paid_off if loans[loan_id].status == 'A'), Decimal('0'))
+            Loan.objects.filter(pk__in=paid_off).update(status='R', updated_at=now)
+            if released:
+                CapacityLedger.adjust(loans=-released)
+        if totals:
+            mark_paid(list(totals))
+            invalidate(LOANS, {loans[loan_id].customer_id for loan_id in totals})
+
+    return results
+
+
+def reconcile_balances(dry_run=False, batch_size=1000):
+    """
+    Recomputes the denormalized payment columns of every loan: total_paid as
+    the sum of its payments, computed for all loans with one grouped query,
+    and remaining_amount as the amount left after them. Drifted rows are
+    corrected with bulk_update. Returns the corrected ``(loan_id, field, old,
+    new)`` tuples.
+    """
+    paid = dict(
+        Payment.objects.order_by().values_list('loan').annotate(total=Sum('amount'))
+    )
+    now = timezone.now()
+    corrections = []
+    stale = []
+    loans = Loan.objects.order_by('id').values_list('id', 'amount', 'total_paid', 'remaining_amount')
+    for loan_id, amount, total_paid, remaining in loans.iterator(chunk_size=batch_size):
+        expected_paid = paid.get(loan_id) or Decimal('0')
+        expected_remaining = amount - expected_paid
+        if total_paid != expected_paid:
+            corrections.append((loan_id, 'total_paid', total_paid, expected_paid))
+        if remaining != expected_remaining:
+            corrections.append((loan_id, 'remaining_amount', remaining, expected_remaining))
+        if total_paid != expected_paid or remaining != expected_remaining:
+            stale.append(Loan(id=loan_id, total_paid=expected_paid, remaining_amount=expected_remaining, updated_at=now))
+    if stale and not dry_run:
+        Loan.objects.bulk_update(stale, ['total_paid', 'remaining_amount', 'updated_at'], batch_size=batch_size)
+        invalidate(LOANS)
+    return corrections
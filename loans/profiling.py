@@ -0,0 +1,265 @@
+"""
+Opt-in request profiling.
+
+``ProfilingMiddleware`` (enabled with ``LOAN_PROFILING``) measures, for each
+request, the database queries and their time (through
+``connection.execute_wrapper``), the time spent serializing and the time spent
+in ``Loan`` calculation methods. The split is sent back as a ``Server-Timing``
+header and accumulated per URL name for the Prometheus metrics endpoint.
+
+A sample of requests (``LOAN_PROFILE_SAMPLE_RATE``) also runs under cProfile;
+those slower than ``LOAN_PROFILE_SLOW_MS`` are dumped to ``LOAN_PROFILE_DIR``
+for ``python -m pstats`` or snakeviz.
+
+Sections are timed with ``timed`` / ``profiled``; outside a profiled request
+they cost one context-variable lookup.
+"""
+import cProfile
+import functools
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+# Upper bounds, in seconds, of the request duration histogram.
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+SECTIONS = ('db', 'serialize', 'calc')
+
+_current = ContextVar('loans_request_profile', default=None)
+
+
+class RequestProfile:
+    """
+    Timings collected while one request is handled.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.seconds = dict.fromkeys(SECTIONS, 0.0)
+        self.queries = 0
+        self._open = set()
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def server_timing(self, total):
+        parts = [f'db;dur={self.seconds["db"] * 1000:.2f};desc="{self.queries} queries"']
+        parts += [f'{name};dur={self.seconds[name] * 1000:.2f}' for name in SECTIONS[1:]]
+        parts.append(f'total;dur={total * 1000:.2f}')
+        return ', '.join(parts)
+
+
+@contextmanager
+def timed(section):
+    """
+    Adds the time spent in the block to ``section`` of the current request.
+    Nested blocks of the same section are only counted once.
+    """
+    profile = _current.get()
+    if profile is None or section in profile._open:
+        yield
+        return
+    profile._open.add(section)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.seconds[section] += time.perf_counter() - started
+        profile._open.discard(section)
+
+
+def profiled(section):
+    """
+    Decorator form of ``timed``.
+    """
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timed(section):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+class TimedSerializerMixin:
+    """
+    Counts ``to_representation`` towards the request's serialize time.
+    """
+
+    def to_representation(self, instance):
+        with timed('serialize'):
+            return super().to_representation(instance)
+
+
+def record_query(execute, sql, params, many, context):
+    profile = _current.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        profile.queries += 1
+        profile.seconds['db'] += time.perf_counter() - started
+
+
+def instrument(connection, **kwargs):
+    """
+    Installs the query recorder on ``connection`` once.
+    """
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def instrument_all():
+    for connection in connections.all(initialized_only=True):
+        instrument(connection)
+
+
+class Metrics:
+    """
+    Per-process request metrics, keyed by URL name, method and status.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, labels, profile, duration):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = {
+                    'count': 0,
+                    'duration': 0.0,
+                    'buckets': [0] * len(DURATION_BUCKETS),
+                    'queries': 0,
+                    'seconds': dict.fromkeys(SECTIONS, 0.0),
+                }
+            series['count'] += 1
+            series['duration'] += duration
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if duration <= bound:
+                    series['buckets'][i] += 1
+            series['queries'] += profile.queries
+            for name in SECTIONS:
+                series['seconds'][name] += profile.seconds[name]
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+    def render(self):
+        """
+        Prometheus text exposition format.
+        """
+        with self._lock:
+            series = sorted(self._series.items())
+            lines = [
+                '# HELP loans_request_duration_seconds Request latency.',
+                '# TYPE loans_request_duration_seconds histogram',
+            ]
+            for (view, method, code), data in series:
+                labels = f'view="{view}",method="{method}",status="{code}"'
+                for bound, count in zip(DURATION_BUCKETS, data['buckets']):
+                    lines.append(f'loans_request_duration_seconds_bucket{{{labels},le="{bound}"}} {count}')
+                lines.append(f'loans_request_duration_seconds_bucket{{{labels},le="+Inf"}} {data["count"]}')
+                lines.append(f'loans_request_duration_seconds_sum{{{labels}}} {data["duration"]:.6f}')
+                lines.append(f'loans_request_duration_seconds_count{{{labels}}} {data["count"]}')
+            lines += [
+                '# HELP loans_db_queries_total Database queries run by requests.',
+                '# TYPE loans_db_queries_total counter',
+            ]
+            for (view, method, code), data in series:
+                lines.append(f'loans_db_queries_total{{view="{view}",method="{method}",status="{code}"}} {data["queries"]}')
+            lines += [
+                '# HELP loans_section_seconds_total Request time spent per section (db, serialize, calc).',
+                '# TYPE loans_section_seconds_total counter',
+            ]
+            for (view, method, code), data in series:
+                for name in SECTIONS:
+                    lines.append(
+                        f'loans_section_seconds_total{{view="{view}",method="{method}",status="{code}",section="{name}"}} '
+                        f'{data["seconds"][name]:.6f}'
+                    )
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+
+# cProfile can only profile one request per process at a time.
+_profiler_lock = threading.Lock()
+
+
+class ProfilingMiddleware:
+    """
+    Times every request, adds a ``Server-Timing`` header and feeds ``metrics``.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'LOAN_PROFILE_SAMPLE_RATE', 0.0)
+        self.slow_seconds = getattr(settings, 'LOAN_PROFILE_SLOW_MS', 500) / 1000
+        self.dump_dir = getattr(settings, 'LOAN_PROFILE_DIR', None)
+        connection_created.connect(instrument, dispatch_uid='loans.profiling.instrument')
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        instrument_all()
+        profile = RequestProfile()
+        token = _current.set(profile)
+        profiler = self._start_profiler()
+        try:
+            response = self.get_response(request)
+        finally:
+            if profiler:
+                profiler.disable()
+                _profiler_lock.release()
+            _current.reset(token)
+        return self._finish(request, response, profile, profiler)
+
+    async def __acall__(self, request):
+        # The ORM runs in the thread-sensitive executor thread; make sure
+        # its connections carry the recorder too.
+        await sync_to_async(instrument_all)()
+        profile = RequestProfile()
+        token = _current.set(profile)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, profile, None)
+
+    def _start_profiler(self):
+        if not self.dump_dir or random.random() >= self.sample_rate:
+            return None
+        if not _profiler_lock.acquire(blocking=False):
+            return None
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+
+    def _finish(self, request, response, profile, profiler):
+        total = profile.elapsed()
+        response['Server-Timing'] = profile.server_timing(total)
+        match = getattr(request, 'resolver_match', None)
+        view = (match.url_name if match else None) or 'unmatched'
+        metrics.observe((view, request.method, response.status_code), profile, total)
+        if profiler and total >= self.slow_seconds:
+            os.makedirs(self.dump_dir, exist_ok=True)
+            name = f'{int(time.time() * 1000)}-{view}-{request.method}-{total * 1000:.0f}ms.prof'
+            profiler.dump_stats(os.path.join(self.dump_dir, name))
+        return response
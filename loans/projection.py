@@ -0,0 +1,46 @@
+from rest_framework.exceptions import ValidationError
+
+
+class FieldProjectionMixin:
+    """
+    Lets list views return a subset of columns through ``?fields=a,b,c``.
+
+    Only the requested columns are loaded with ``.only()``. Fields listed in
+    ``deferred_fields`` are left out unless they are asked for explicitly, and
+    ``field_dependencies`` names the model columns a computed serializer field
+    needs.
+    """
+    fields_query_param = 'fields'
+    deferred_fields = ()
+    field_dependencies = {}
+
+    def get_projected_fields(self):
+        if hasattr(self, '_projected_fields'):
+            return self._projected_fields
+
+        available = list(self.get_serializer_class()().fields)
+        requested = self.request.query_params.get(self.fields_query_param)
+        if requested:
+            fields = [name.strip() for name in requested.split(',') if name.strip()]
+            unknown = sorted(set(fields) - set(available))
+            if unknown:
+                raise ValidationError({self.fields_query_param: f"Unknown fields: {', '.join(unknown)}."})
+        else:
+            fields = [name for name in available if name not in self.deferred_fields]
+
+        self._projected_fields = fields
+        return fields
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.setdefault('fields', self.get_projected_fields())
+        return super().get_serializer(*args, **kwargs)
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        model_fields = {field.name for field in queryset.model._meta.concrete_fields}
+        columns = set()
+        for name in self.get_projected_fields():
+            if name in model_fields:
+                columns.add(name)
+            columns.update(self.field_dependencies.get(name, ()))
+        return queryset.only(*columns)
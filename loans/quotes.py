@@ -0,0 +1,84 @@
+"""
+Pre-approval quotes.
+
+A quote prices a grid of candidate amounts and terms under one product
+version with a single vectorized call of the EMI formula used for stored
+EMIs (``sophisticated_emi``): amounts run down the rows and terms across the
+columns, so a 50x50 grid is one NumPy broadcast instead of 2,500 calls.
+"""
+import math
+from decimal import Decimal
+
+import numpy as np
+from django.conf import settings
+from rest_framework.exceptions import ValidationError
+
+from .amortization import sophisticated_emi
+from .models import Loan
+
+
+def parse_axis(raw, name, cast, maximum):
+    """
+    Parses a comma-separated query parameter into a list of positive, finite
+    values no greater than ``maximum``.
+    """
+    limit = getattr(settings, 'LOAN_QUOTE_MAX_AXIS', 50)
+    if not raw:
+        raise ValidationError({name: 'This parameter is required.'})
+    try:
+        values = [cast(value) for value in raw.split(',')]
+    except ValueError:
+        raise ValidationError({name: 'Expected a comma-separated list of numbers.'})
+    if any(isinstance(value, float) and not math.isfinite(value) for value in values):
+        raise ValidationError({name: 'Every value must be a finite number.'})
+    if any(value <= 0 for value in values):
+        raise ValidationError({name: 'Every value must be greater than zero.'})
+    if any(value > maximum for value in values):
+        raise ValidationError({name: f'Every value must be at most {maximum}.'})
+    if len(values) > limit:
+        raise ValidationError({name: f'At most {limit} values are allowed.'})
+    return values
+
+
+def max_amount():
+    """
+    The largest amount ``Loan.amount`` can store.
+    """
+    field = Loan._meta.get_field('amount')
+    return float(Decimal(10) ** (field.max_digits - field.decimal_places) - Decimal(1).scaleb(-field.decimal_places))
+
+
+def max_term():
+    """
+    The longest term a quote may price (``LOAN_QUOTE_MAX_TERM`` months).
+    """
+    return getattr(settings, 'LOAN_QUOTE_MAX_TERM', 600)
+
+
+def eligibility(config, amounts, terms, available=None):
+    """
+    Boolean grid of the cells a customer may apply for: the amount within the
+    product's bounds (and ``available`` funds, when given) and the term within
+    its duration.
+    """
+    amounts = np.asarray(amounts, dtype=float).reshape(-1, 1)
+    terms = np.asarray(terms, dtype=int).reshape(1, -1)
+    eligible = (amounts >= float(config.min_amount)) & (amounts <= float(config.max_amount))
+    if available is not None:
+        eligible &= amounts <= float(available)
+    return eligible & (terms <= config.duration_months)
+
+
+def quote_grid(config, amounts, terms, available=None):
+    """
+    EMI, total interest and eligibility for every (amount, term) pair, as
+    (len(amounts), len(terms)) arrays.
+    """
+    amounts = np.asarray(amounts, dtype=float).reshape(-1, 1)
+    terms = np.asarray(terms, dtype=int).reshape(1, -1)
+    emi = sophisticated_emi(amounts, float(config.interest_rate), terms, config.compound_frequency)
+    return {
+        'emi': emi,
+        'total_interest': np.round(emi * terms - amounts, 2),
+        'eligible': eligibility(config, amounts, terms, available),
+    }
@@ -0,0 +1,157 @@
+"""
+Response caching and conditional GET for the read endpoints.
+
+Rendered responses are cached per role and, for roles that only see their own
+rows, per user. Every cached entry carries an ETag (a digest of the body) and
+a Last-Modified taken from the newest ``updated_at`` in the response's scope,
+so polling clients get ``304 Not Modified`` without any rendering.
+
+Cache keys embed generation counters instead of being deleted one by one:
+``invalidate`` bumps the counter of the whole scope and of the affected owners,
+so every stale entry simply stops being looked up. Model signals call it for
+saves and deletes (see ``loans.signals``). ``QuerySet.update``, ``bulk_create``
+and ``bulk_update`` send no signals, so code using them must call
+``invalidate`` itself.
+
+The counters live in the default cache, so every worker process must see the
+same one: responses are only cached with ``LOAN_RESPONSE_CACHE`` on, which a
+system check refuses with a per-process cache. Without it every response is
+rendered, but still carries its ETag and Last-Modified and answers
+conditional requests with 304.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+from rest_framework.response import Response
+
+LOANS = 'loans'
+FUNDS = 'funds'
+
+# Roles that see every row of a scope share one cache entry per request.
+PORTFOLIO_ROLES = ('BP',)
+
+
+def enabled():
+    """
+    Whether rendered responses are cached (``LOAN_RESPONSE_CACHE``).
+    """
+    return getattr(settings, 'LOAN_RESPONSE_CACHE', False)
+
+
+def _generation_key(scope, part):
+    return f'loans:generation:{scope}:{part}'
+
+
+def generation(scope, owner=None):
+    """
+    Current generation of ``scope``, or of one owner's slice of it.
+    """
+    parts = ['all'] if owner is None else ['epoch', owner]
+    keys = [_generation_key(scope, part) for part in parts]
+    values = cache.get_many(keys)
+    missing = {key: time.time_ns() for key in keys if key not in values}
+    if missing:
+        cache.set_many(missing, timeout=None)
+        values.update(missing)
+    return ':'.join(str(values[key]) for key in keys)
+
+
+def _bump(scope, owners):
+    now = time.time_ns()
+    parts = ['all', *owners] if owners is not None else ['all', 'epoch']
+    cache.set_many({_generation_key(scope, part): now for part in parts}, timeout=None)
+
+
+def invalidate(scope, owners=None):
+    """
+    Drops the cached responses of ``scope``: those of ``owners`` only (plus
+    the portfolio-wide ones), or of everyone when ``owners`` is None.
+
+    The bump is repeated after the transaction commits, so a response cached
+    from data read before the commit is not served afterwards.
+    """
+    owners = None if owners is None else [str(owner) for owner in owners]
+    _bump(scope, owners)
+    transaction.on_commit(lambda: _bump(scope, owners))
+
+
+class CachedResponseMixin:
+    """
+    Serves GET responses with ETag and Last-Modified, from the cache when
+    ``LOAN_RESPONSE_CACHE`` is on.
+
+    Views set ``cache_scope`` and implement ``get_last_modified``; the
+    response itself comes from ``get_uncached``, which defaults to the
+    parent class's ``get``.
+    """
+    cache_scope = None
+    _response_cache_key = None
+    _validate_response = False
+
+    def get_last_modified(self):
+        return None
+
+    def cache_owner(self, user):
+        """
+        Owner whose generation the response depends on, or None when it may
+        show any owner's rows.
+        """
+        return None if user.role in PORTFOLIO_ROLES else user.pk
+
+    def response_cache_key(self, request):
+        user = request.user
+        raw = '|'.join(str(part) for part in (
+            generation(self.cache_scope, self.cache_owner(user)),
+            user.role,
+            '*' if user.role in PORTFOLIO_ROLES else user.pk,
+            request.accepted_media_type,
+            request.get_full_path(),
+        ))
+        return 'loans:response:' + hashlib.sha1(raw.encode()).hexdigest()
+
+    def get(self, request, *args, **kwargs):
+        if enabled():
+            key = self.response_cache_key(request)
+            entry = cache.get(key)
+            if entry is not None:
+                response = HttpResponse(entry['content'], content_type=entry['content_type'])
+                return self._conditional(request, response, entry)
+            self._response_cache_key = key
+        self._validate_response = True
+        return self.get_uncached(request, *args, **kwargs)
+
+    def get_uncached(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if not self._validate_response or response.status_code != 200 or not isinstance(response, Response):
+            return response
+        response.render()
+        last_modified = self.get_last_modified()
+        entry = {
+            'content': response.content,
+            'content_type': response['Content-Type'],
+            'etag': quote_etag(hashlib.sha1(response.content).hexdigest()),
+            'last_modified': int(last_modified.timestamp()) if last_modified else None,
+        }
+        if self._response_cache_key is not None:
+            cache.set(self._response_cache_key, entry, timeout=getattr(settings, 'LOAN_RESPONSE_CACHE_TTL', 300))
+        return self._conditional(request, response, entry)
+
+    def _conditional(self, request, response, entry):
+        response['ETag'] = entry['etag']
+        if entry['last_modified'] is not None:
+            response['Last-Modified'] = http_date(entry['last_modified'])
+        # Clients and proxies may keep the body but must revalidate it.
+        response['Cache-Control'] = 'private, no-cache'
+        patch_vary_headers(response, ('Accept', 'Authorization', 'Cookie'))
+        return get_conditional_response(
+            request, etag=entry['etag'], last_modified=entry['last_modified'], response=response,
+        )
@@ -0,0 +1,149 @@
+"""
+Read-replica routing.
+
+Everything runs on the primary (``default``) unless a view opts in with
+``ReplicaReadMixin``: its reads then go to the ``replica`` alias, when one is
+configured. Reads fall back to the primary for read-after-write consistency:
+
+* after the view itself writes (a lazily stored payment schedule, say), or
+  while it is inside a transaction. A schedule read from the replica that
+  needs rebuilding is rebuilt from the primary's row;
+* for ``LOAN_REPLICA_PIN_SECONDS`` after the same user made a successful
+  write request, so a client never reads a replica that has not caught up
+  with its own changes. ``PrimaryPinMiddleware`` records those writes.
+
+The pins are kept in the default cache, where every worker process must see
+them, so views only read the replica with a shared cache configured.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from .checks import shared_cache
+
+REPLICA = 'replica'
+
+# Per-request routing state; None outside the views that read from the replica.
+_state = ContextVar('loans_replica_state', default=None)
+
+
+def _pin_key(user_id):
+    return f'loans:primary-pin:{user_id}'
+
+
+def pin_to_primary(user_id):
+    """
+    Sends the reads of ``user_id`` to the primary for ``LOAN_REPLICA_PIN_SECONDS``.
+    """
+    cache.set(_pin_key(user_id), True, timeout=getattr(settings, 'LOAN_REPLICA_PIN_SECONDS', 5))
+
+
+def is_pinned(user_id):
+    return cache.get(_pin_key(user_id)) is not None
+
+
+@contextmanager
+def replica_reads(pinned=False):
+    """
+    Lets the reads of the enclosed code go to the replica, unless ``pinned``.
+    """
+    token = _state.set({'pinned': pinned})
+    try:
+        yield
+    finally:
+        _state.reset(token)
+
+
+class ReplicaRouter:
+    """
+    Routes the reads inside ``replica_reads`` to the replica and everything
+    else to the primary.
+    """
+
+    def __init__(self, replica=REPLICA):
+        self.replica = replica
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or state['pinned'] or self.replica not in connections.settings:
+            return None
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        return self.replica
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            # Whatever this request reads next must see the write.
+            state['pinned'] = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same rows as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica is migrated through replication, never directly.
+        return False if db == self.replica else None
+
+
+class ReplicaReadMixin:
+    """
+    Serves a read-only view's queries from the replica. Authentication and
+    permission checks still read the primary, so a key or session created a
+    moment ago is always found. Without a shared cache, where other workers
+    would not see a user's pin, everything stays on the primary.
+    """
+    _replica_token = None
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if not shared_cache():
+            return
+        pinned = request.user.is_authenticated and is_pinned(request.user.pk)
+        self._replica_token = _state.set({'pinned': pinned})
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        try:
+            return super().finalize_response(request, response, *args, **kwargs)
+        finally:
+            if self._replica_token is not None:
+                _state.reset(self._replica_token)
+                self._replica_token = None
+
+
+class PrimaryPinMiddleware:
+    """
+    Pins a user's reads to the primary after each successful write request.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        response = self.get_response(request)
+        if self._wrote(request, response):
+            pin_to_primary(request.user.pk)
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        if self._wrote(request, response):
+            await sync_to_async(pin_to_primary)(request.user.pk)
+        return response
+
+    def _wrote(self, request, response):
+        if request.method in ('GET', 'HEAD', 'OPTIONS') or response.status_code >= 400:
+            return False
+        user = getattr(request, 'user', None)
+        return user is not None and user.is_authenticated
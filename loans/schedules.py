@@ -0,0 +1,60 @@
+"""
+Bulk schedule maintenance.
+
+``Loan.get_payment_schedule`` rebuilds a stale schedule lazily, on the next
+read. When every stored schedule goes stale at once (switching
+``LOAN_EXACT_AMORTIZATION``, say), ``regenerate_schedules`` rebuilds them
+ahead of time, a chunk of loans at a time, each under its own product
+version and with its recorded prepayments replayed, writing each chunk with
+``bulk_update`` and rewriting the installments of the approved ones. Loans
+that never had a schedule stored are left to be built on first read.
+"""
+from django.utils import timezone
+
+from .cache import get_config
+from .installments import replace_installments
+from .models import Loan
+from .response_cache import LOANS, invalidate
+
+
+def _store(loans):
+    Loan.objects.bulk_update(loans, ['payment_schedule', 'schedule_key', 'emi', 'updated_at'])
+    approved = [loan for loan in loans if loan.status == 'A']
+    if approved:
+        replace_installments(approved)
+
+
+def regenerate_schedules(batch_size=1000):
+    """
+    Rebuilds every stored schedule whose inputs no longer match the loan and
+    its product version. Returns the number of loans rewritten.
+    """
+    loans = (
+        Loan.objects.exclude(schedule_key='').filter(config__isnull=False).order_by('id')
+        .only(
+            'id', 'config', 'amount', 'term_months', 'interest_rate', 'start_date', 'prepayments', 'emi',
+            'schedule_key', 'status',
+        )
+        .iterator(chunk_size=batch_size)
+    )
+    count = 0
+    stale = []
+    for loan in loans:
+        config = get_config(loan.config_id)
+        key = loan.schedule_cache_key(config)
+        if loan.schedule_key == key:
+            continue
+        loan.payment_schedule, loan.emi = loan.build_payment_schedule(config)
+        loan.schedule_key = key
+        loan.updated_at = timezone.now()
+        stale.append(loan)
+        if len(stale) == batch_size:
+            _store(stale)
+            count += len(stale)
+            stale = []
+    if stale:
+        _store(stale)
+        count += len(stale)
+    if count:
+        invalidate(LOANS)
+    return count
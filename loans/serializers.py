@@ -1,43 +1,134 @@
+from django.conf import settings
 from rest_framework import serializers
+from .cache import get_active_config
 from .models import LoanFund, LoanConfig, Loan, Payment
+from .profiling import TimedSerializerMixin
 
-class LoanFundSerializer(serializers.ModelSerializer):
+class DynamicFieldsModelSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    """
+    A ModelSerializer that takes an optional ``fields`` argument restricting
+    which fields are serialized.
+    """
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+class LoanFundSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = LoanFund
         fields = '__all__'
 
-class LoanConfigSerializer(serializers.ModelSerializer):
+class LoanConfigSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = LoanConfig
         fields = '__all__'
 
-class LoanSerializer(serializers.ModelSerializer):
-    emi = serializers.SerializerMethodField()
+class LoanSerializer(DynamicFieldsModelSerializer):
+    # Stored on the loan; see loans.emi for how it is kept current.
+    emi = serializers.FloatField(read_only=True)
 
     class Meta:
         model = Loan
-        fields = '__all__'
+        exclude = ('schedule_key',)
 
-    def get_emi(self, obj):
-        try:
-            return obj.calculate_sophisticated_emi()
-        except Exception as e:
-            return str(e)
 
+class LoanApplicationSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    """
+    A customer's loan application, priced under the latest version of
+    ``product``.
+    """
+    product = serializers.CharField(write_only=True, required=False, default=LoanConfig.DEFAULT_PRODUCT)
+    emi = serializers.FloatField(read_only=True)
 
-class PaymentSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Loan
+        fields = ('id', 'product', 'config', 'amount', 'term_months', 'interest_rate', 'emi', 'remaining_amount', 'status')
+        read_only_fields = ('config', 'interest_rate', 'remaining_amount', 'status')
+
+    def validate(self, attrs):
+        config = get_active_config(attrs.pop('product'))
+        if config is None:
+            raise serializers.ValidationError({'product': "Unknown loan product."})
+        if not config.min_amount <= attrs['amount'] <= config.max_amount:
+            raise serializers.ValidationError(
+                {'amount': f"Must be between {config.min_amount} and {config.max_amount}."}
+            )
+        if not 1 <= attrs['term_months'] <= config.duration_months:
+            raise serializers.ValidationError(
+                {'term_months': f"Must be between 1 and {config.duration_months} months."}
+            )
+        attrs['config'] = config
+        return attrs
+
+
+class PaymentSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     reference_number = serializers.CharField(required=False, allow_blank=True)
+    # Treats the payment as a principal prepayment and re-amortizes the schedule.
+    prepayment = serializers.ChoiceField(choices=Loan.PREPAYMENT_OPTIONS, required=False, write_only=True)
 
     class Meta:
         model = Payment
-        fields = ['loan', 'amount', 'payment_date', 'reference_number']
+        fields = ['loan', 'amount', 'payment_date', 'reference_number', 'prepayment']
 
-class LoanApprovalSerializer(serializers.ModelSerializer):
+    def validate_amount(self, value):
+        if value <= 0:
+            raise serializers.ValidationError("Payment amount must be positive.")
+        return value
+
+class LoanApprovalSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Loan
         fields = ('id', 'status')
 
-class LoanFundApprovalSerializer(serializers.ModelSerializer):
+class LoanFundApprovalSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = LoanFund
         fields = ('id', 'status')
+
+
+class LoanQueueFilterSerializer(serializers.Serializer):
+    customer = serializers.IntegerField(required=False)
+    product = serializers.CharField(required=False)
+    min_amount = serializers.DecimalField(max_digits=15, decimal_places=2, required=False)
+    max_amount = serializers.DecimalField(max_digits=15, decimal_places=2, required=False)
+    created_before = serializers.DateTimeField(required=False)
+
+
+class LoanFundQueueFilterSerializer(serializers.Serializer):
+    provider = serializers.IntegerField(required=False)
+    min_amount = serializers.DecimalField(max_digits=15, decimal_places=2, required=False)
+    max_amount = serializers.DecimalField(max_digits=15, decimal_places=2, required=False)
+    created_before = serializers.DateTimeField(required=False)
+
+
+class BulkDecisionSerializer(serializers.Serializer):
+    """
+    ``status`` to apply to the requests listed in ``ids``, or to the pending
+    requests matching ``filter``.
+    """
+    status = serializers.ChoiceField(choices=[('A', 'Approved'), ('R', 'Rejected')])
+    ids = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False, allow_empty=False)
+
+    def validate_ids(self, value):
+        limit = settings.LOAN_BULK_DECISION_MAX
+        if len(value) > limit:
+            raise serializers.ValidationError(f"At most {limit} ids are allowed.")
+        return value
+
+    def validate(self, attrs):
+        if ('ids' in attrs) == ('filter' in attrs):
+            raise serializers.ValidationError("Send either ids or filter.")
+        return attrs
+
+
+class BulkLoanDecisionSerializer(BulkDecisionSerializer):
+    filter = LoanQueueFilterSerializer(required=False)
+
+
+class BulkLoanFundDecisionSerializer(BulkDecisionSerializer):
+    filter = LoanFundQueueFilterSerializer(required=False)
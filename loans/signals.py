@@ -0,0 +1,52 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .authentication import verified_keys
+from .cache import invalidate_config_cache
+from .models import ApiKey, Loan, LoanConfig, LoanFund, Payment, User
+from .response_cache import FUNDS, LOANS, invalidate
+
+
+@receiver(post_save, sender=LoanConfig)
+@receiver(post_delete, sender=LoanConfig)
+def loan_config_changed(sender, instance, **kwargs):
+    # Existing loans keep the version they were priced under, so a new
+    # version only touches the catalog, and the loans created while no
+    # config existed, which are priced in the background. The catalog is
+    # dropped once the version is committed: dropped any earlier, the next
+    # read could cache the catalog without it again.
+    transaction.on_commit(invalidate_config_cache)
+    if kwargs.get('created') and Loan.objects.filter(config__isnull=True).exists():
+        from .jobs import enqueue
+        enqueue('price_unpriced_loans', coalesce=True)
+
+
+@receiver(post_save, sender=ApiKey)
+@receiver(post_delete, sender=ApiKey)
+def api_key_changed(sender, instance, **kwargs):
+    verified_keys.evict(key_ids={instance.pk})
+
+
+@receiver(post_save, sender=User)
+def user_changed(sender, instance, created, **kwargs):
+    if not created:
+        verified_keys.evict(user_id=instance.pk)
+
+
+@receiver(post_save, sender=Loan)
+@receiver(post_delete, sender=Loan)
+def loan_changed(sender, instance, **kwargs):
+    invalidate(LOANS, [instance.customer_id])
+
+
+@receiver(post_save, sender=Payment)
+@receiver(post_delete, sender=Payment)
+def payment_changed(sender, instance, **kwargs):
+    invalidate(LOANS, [instance.loan.customer_id])
+
+
+@receiver(post_save, sender=LoanFund)
+@receiver(post_delete, sender=LoanFund)
+def loan_fund_changed(sender, instance, **kwargs):
+    invalidate(FUNDS, [instance.provider_id])
@@ -1,10 +1,68 @@
+import base64
+import io
+import json
+import os
+import pstats
+import random
+import time
+import tempfile
 from datetime import date, timedelta
-from django.test import TestCase
+from types import SimpleNamespace
+from decimal import Decimal
+import numpy as np
+from django.core.cache import cache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management import call_command
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from unittest import mock, skipUnless
+from django import test
+from django.test import AsyncClient, RequestFactory, SimpleTestCase, override_settings
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework.test import APIClient
 from rest_framework import status
-from loans.models import User, LoanFund, Loan, Payment, LoanConfig
+from loans.models import User, LoanFund, Loan, Payment, LoanConfig, CapacityLedger, Installment, Job, ApiKey
+from loans.authentication import ApiKeyAuthentication, verified_keys
+from django.db import connection, connections
 from django.db.models import Sum
+from django.db.migrations.executor import MigrationExecutor
+from django.test.utils import CaptureQueriesContext
+from loans.amortization import amortize, amortize_batch, payment_interval, reamortize, sophisticated_emi
+from loans.analytics import ANALYTICS_CACHE_KEY, portfolio_summary
+from loans import urls as loan_urls
+from loans.benchmarks import compare, load_baseline, run_benchmarks, seed_portfolio
+from loans.checks import check_replica_pins, check_response_cache
+from loans import cache as config_cache
+from loans.cache import get_active_config, invalidate_config_cache
+from loans.emi import recompute_emis
+from loans.installments import scan_overdue, start_schedules
+from loans.profiling import metrics
+from loans.payments import post_payment, reconcile_balances
+from loans.response_cache import LOANS, invalidate
+from loans.schedules import regenerate_schedules
+from loans.routers import PrimaryPinMiddleware, ReplicaReadMixin, ReplicaRouter, is_pinned, replica_reads
+from loans.jobs import claim, enqueue, heartbeat, release_stale, retry_delay, run, run_pending, task
+from loans.views import LoanFundListView, LoanListView
+
+
+class FreshConfigCache:
+    """
+    Empties the config cache before every test: rolling back a test's
+    LoanConfig rows does not evict them from the cache.
+    """
+
+    def _pre_setup(self):
+        super()._pre_setup()
+        invalidate_config_cache()
+
+
+class TestCase(FreshConfigCache, test.TestCase):
+    pass
+
+
+class TransactionTestCase(FreshConfigCache, test.TransactionTestCase):
+    pass
 
 class LoanApprovalTestCase(TestCase):
     def setUp(self):
@@ -69,6 +127,63 @@ class LoanFundApprovalTestCase(TestCase):
         self.loan_fund.refresh_from_db()
         self.assertEqual(self.loan_fund.status, 'A')
 
+class CapacityLedgerTestCase(TestCase):
+    def setUp(self):
+        self.bp_user = User.objects.create_user(username='bp', password='pass', role='BP')
+        self.lp_user = User.objects.create_user(username='lp', password='pass', role='LP')
+        self.lc_user = User.objects.create_user(username='lc', password='pass', role='LC')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.bp_user)
+
+    def ledger(self):
+        return CapacityLedger.objects.get(pk=CapacityLedger.SINGLETON_ID)
+
+    def test_fund_approval_updates_ledger(self):
+        fund = LoanFund.objects.create(provider=self.lp_user, amount=8000)
+        url = reverse('loanfundapproval-detail', args=[fund.id])
+        self.client.patch(url, {'status': 'A'}, format='json')
+        self.assertEqual(self.ledger().approved_funds, 8000)
+        self.client.patch(url, {'status': 'R'}, format='json')
+        self.assertEqual(self.ledger().approved_funds, 0)
+
+    def test_loan_approval_does_not_aggregate(self):
+        LoanFund.objects.create(provider=self.lp_user, amount=10000, status='A')
+        loan = Loan.objects.create(customer=self.lc_user, amount=4000, term_months=12, interest_rate=10, remaining_amount=4000)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.patch(reverse('loanapproval-detail', args=[loan.id]), {'status': 'A'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse([q for q in ctx.captured_queries if 'SUM(' in q['sql'].upper()])
+        self.assertEqual(self.ledger().approved_loans, 4000)
+
+    def test_saves_from_stale_instances_move_the_ledger_once(self):
+        fund = LoanFund.objects.create(provider=self.lp_user, amount=8000)
+        first, second = LoanFund.objects.get(pk=fund.pk), LoanFund.objects.get(pk=fund.pk)
+        for instance in (first, second):
+            instance.status = 'A'
+            instance.save()
+        self.assertEqual(self.ledger().approved_funds, 8000)
+
+        first, second = LoanFund.objects.get(pk=fund.pk), LoanFund.objects.get(pk=fund.pk)
+        for instance in (first, second):
+            instance.status = 'R'
+            instance.save()
+        self.assertEqual(self.ledger().approved_funds, 0)
+        second.delete()
+        self.assertEqual(self.ledger().approved_funds, 0)
+
+    def test_ledger_matches_rebuild(self):
+        fund = LoanFund.objects.create(provider=self.lp_user, amount=9000, status='A')
+        loan = Loan.objects.create(customer=self.lc_user, amount=3000, term_months=12, interest_rate=10, remaining_amount=3000, status='A')
+        loan.amount = 2500
+        loan.save()
+        fund.delete()
+        running = self.ledger()
+        CapacityLedger.rebuild()
+        rebuilt = self.ledger()
+        self.assertEqual((running.approved_funds, running.approved_loans), (rebuilt.approved_funds, rebuilt.approved_loans))
+        self.assertEqual(rebuilt.approved_loans, 2500)
+
+
 class PaymentCreateTestCase(TestCase):
     def setUp(self):
         
@@ -114,9 +229,242 @@ class PaymentCreateTestCase(TestCase):
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
         self.assertIn('Payment exceeds remaining loan balance', str(response.data))
 
+    def test_payment_response_needs_no_reselect(self):
+        url = reverse('payment-create')
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(url, {'loan': self.loan.id, 'amount': '1500.25'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['remaining_amount'], Decimal('3499.75'))
+        selects = [q for q in ctx.captured_queries if q['sql'].startswith('SELECT')]
+        self.assertEqual(len(selects), 1)
+
+    def test_idempotency_key_replays_payment(self):
+        url = reverse('payment-create')
+        payment_data = {'loan': self.loan.id, 'amount': 1000}
+        first = self.client.post(url, payment_data, format='json', HTTP_IDEMPOTENCY_KEY='retry-1')
+        second = self.client.post(url, payment_data, format='json', HTTP_IDEMPOTENCY_KEY='retry-1')
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertEqual(first.data['reference_number'], 'retry-1')
+        self.assertEqual(second.data['reference_number'], 'retry-1')
+        self.assertEqual(Payment.objects.filter(loan=self.loan).count(), 1)
+        self.loan.refresh_from_db()
+        self.assertEqual(self.loan.remaining_amount, 4000)
+
+    def test_idempotency_key_reused_for_other_payment(self):
+        url = reverse('payment-create')
+        self.client.post(url, {'loan': self.loan.id, 'amount': 1000}, format='json', HTTP_IDEMPOTENCY_KEY='retry-2')
+        response = self.client.post(url, {'loan': self.loan.id, 'amount': 500}, format='json', HTTP_IDEMPOTENCY_KEY='retry-2')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.loan.refresh_from_db()
+        self.assertEqual(self.loan.remaining_amount, 4000)
+
+    def test_paying_off_loan_closes_it(self):
+        response = self.client.post(reverse('payment-create'), {'loan': self.loan.id, 'amount': 5000}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.loan.refresh_from_db()
+        self.assertEqual(self.loan.status, 'R')
+
+class PaymentBulkIngestTestCase(TestCase):
+    def setUp(self):
+        self.bp_user = User.objects.create_user(username='bp', password='pass', role='BP')
+        self.lc_user = User.objects.create_user(username='lc', password='pass', role='LC')
+        self.loan = Loan.objects.create(customer=self.lc_user, amount=5000, term_months=12, interest_rate=10, remaining_amount=5000)
+        self.other = Loan.objects.create(customer=self.lc_user, amount=1000, term_months=12, interest_rate=10, remaining_amount=1000)
+        Payment.objects.create(loan=self.other, amount=1, reference_number='TAKEN')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.bp_user)
+
+    def test_ndjson_batch_report(self):
+        rows = [
+            {'loan': self.loan.id, 'amount': '1000', 'reference_number': 'B-1'},
+            {'loan': self.loan.id, 'amount': '1500.50'},
+            {'loan': self.loan.id, 'amount': '4000', 'reference_number': 'B-3'},
+            {'loan': self.other.id, 'amount': '1000', 'reference_number': 'B-4'},
+            {'loan': 99999, 'amount': '10'},
+            {'loan': self.other.id, 'amount': '5', 'reference_number': 'TAKEN'},
+            {'loan': self.other.id, 'amount': '-5'},
+            {'loan': self.loan.id, 'amount': '1', 'reference_number': 'B-1'},
+        ]
+        body = '\n'.join(json.dumps(row) for row in rows)
+        response = self.client.post(reverse('payment-bulk-create'), body, content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        outcomes = [result['status'] for result in response.data['results']]
+        self.assertEqual(outcomes, ['created', 'created', 'rejected', 'created', 'rejected', 'rejected', 'rejected', 'rejected'])
+        self.assertIn('amount', response.data['results'][6]['errors'])
+        self.loan.refresh_from_db()
+        self.other.refresh_from_db()
+        self.assertEqual(self.loan.remaining_amount, Decimal('2499.50'))
+        self.assertEqual(self.other.remaining_amount, 0)
+        self.assertEqual(self.other.status, 'R')
+        self.assertEqual(Payment.objects.count(), 4)
+
+    def test_csv_batch(self):
+        body = f"loan,amount,reference_number\n{self.loan.id},100,C-1\n{self.loan.id},200,\n"
+        response = self.client.post(reverse('payment-bulk-create'), body, content_type='text/csv')
+        self.assertEqual(response.data['created'], 2)
+        self.loan.refresh_from_db()
+        self.assertEqual(self.loan.remaining_amount, 4700)
+
+    def test_management_command(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'batch.csv')
+            report = os.path.join(tmp, 'report.ndjson')
+            with open(path, 'w') as handle:
+                handle.write(f"loan,amount\n{self.loan.id},100\n{self.loan.id},abc\n")
+            call_command('ingest_payments', path, batch_size=1, report=report, stdout=io.StringIO())
+            with open(report) as handle:
+                results = [json.loads(line) for line in handle]
+        self.assertEqual([(r['row'], r['status']) for r in results], [(0, 'created'), (1, 'rejected')])
+        self.loan.refresh_from_db()
+        self.assertEqual(self.loan.remaining_amount, 4900)
+
+
+class PrepaymentTestCase(TestCase):
+    def setUp(self):
+        self.lc_user = User.objects.create_user(username='lc', password='pass', role='LC')
+        LoanConfig.objects.create(min_amount=1000, max_amount=20000, interest_rate=10, duration_months=12, compound_frequency='M')
+        self.loan = Loan.objects.create(
+            customer=self.lc_user, amount=12000, term_months=12, interest_rate=10, remaining_amount=12000,
+            start_date=date.today() - timedelta(days=95), status='A',
+        )
+        self.original = self.loan.generate_payment_schedule()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.lc_user)
+
+    def pay(self, amount, **extra):
+        return self.client.post(reverse('payment-create'), {'loan': self.loan.id, 'amount': amount, **extra}, format='json')
+
+    def test_reduce_emi_recomputes_only_the_tail(self):
+        response = self.pay('3000.00', prepayment=Loan.REDUCE_EMI)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.loan.refresh_from_db()
+        schedule = self.loan.payment_schedule
+        self.assertEqual(schedule[:3], self.original[:3])
+        self.assertEqual(len(schedule), 12)
+        self.assertEqual([row['due_date'] for row in schedule], [row['due_date'] for row in self.original])
+        self.assertLess(schedule[3]['total_installment'], self.original[3]['total_installment'])
+        expected = self.original[3]['principal_payment'] + self.original[3]['remaining_balance'] - 3000
+        self.assertAlmostEqual(sum(row['principal_payment'] for row in schedule[3:]), expected, places=1)
+        self.assertEqual(schedule[-1]['remaining_balance'], 0.0)
+        self.assertEqual(float(self.loan.emi), schedule[3]['total_installment'])
+
+    def test_reduce_term_keeps_the_installment(self):
+        self.pay('3000.00', prepayment=Loan.REDUCE_TERM)
+        self.loan.refresh_from_db()
+        schedule = self.loan.payment_schedule
+        self.assertEqual(schedule[:3], self.original[:3])
+        self.assertLess(len(schedule), 12)
+        self.assertTrue(all(row['total_installment'] == self.original[3]['total_installment'] for row in schedule[3:-1]))
+        self.assertLessEqual(schedule[-1]['total_installment'], self.original[3]['total_installment'])
+        self.assertEqual(schedule[-1]['remaining_balance'], 0.0)
+        self.assertEqual(self.loan.emi, Decimal('1054.99'))
+
+    def test_regular_payment_leaves_schedule_alone(self):
+        self.pay('1054.99')
+        self.loan.refresh_from_db()
+        self.assertEqual(self.loan.payment_schedule, self.original)
+
+    def test_prepaying_the_whole_tail_drops_it(self):
+        self.loan.apply_prepayment(Decimal('100000'), Loan.REDUCE_TERM)
+        self.assertEqual(self.loan.payment_schedule, self.original[:3])
+
+    @override_settings(LOAN_EXACT_AMORTIZATION=True)
+    def test_exact_tail_repays_balance_to_the_cent(self):
+        self.original = self.loan.generate_payment_schedule()
+        opening = Decimal(str(self.original[3]['principal_payment'])) + Decimal(str(self.original[3]['remaining_balance']))
+        for option in (Loan.REDUCE_EMI, Loan.REDUCE_TERM):
+            self.loan.payment_schedule, self.loan.prepayments = self.original, []
+            schedule = self.loan.apply_prepayment(Decimal('1234.56'), option)
+            repaid = sum(Decimal(str(row['principal_payment'])) for row in schedule[3:])
+            self.assertEqual(repaid, opening - Decimal('1234.56'))
+
+    def test_rebuilding_the_schedule_replays_prepayments(self):
+        schedule = self.loan.apply_prepayment(Decimal('5000'), Loan.REDUCE_EMI)
+        self.loan.refresh_from_db()
+        self.assertEqual(self.loan.prepayments, [{'installment': 4, 'amount': '5000', 'option': Loan.REDUCE_EMI, 'unpaid': 1}])
+        with override_settings(LOAN_EXACT_AMORTIZATION=True):
+            self.assertEqual(regenerate_schedules(), 1)
+            self.loan.refresh_from_db()
+            rebuilt = self.loan.payment_schedule
+            self.assertEqual(self.loan.get_payment_schedule(), rebuilt)
+        self.assertAlmostEqual(rebuilt[3]['total_installment'], schedule[3]['total_installment'], places=1)
+        self.assertEqual(self.loan.emi, Decimal(str(rebuilt[3]['total_installment'])))
+        self.assertEqual(
+            list(self.loan.installments.order_by('number').values_list('amount', flat=True)),
+            [Decimal(str(row['total_installment'])) for row in rebuilt],
+        )
+        Payment.objects.create(loan=self.loan, amount=5000, reference_number='PRE-1')
+        post_payment(self.loan, Decimal('5000'))
+        self.assertFalse(self.loan.installments.filter(status=Installment.PAID).exists())
+
+    def test_emi_recompute_leaves_prepaid_loans_alone(self):
+        self.loan.apply_prepayment(Decimal('5000'), Loan.REDUCE_EMI)
+        emi = Loan.objects.get(pk=self.loan.pk).emi
+        recompute_emis()
+        self.assertEqual(Loan.objects.get(pk=self.loan.pk).emi, emi)
+
+    def test_cache_key_ignores_decimal_formatting(self):
+        config = self.loan.pricing_config()
+        key = self.loan.schedule_cache_key(config)
+        self.loan.amount, self.loan.interest_rate = Decimal('12000'), 10
+        self.assertEqual(self.loan.schedule_cache_key(config), key)
+
+    def test_unknown_option_is_rejected(self):
+        response = self.pay('100.00', prepayment='skip')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Payment.objects.exists())
+
+    def test_reamortizing_without_prepayment_reproduces_the_tail(self):
+        schedule = amortize(12000, 10, 12, start_date=date(2025, 1, 1))
+        tail = reamortize(schedule.balance[2], 10, 9, first_installment=4, first_due_date=schedule.due_date[3])
+        self.assertTrue(np.allclose(tail.payment, schedule.payment[3:]))
+        self.assertTrue(np.allclose(tail.balance, schedule.balance[3:], atol=1e-6))
+        self.assertEqual(tail.to_records()[0]['due_date'], schedule.to_records()[3]['due_date'])
+
+
+class TotalPaidTestCase(TestCase):
+    def setUp(self):
+        self.lc_user = User.objects.create_user(username='lc', password='pass', role='LC')
+        self.loan = Loan.objects.create(customer=self.lc_user, amount=5000, term_months=12, interest_rate=10, remaining_amount=5000)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.lc_user)
+
+    def test_posting_maintains_total_paid(self):
+        url = reverse('payment-create')
+        self.client.post(url, {'loan': self.loan.id, 'amount': '100.10'}, format='json')
+        self.client.post(url, {'loan': self.loan.id, 'amount': '200.20'}, format='json')
+        self.loan.refresh_from_db()
+        self.assertEqual(self.loan.total_paid, Decimal('300.30'))
+        self.assertEqual(self.loan.remaining_amount, self.loan.amount - self.loan.total_paid)
+
+    def test_reconcile_command(self):
+        other = Loan.objects.create(customer=self.lc_user, amount=1000, term_months=12, interest_rate=10, remaining_amount=1000, total_paid=7)
+        Payment.objects.create(loan=self.loan, amount=40, reference_number='R-1')
+        Payment.objects.create(loan=self.loan, amount=60, reference_number='R-2')
+        out = io.StringIO()
+        call_command('reconcile_loans', stdout=out)
+        self.assertIn('Corrected 2 loans.', out.getvalue())
+        self.loan.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual((self.loan.total_paid, other.total_paid), (100, 0))
+        self.assertEqual((self.loan.remaining_amount, other.remaining_amount), (4900, 1000))
+
+    def test_reconcile_corrects_remaining_amount(self):
+        Payment.objects.create(loan=self.loan, amount=250, reference_number='R-1')
+        Loan.objects.filter(pk=self.loan.pk).update(total_paid=250, remaining_amount=4800)
+        self.assertEqual(reconcile_balances(dry_run=True), [(self.loan.pk, 'remaining_amount', 4800, 4750)])
+        self.loan.refresh_from_db()
+        self.assertEqual(self.loan.remaining_amount, 4800)
+        reconcile_balances()
+        self.loan.refresh_from_db()
+        self.assertEqual(self.loan.remaining_amount, 4750)
+        self.assertEqual(reconcile_balances(), [])
+
+
 class PaymentScheduleTestCase(TestCase):
     def setUp(self):
-       
+        LoanConfig.objects.create(min_amount=1000, max_amount=20000, interest_rate=10, duration_months=12, compound_frequency='M')
         self.lc_user = User.objects.create_user(username='lc', password='pass', role='LC')
         self.loan = Loan.objects.create(
             customer=self.lc_user,
@@ -125,14 +473,10 @@ class PaymentScheduleTestCase(TestCase):
             interest_rate=10,
             remaining_amount=12000,
             status='A',
-          
             start_date=date.today()
         )
         self.client = APIClient()
         self.client.force_authenticate(user=self.lc_user)
-    
-        if not LoanConfig.objects.exists():
-            LoanConfig.objects.create(min_amount=1000, max_amount=20000, interest_rate=10, duration_months=12, compound_frequency='M')
 
     def test_get_payment_schedule(self):
         url = reverse('paymentschedule', args=[self.loan.id])
@@ -150,6 +494,779 @@ class PaymentScheduleTestCase(TestCase):
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
         self.assertIn('Not allowed', str(response.data))
 
+    def test_cached_schedule_served_without_writes(self):
+        url = reverse('paymentschedule', args=[self.loan.id])
+        first = self.client.get(url, format='json')
+        with CaptureQueriesContext(connection) as ctx:
+            second = self.client.get(url, format='json')
+        self.assertEqual(first.content, second.content)
+        self.assertFalse([q for q in ctx.captured_queries if q['sql'].startswith('UPDATE')])
+
+    def test_schedule_keeps_its_product_version(self):
+        url = reverse('paymentschedule', args=[self.loan.id])
+        self.assertEqual(len(self.client.get(url, format='json').data['schedule']), 12)
+        with self.captureOnCommitCallbacks(execute=True):
+            LoanConfig.latest().revise(compound_frequency='Q')
+        self.assertEqual(len(json.loads(self.client.get(url, format='json').content)['schedule']), 12)
+        newer = Loan.objects.create(customer=self.lc_user, amount=12000, term_months=12, interest_rate=10,
+                                    remaining_amount=12000, start_date=date.today())
+        url = reverse('paymentschedule', args=[newer.id])
+        self.assertEqual(len(self.client.get(url, format='json').data['schedule']), 4)
+
+    def test_schedule_rebuilt_when_loan_changes(self):
+        url = reverse('paymentschedule', args=[self.loan.id])
+        self.client.get(url, format='json')
+        Loan.objects.filter(id=self.loan.id).update(term_months=24)
+        # Queryset updates bypass the signals that drop cached responses.
+        invalidate(LOANS)
+        self.assertEqual(len(self.client.get(url, format='json').data['schedule']), 24)
+
+    def test_stale_replica_copy_is_rebuilt_from_the_primary(self):
+        stale = Loan.objects.get(id=self.loan.id)
+        # Read from a replica that has not seen the prepayment yet.
+        stale._state.db = 'replica'
+        self.loan.apply_prepayment(Decimal('3000'), Loan.REDUCE_TERM)
+        stored = Loan.objects.get(id=self.loan.id)
+        with CaptureQueriesContext(connection) as ctx:
+            schedule = stale.get_payment_schedule()
+        self.assertFalse([q for q in ctx.captured_queries if q['sql'].startswith(('UPDATE', 'INSERT', 'DELETE'))])
+        self.assertEqual(schedule, stored.payment_schedule)
+        self.assertEqual((stale.prepayments, stale._state.db), (stored.prepayments, 'default'))
+        self.assertEqual(Loan.objects.get(id=self.loan.id).payment_schedule, stored.payment_schedule)
+
+class LoanConfigCacheTestCase(TestCase):
+    def setUp(self):
+        self.bp_user = User.objects.create_user(username='bp', password='pass', role='BP')
+        self.lc_user = User.objects.create_user(username='lc', password='pass', role='LC')
+        self.config = LoanConfig.objects.create(min_amount=1000, max_amount=20000, interest_rate=10, duration_months=12, compound_frequency='M')
+        for _ in range(20):
+            Loan.objects.create(customer=self.lc_user, amount=5000, term_months=12, interest_rate=10, remaining_amount=5000)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.bp_user)
+
+    def test_listing_reads_stored_emi_without_config_lookup(self):
+        invalidate_config_cache()
+        # The page itself and MAX(updated_at) for Last-Modified.
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('loan-list'), format='json')
+        self.assertEqual(len(response.data['results']), 20)
+        self.assertEqual(response.data['results'][0]['emi'], 439.58)
+
+    def test_config_update_invalidates_cache(self):
+        self.assertEqual(get_active_config().compound_frequency, 'M')
+        url = reverse('loanconfig-detail')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(url, {'compound_frequency': 'Q'}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            # Not before the new version is committed.
+            self.assertEqual(get_active_config().compound_frequency, 'M')
+        self.assertEqual(get_active_config().compound_frequency, 'Q')
+
+    def test_other_processes_see_a_new_version_once_their_copy_expires(self):
+        # A second worker: its own in-memory copy and its own LocMem cache.
+        other = {'local': {'catalog': config_cache._MISSING, 'expires': 0.0}, 'cache': LocMemCache('other-worker', {})}
+
+        def in_other_worker(now):
+            with mock.patch.object(config_cache, '_local', other['local']), \
+                    mock.patch.object(config_cache, 'cache', other['cache']), \
+                    mock.patch('time.monotonic', return_value=now), mock.patch('time.time', return_value=now):
+                return get_active_config().version
+
+        self.assertEqual(in_other_worker(1000.0), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.config.revise(interest_rate=12)
+        self.assertEqual(get_active_config().version, 2)
+        self.assertEqual(in_other_worker(1001.0), 1)
+        self.assertEqual(in_other_worker(1000.0 + settings.LOAN_CONFIG_LOCAL_TTL + 1), 2)
+
+    def test_config_update_publishes_a_new_version(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(reverse('loanconfig-detail'), {'compound_frequency': 'Q', 'product': 'other'},
+                                         format='json')
+        self.assertEqual((response.data['product'], response.data['version']), ('standard', 2))
+        self.config.refresh_from_db()
+        self.assertEqual(self.config.compound_frequency, 'M')
+        self.assertEqual(get_active_config().pk, response.data['id'])
+        self.assertEqual(set(Loan.objects.values_list('config', flat=True)), {self.config.pk})
+
+    def test_products_are_listed_and_revised_separately(self):
+        response = self.client.post(reverse('loanconfig-list'), {
+            'product': 'premium', 'min_amount': 5000, 'max_amount': 90000, 'interest_rate': 8,
+            'duration_months': 24, 'compound_frequency': 'Q',
+        }, format='json')
+        self.assertEqual((response.data['product'], response.data['version']), ('premium', 1))
+        url = reverse('loanconfig-product-detail', args=['premium'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.patch(url, {'interest_rate': 7}, format='json').data['version'], 2)
+        self.assertEqual(get_active_config('premium').interest_rate, 7)
+        self.assertEqual(get_active_config().compound_frequency, 'M')
+        listed = self.client.get(reverse('loanconfig-list'), {'product': 'premium'}, format='json').data
+        self.assertEqual([row['version'] for row in listed], [2, 1])
+        self.assertEqual(self.client.get(reverse('loanconfig-product-detail', args=['none'])).status_code,
+                         status.HTTP_404_NOT_FOUND)
+
+
+class StoredEmiTestCase(TestCase):
+    def setUp(self):
+        self.bp_user = User.objects.create_user(username='bp', password='pass', role='BP')
+        self.lc_user = User.objects.create_user(username='lc', password='pass', role='LC')
+        self.config = LoanConfig.objects.create(min_amount=1000, max_amount=20000, interest_rate=10, duration_months=12, compound_frequency='M')
+        self.loan = Loan.objects.create(customer=self.lc_user, amount=5000, term_months=12, interest_rate=10, remaining_amount=5000)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.bp_user)
+
+    def test_emi_is_stored_on_creation(self):
+        self.loan.refresh_from_db()
+        self.assertEqual(self.loan.emi, Decimal('439.58'))
+        self.assertEqual(float(self.loan.emi), self.loan.calculate_sophisticated_emi())
+
+    def test_new_version_leaves_existing_loans_alone(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.config.revise(compound_frequency='Q')
+        self.assertFalse(run_pending())
+        self.loan.refresh_from_db()
+        self.assertEqual((self.loan.config_id, self.loan.emi), (self.config.pk, Decimal('439.58')))
+        other = Loan.objects.create(customer=self.lc_user, amount=5000, term_months=12, interest_rate=10, remaining_amount=5000)
+        self.assertEqual(other.config.compound_frequency, 'Q')
+        self.assertEqual(float(other.emi), float(sophisticated_emi(5000, 10, 12, 'Q')))
+
+    def test_versions_are_immutable(self):
+        self.config.interest_rate = 12
+        with self.assertRaises(ValueError):
+            self.config.save()
+        revised = self.config.revise(interest_rate=12)
+        self.assertEqual((revised.product, revised.version, revised.compound_frequency), ('standard', 2, 'M'))
+
+    def test_loans_are_priced_per_product(self):
+        premium = LoanConfig.objects.create(product='premium', min_amount=1000, max_amount=20000, interest_rate=10,
+                                            duration_months=12, compound_frequency='A')
+        loans = [
+            Loan.objects.create(customer=self.lc_user, config=config, amount=24000, term_months=24, interest_rate=6,
+                                remaining_amount=24000)
+            for config in (self.config, premium, self.config, premium)
+        ]
+        Loan.objects.update(emi=None)
+        self.assertEqual(recompute_emis(batch_size=1), 5)
+        for loan in loans:
+            loan.refresh_from_db()
+            expected = sophisticated_emi(24000, 6, 24, loan.config.compound_frequency)
+            self.assertEqual(float(loan.emi), float(expected))
+        self.assertNotEqual(loans[0].emi, loans[1].emi)
+
+    def test_approval_refreshes_emi(self):
+        LoanFund.objects.create(provider=User.objects.create_user(username='lp', password='pass', role='LP'), amount=10000, status='A')
+        Loan.objects.filter(pk=self.loan.pk).update(emi=None)
+        response = self.client.patch(reverse('loanapproval-detail', args=[self.loan.id]), {'status': 'A'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.loan.refresh_from_db()
+        self.assertEqual(self.loan.emi, Decimal('439.58'))
+
+    def test_recompute_matches_scalar_formula(self):
+        loans = [
+            Loan.objects.create(customer=self.lc_user, amount=amount, term_months=term, interest_rate=rate, remaining_amount=amount)
+            for amount, term, rate in ((1000, 6, 0), (250000, 360, 19.99), (7777.77, 37, 3.5))
+        ]
+        Loan.objects.update(emi=None)
+        self.assertEqual(recompute_emis(batch_size=2), 4)
+        for loan in loans:
+            loan.refresh_from_db()
+            self.assertEqual(float(loan.emi), loan.calculate_sophisticated_emi())
+
+
+calls = []
+
+
+@task('tests.record')
+def record_task(value):
+    calls.append(value)
+
+
+@task('tests.fail')
+def fail_task():
+    raise RuntimeError("boom")
+
+
+class JobQueueTestCase(TestCase):
+    def setUp(self):
+        calls.clear()
+        self.bp_user = User.objects.create_user(username='bp', password='pass', role='BP')
+        self.lc_user = User.objects.create_user(username='lc', password='pass', role='LC')
+        self.config = LoanConfig.objects.create(min_amount=1000, max_amount=20000, interest_rate=10, duration_months=12, compound_frequency='M')
+        Job.objects.all().delete()
+
+    def test_queued_job_runs_once(self):
+        job = enqueue('tests.record', {'value': 7})
+        self.assertEqual(job.status, Job.QUEUED)
+        self.assertEqual([j.pk for j in run_pending()], [job.pk])
+        self.assertEqual(run_pending(), [])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, calls), (Job.DONE, 1, [7]))
+        self.assertIsNotNone(job.finished_at)
+
+    def test_claimed_job_cannot_be_claimed_again(self):
+        enqueue('tests.record', {'value': 1})
+        self.assertIsNotNone(claim('worker-a'))
+        self.assertIsNone(claim('worker-b'))
+
+    def test_delayed_job_waits(self):
+        enqueue('tests.record', {'value': 1}, delay=60)
+        self.assertEqual(run_pending(), [])
+
+    def test_failures_back_off_then_fail(self):
+        job = enqueue('tests.fail', max_attempts=3)
+        with self.assertLogs('loans.jobs', level='WARNING'):
+            for expected in (5, 10):
+                started = timezone.now()
+                run_pending()
+                job.refresh_from_db()
+                self.assertEqual(job.status, Job.QUEUED)
+                self.assertIn('RuntimeError: boom', job.last_error)
+                self.assertGreaterEqual(job.run_after, started + timedelta(seconds=expected))
+                Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+            run_pending()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 3))
+        self.assertEqual(retry_delay(20), 3600)
+
+    def test_coalesce_reuses_waiting_job(self):
+        first = enqueue('tests.record', {'value': 1}, coalesce=True)
+        self.assertEqual(enqueue('tests.record', {'value': 1}, coalesce=True).pk, first.pk)
+        self.assertNotEqual(enqueue('tests.record', {'value': 2}, coalesce=True).pk, first.pk)
+
+    def test_unknown_task_is_rejected(self):
+        with self.assertRaises(KeyError):
+            enqueue('tests.missing')
+
+    def test_stale_running_job_is_requeued(self):
+        job = enqueue('tests.record', {'value': 3})
+        claim('crashed')
+        Job.objects.filter(pk=job.pk).update(locked_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(release_stale(), 1)
+        run_pending()
+        self.assertEqual(calls, [3])
+
+    def test_worker_does_not_record_a_job_taken_over_by_another(self):
+        job = enqueue('tests.record', {'value': 4})
+        claimed = claim('stalled')
+        # Requeued while the first worker was stalled, and claimed again.
+        Job.objects.filter(pk=job.pk).update(locked_by='worker-b')
+        run(claimed)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.locked_by), (Job.RUNNING, 'worker-b'))
+
+    def test_loans_waiting_for_a_config_are_priced_in_the_background(self):
+        LoanConfig.objects.all().delete()
+        loan = Loan.objects.create(customer=self.lc_user, amount=5000, term_months=12, interest_rate=10, remaining_amount=5000)
+        self.assertEqual((loan.config, loan.emi), (None, None))
+        client = APIClient()
+        client.force_authenticate(user=self.bp_user)
+        for frequency in 'QA':
+            with self.captureOnCommitCallbacks(execute=True):
+                response = client.post(reverse('loanconfig-list'), {
+                    'min_amount': 1000, 'max_amount': 20000, 'interest_rate': 10, 'duration_months': 12,
+                    'compound_frequency': frequency,
+                }, format='json')
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(list(Job.objects.filter(status=Job.QUEUED).values_list('task', flat=True)), ['price_unpriced_loans'])
+        loan.refresh_from_db()
+        self.assertIsNone(loan.emi)
+
+        call_command('runworker', '--once', stdout=io.StringIO())
+        loan.refresh_from_db()
+        self.assertEqual(loan.config, get_active_config())
+        self.assertEqual(float(loan.emi), float(sophisticated_emi(5000, 10, 12, 'A')))
+        self.assertEqual(len(loan.get_payment_schedule()), 1)
+
+
+@override_settings(LOAN_JOB_HEARTBEAT=0.05, LOAN_JOB_TIMEOUT=0.3)
+class JobHeartbeatTestCase(TransactionTestCase):
+    def test_running_job_is_kept_until_its_heartbeat_stops(self):
+        job = enqueue('tests.record', {'value': 1})
+        claimed = claim('worker-a')
+        with heartbeat(claimed):
+            time.sleep(0.6)
+        self.assertGreater(Job.objects.get(pk=job.pk).locked_at, claimed.locked_at + timedelta(seconds=0.3))
+        self.assertEqual(release_stale(), 0)
+        time.sleep(0.4)
+        self.assertEqual(release_stale(), 1)
+
+
+PROFILED_MIDDLEWARE = ['loans.profiling.ProfilingMiddleware', *settings.MIDDLEWARE]
+
+
+@override_settings(MIDDLEWARE=PROFILED_MIDDLEWARE, LOAN_PROFILE_SAMPLE_RATE=0)
+class ProfilingMiddlewareTestCase(TestCase):
+    def setUp(self):
+        metrics.reset()
+        self.bp_user = User.objects.create_user(username='bp', password='pass', role='BP')
+        self.lc_user = User.objects.create_user(username='lc', password='pass', role='LC')
+        LoanConfig.objects.create(min_amount=1000, max_amount=20000, interest_rate=10, duration_months=12, compound_frequency='M')
+        self.loan = Loan.objects.create(customer=self.lc_user, amount=5000, term_months=12, interest_rate=10, remaining_amount=5000)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.bp_user)
+
+    def timings(self, response):
+        parts = dict(part.split(';', 1) for part in response['Server-Timing'].split(', '))
+        return {name: float(rest.split('dur=')[1].split(';')[0]) for name, rest in parts.items()}, parts
+
+    def test_server_timing_splits_db_and_serialization(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('loan-list'), format='json')
+        durations, parts = self.timings(response)
+        self.assertIn(f'desc="{len(ctx.captured_queries)} queries"', parts['db'])
+        self.assertGreater(durations['db'], 0)
+        self.assertGreater(durations['serialize'], 0)
+        self.assertGreaterEqual(durations['total'], durations['db'] + durations['serialize'])
+
+    def test_calculation_time_is_recorded(self):
+        response = self.client.get(reverse('paymentschedule', args=[self.loan.id]), format='json')
+        durations, _ = self.timings(response)
+        self.assertGreater(durations['calc'], 0)
+
+    async def test_async_views_are_timed(self):
+        client = AsyncClient()
+        await sync_to_async(client.force_login)(self.bp_user)
+        response = await client.get(reverse('async-paymentschedule', args=[self.loan.id]))
+        durations, parts = self.timings(response)
+        self.assertNotIn('desc="0 queries"', parts['db'])
+        self.assertGreater(durations['calc'], 0)
+
+    def test_metrics_endpoint_exposes_prometheus_text(self):
+        self.client.get(reverse('loan-list'), format='json')
+        self.client.get(reverse('loan-list'), format='json')
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        body = response.content.decode()
+        self.assertIn('loans_request_duration_seconds_count{view="loan-list",method="GET",status="200"} 2', body)
+        self.assertIn('loans_db_queries_total{view="loan-list",method="GET",status="200"}', body)
+        self.assertIn('section="serialize"', body)
+
+    def test_metrics_endpoint_requires_bank_personnel(self):
+        client = APIClient()
+        client.force_authenticate(user=self.lc_user)
+        self.assertEqual(client.get(reverse('metrics')).status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_slow_sampled_requests_are_dumped(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with override_settings(LOAN_PROFILE_SAMPLE_RATE=1, LOAN_PROFILE_SLOW_MS=0, LOAN_PROFILE_DIR=directory):
+                self.client.get(reverse('loan-list'), format='json')
+            dumps = os.listdir(directory)
+            self.assertEqual(len(dumps), 1)
+            self.assertIn('loan-list', dumps[0])
+            stats = pstats.Stats(os.path.join(directory, dumps[0]))
+            self.assertGreater(stats.total_calls, 0)
+
+    def test_fast_requests_are_not_dumped(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with override_settings(LOAN_PROFILE_SAMPLE_RATE=1, LOAN_PROFILE_SLOW_MS=60000, LOAN_PROFILE_DIR=directory):
+                self.client.get(reverse('loan-list'), format='json')
+            self.assertEqual(os.listdir(directory), [])
+
+    @override_settings(MIDDLEWARE=[m for m in settings.MIDDLEWARE if m != 'loans.profiling.ProfilingMiddleware'])
+    def test_disabled_by_default(self):
+        response = self.client.get(reverse('loan-list'), format='json')
+        self.assertNotIn('Server-Timing', response)
+
+
+class ApiKeyAuthenticationTestCase(TestCase):
+    def setUp(self):
+        verified_keys.clear()
+        self.bp_user = User.objects.create_user(username='bp', password='pass', role='BP')
+        self.api_key, self.raw_key = ApiKey.issue(self.bp_user, name='integration')
+        self.client = APIClient()
+
+    def get_loans(self, key):
+        return self.client.get(reverse('loan-list'), format='json', HTTP_AUTHORIZATION=f'Bearer {key}')
+
+    def test_valid_key_authenticates(self):
+        self.assertEqual(self.get_loans(self.raw_key).status_code, status.HTTP_200_OK)
+        self.assertNotIn(self.raw_key.split('.')[1], self.api_key.digest)
+
+    def test_verified_key_is_served_from_the_local_cache(self):
+        self.get_loans(self.raw_key)
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self.get_loans(self.raw_key).status_code, status.HTTP_200_OK)
+        self.assertFalse([q for q in ctx.captured_queries if 'loans_apikey' in q['sql']])
+
+    def test_cached_verification_is_cheap(self):
+        auth = ApiKeyAuthentication()
+        auth.authenticate_credentials(self.raw_key)
+        started = time.perf_counter()
+        for _ in range(1000):
+            user, _ = auth.authenticate_credentials(self.raw_key)
+        self.assertLess((time.perf_counter() - started) / 1000, 0.0005)
+        self.assertEqual(user, self.bp_user)
+
+    def test_bad_keys_are_rejected(self):
+        prefix = self.raw_key.split('.')[0]
+        for key in (f'{prefix}.wrong', 'nope.nope', prefix, 'a b'):
+            self.assertEqual(self.get_loans(key).status_code, status.HTTP_401_UNAUTHORIZED, key)
+
+    def test_revoking_evicts_the_cached_key(self):
+        self.get_loans(self.raw_key)
+        self.api_key.revoked = True
+        self.api_key.save()
+        self.assertEqual(self.get_loans(self.raw_key).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deactivating_the_user_evicts_the_cached_key(self):
+        self.get_loans(self.raw_key)
+        self.bp_user.is_active = False
+        self.bp_user.save()
+        self.assertEqual(self.get_loans(self.raw_key).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_expired_key_is_rejected(self):
+        _, raw = ApiKey.issue(self.bp_user, expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(self.get_loans(raw).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_basic_authentication_is_no_longer_accepted(self):
+        credentials = base64.b64encode(b'bp:pass').decode()
+        response = self.client.get(reverse('loan-list'), format='json', HTTP_AUTHORIZATION=f'Basic {credentials}')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(response['WWW-Authenticate'], 'Bearer')
+
+    def test_command_issues_a_working_key(self):
+        out = io.StringIO()
+        call_command('create_api_key', 'bp', '--name', 'settlement', stdout=out, stderr=io.StringIO())
+        self.assertEqual(self.get_loans(out.getvalue().strip()).status_code, status.HTTP_200_OK)
+        self.assertTrue(ApiKey.objects.filter(user=self.bp_user, name='settlement').exists())
+
+
+class LoanListPaginationTestCase(TestCase):
+    def setUp(self):
+        self.bp_user = User.objects.create_user(username='bp', password='pass', role='BP')
+        self.lc_user = User.objects.create_user(username='lc', password='pass', role='LC')
+        LoanConfig.objects.create(min_amount=1000, max_amount=20000, interest_rate=10, duration_months=12, compound_frequency='M')
+        self.loans = [
+            Loan.objects.create(customer=self.lc_user, amount=5000, term_months=12, interest_rate=10,
+                                remaining_amount=5000, payment_schedule=[{'installment': 1}])
+            for _ in range(5)
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.bp_user)
+
+    def test_pages_follow_id_order(self):
+        url = reverse('loan-list')
+        response = self.client.get(url, {'page_size': 2}, format='json')
+        ids = [row['id'] for row in response.data['results']]
+        while response.data['next']:
+            response = self.client.get(response.data['next'], format='json')
+            ids += [row['id'] for row in response.data['results']]
+        self.assertEqual(ids, [loan.id for loan in self.loans])
+
+    def test_payment_schedule_not_loaded_by_default(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('loan-list'), format='json')
+        self.assertNotIn('payment_schedule', response.data['results'][0])
+        self.assertNotIn('payment_schedule', ctx.captured_queries[-1]['sql'])
+
+    def test_fields_projection(self):
+        response = self.client.get(reverse('loan-list'), {'fields': 'id,status,payment_schedule'}, format='json')
+        self.assertEqual(set(response.data['results'][0]), {'id', 'status', 'payment_schedule'})
+        self.assertEqual(response.data['results'][0]['payment_schedule'], [{'installment': 1}])
+
+    def test_unknown_field_rejected(self):
+        response = self.client.get(reverse('loan-list'), {'fields': 'id,nope'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_loan_fund_projection(self):
+        LoanFund.objects.create(provider=self.bp_user, amount=5000)
+        response = self.client.get(reverse('loanfund-list'), {'fields': 'id,amount'}, format='json')
+        self.assertEqual(set(response.data['results'][0]), {'id', 'amount'})
+
+
+class ExportTestCase(TestCase):
+    def setUp(self):
+        self.bp_user = User.objects.create_user(username='bp', password='pass', role='BP')
+        self.lc_user = User.objects.create_user(username='lc', password='pass', role='LC')
+        LoanConfig.objects.create(min_amount=1000, max_amount=20000, interest_rate=10, duration_months=12, compound_frequency='M')
+        self.loan = Loan.objects.create(customer=self.lc_user, amount=5000, term_months=12, interest_rate=10,
+                                        remaining_amount=5000, start_date=date(2025, 1, 1))
+        Loan.objects.create(customer=self.lc_user, amount=1200, term_months=6, interest_rate=0, remaining_amount=1200)
+        Payment.objects.create(loan=self.loan, amount=100, reference_number='REF-1')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.bp_user)
+
+    def fetch(self, resource, fmt):
+        response = self.client.get(reverse('export', args=[resource]), {'format': fmt})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_loans_ndjson(self):
+        rows = [json.loads(line) for line in self.fetch('loans', 'ndjson').splitlines()]
+        self.assertEqual([row['id'] for row in rows], list(Loan.objects.order_by('id').values_list('id', flat=True)))
+        self.assertEqual(rows[0]['amount'], '5000.00')
+        self.assertNotIn('payment_schedule', rows[0])
+
+    def test_payments_csv(self):
+        lines = self.fetch('payments', 'csv').splitlines()
+        self.assertEqual(lines[0], 'id,loan_id,amount,payment_date,reference_number')
+        self.assertEqual(len(lines), 2)
+        self.assertIn('REF-1', lines[1])
+
+    def test_schedules_match_engine(self):
+        rows = [json.loads(line) for line in self.fetch('schedules', 'ndjson').splitlines()]
+        self.assertEqual(len(rows), 18)
+        expected = amortize(5000, 10, 12, start_date=date(2025, 1, 1)).to_records()
+        first = [row for row in rows if row['loan_id'] == self.loan.id]
+        self.assertEqual([{k: v for k, v in row.items() if k != 'loan_id'} for row in first], expected)
+
+    def test_schedules_of_prepaid_loans_follow_the_prepayment(self):
+        self.loan.status = 'A'
+        self.loan.save()
+        schedule = self.loan.apply_prepayment(Decimal('2000'), Loan.REDUCE_TERM, today=date(2025, 3, 15))
+        rows = [json.loads(line) for line in self.fetch('schedules', 'ndjson').splitlines()]
+        first = [row for row in rows if row['loan_id'] == self.loan.id]
+        self.assertEqual([{k: v for k, v in row.items() if k != 'loan_id'} for row in first], schedule)
+        self.assertEqual(rows[len(first)]['loan_id'], Loan.objects.order_by('id')[1].id)
+
+    def test_schedules_of_loans_without_a_config_use_the_active_one(self):
+        # Created while no version existed: not attached to one yet.
+        Loan.objects.filter(pk=self.loan.pk).update(config=None)
+        with self.captureOnCommitCallbacks(execute=True):
+            LoanConfig.latest().revise(compound_frequency='Q')
+        rows = [json.loads(line) for line in self.fetch('schedules', 'ndjson').splitlines()]
+        first = [row for row in rows if row['loan_id'] == self.loan.id]
+        expected = amortize(5000, 10, 12, 'Q', start_date=date(2025, 1, 1)).to_records()
+        self.assertEqual([{k: v for k, v in row.items() if k != 'loan_id'} for row in first], expected)
+        self.assertEqual(len(rows), 4 + 6)
+
+    def test_export_requires_bank_personnel(self):
+        self.client.force_authenticate(user=self.lc_user)
+        response = self.client.get(reverse('export', args=['loans']))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class BenchmarkBaselineTestCase(TestCase):
+    def test_query_counts_within_baseline(self):
+        portfolio = seed_portfolio(loans=60, payments_per_loan=2, customers=5)
+        results = run_benchmarks(portfolio, iterations=2)
+        named = {pattern.name for pattern in loan_urls.urlpatterns if pattern.name}
+        self.assertEqual(set(results), named)
+        self.assertEqual(compare(results, load_baseline()), [])
+
+    def test_latency_and_memory_are_compared_on_request(self):
+        baseline = {'loan-list': {'queries': 2, 'p99_ms': 10.0, 'peak_kb': 100.0}}
+        slow = {'loan-list': {'queries': 2, 'p99_ms': 13.0, 'peak_kb': 200.0}}
+        self.assertEqual(compare(slow, baseline), [])
+        self.assertEqual(compare(slow, baseline, check_latency=True), ['loan-list: p99 13.0ms > baseline 10.0ms'])
+        self.assertEqual(compare(slow, baseline, tolerance=0.5, check_latency=True), [])
+        self.assertEqual(len(compare(slow, baseline, check_memory=True)), 1)
+        self.assertEqual(compare({'loan-list': {**slow['loan-list'], 'queries': 3}}, baseline),
+                         ['loan-list: 3 queries > baseline 2'])
+
+    @override_settings(LOAN_RESPONSE_CACHE=True)
+    def test_cached_endpoints_are_measured_uncached(self):
+        portfolio = seed_portfolio(loans=20, payments_per_loan=1, customers=2)
+        names = ['loan-list', 'loanfund-list', 'paymentschedule']
+        results = run_benchmarks(portfolio, iterations=2, names=names)
+        # The page, plus MAX(updated_at) for the lists' Last-Modified.
+        self.assertEqual(
+            {name: results[name]['queries'] for name in names},
+            {'loan-list': 2, 'loanfund-list': 2, 'paymentschedule': 1},
+        )
+
+
+class QueryPlanTestCase(TestCase):
+    """
+    Runs EXPLAIN on the hot view querysets and asserts they are answered from
+    an index. PostgreSQL prefers sequential scans on tiny tables, so they are
+    disabled for the test transaction.
+    """
+
+    def setUp(self):
+        self.bp_user = User.objects.create_user(username='bp', password='pass', role='BP')
+        self.lp_user = User.objects.create_user(username='lp', password='pass', role='LP')
+        self.lc_user = User.objects.create_user(username='lc', password='pass', role='LC')
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+
+    def assertUsesIndex(self, queryset, index_name=None):
+        plan = queryset.explain()
+        if connection.vendor == 'sqlite':
+            self.assertRegex(plan, r'USING (COVERING )?INDEX|USING INTEGER PRIMARY KEY', plan)
+        else:
+            self.assertIn('Index', plan, plan)
+        if index_name:
+            self.assertIn(index_name, plan)
+
+    def view_queryset(self, view_class, user):
+        view = view_class()
+        view.request = SimpleNamespace(user=user)
+        return view.get_queryset()
+
+    def test_customer_loan_list(self):
+        queryset = self.view_queryset(LoanListView, self.lc_user)
+        self.assertUsesIndex(queryset.filter(status='A').order_by('id'), 'loan_customer_status_idx')
+        self.assertUsesIndex(queryset.order_by('id'))
+
+    def test_keyset_page(self):
+        for view_class in (LoanListView, LoanFundListView):
+            self.assertUsesIndex(self.view_queryset(view_class, self.bp_user).filter(id__gt=100).order_by('id'))
+
+    def test_provider_fund_list(self):
+        queryset = self.view_queryset(LoanFundListView, self.lp_user)
+        self.assertUsesIndex(queryset.filter(status='P'), 'loanfund_provider_status_idx')
+
+    def test_status_queues(self):
+        self.assertUsesIndex(Loan.objects.filter(status='P').order_by('id'), 'loan_status_idx')
+        self.assertUsesIndex(LoanFund.objects.filter(status='P').order_by('id'), 'loanfund_status_idx')
+
+    def test_approved_amount_aggregates(self):
+        self.assertUsesIndex(Loan.objects.filter(status='A').values('amount'))
+        self.assertUsesIndex(LoanFund.objects.filter(status='A').values('amount'))
+
+    def test_payment_history(self):
+        loan = Loan.objects.create(customer=self.lc_user, amount=1000, term_months=12, interest_rate=10, remaining_amount=1000)
+        self.assertUsesIndex(Payment.objects.filter(loan=loan).order_by('payment_date'), 'payment_loan_date_idx')
+
+
+class AsyncReadViewsTestCase(TestCase):
+    def setUp(self):
+        self.bp_user = User.objects.create_user(username='bp', password='pass', role='BP')
+        self.lc_user = User.objects.create_user(username='lc', password='pass', role='LC')
+        self.other_user = User.objects.create_user(username='other', password='pass', role='LC')
+        LoanConfig.objects.create(min_amount=1000, max_amount=20000, interest_rate=10, duration_months=12, compound_frequency='M')
+        self.loans = [
+            Loan.objects.create(customer=self.lc_user, amount=5000, term_months=12, interest_rate=10, remaining_amount=5000,
+                                start_date=date(2025, 1, 1))
+            for _ in range(5)
+        ]
+        Loan.objects.create(customer=self.other_user, amount=5000, term_months=12, interest_rate=10, remaining_amount=5000)
+        self.async_client = AsyncClient()
+
+    async def fetch(self, url, params=None):
+        response = await self.async_client.get(url, params or {})
+        if response.streaming:
+            body = b''.join([chunk async for chunk in response.streaming_content])
+        else:
+            body = response.content
+        return response.status_code, json.loads(body)
+
+    async def test_loan_list_pages_for_customer(self):
+        await sync_to_async(self.async_client.force_login)(self.lc_user)
+        code, page = await self.fetch(reverse('async-loan-list'), {'page_size': 3})
+        self.assertEqual(code, status.HTTP_200_OK)
+        ids = [row['id'] for row in page['results']]
+        self.assertNotIn('payment_schedule', page['results'][0])
+        code, page = await self.fetch(page['next'])
+        ids += [row['id'] for row in page['results']]
+        self.assertIsNone(page['next'])
+        self.assertEqual(ids, [loan.id for loan in self.loans])
+
+    async def test_loan_fund_projection(self):
+        await sync_to_async(LoanFund.objects.create)(provider=self.bp_user, amount=5000)
+        await sync_to_async(self.async_client.force_login)(self.bp_user)
+        code, page = await self.fetch(reverse('async-loanfund-list'), {'fields': 'id,amount'})
+        self.assertEqual(set(page['results'][0]), {'id', 'amount'})
+        code, page = await self.fetch(reverse('async-loanfund-list'), {'fields': 'nope'})
+        self.assertEqual(code, status.HTTP_400_BAD_REQUEST)
+
+    async def test_requires_authentication(self):
+        code, body = await self.fetch(reverse('async-loan-list'))
+        self.assertIn(code, (status.HTTP_401_UNAUTHORIZED, status.HTTP_403_FORBIDDEN))
+        self.assertTrue(body['error'])
+
+    async def test_errors_match_the_sync_views(self):
+        for user, name, params in (
+            (None, 'loan-list', {}),
+            (self.bp_user, 'loanfund-list', {'fields': 'nope'}),
+        ):
+            if user is not None:
+                await sync_to_async(self.client.force_login)(user)
+                await sync_to_async(self.async_client.force_login)(user)
+            expected = await sync_to_async(self.client.get)(reverse(name), params)
+            response = await self.async_client.get(reverse(f'async-{name}'), params)
+            self.assertEqual(response.status_code, expected.status_code, name)
+            self.assertEqual(json.loads(response.content), expected.json())
+            self.assertEqual(response.get('WWW-Authenticate'), expected.get('WWW-Authenticate'))
+
+    async def test_payment_schedule(self):
+        await sync_to_async(self.async_client.force_login)(self.lc_user)
+        code, body = await self.fetch(reverse('async-paymentschedule', args=[self.loans[0].id]))
+        self.assertEqual(code, status.HTTP_200_OK)
+        self.assertEqual(body['schedule'], amortize(5000, 10, 12, start_date=date(2025, 1, 1)).to_records())
+        await sync_to_async(self.async_client.force_login)(self.other_user)
+        code, body = await self.fetch(reverse('async-paymentschedule', args=[self.loans[0].id]))
+        self.assertEqual(code, status.HTTP_403_FORBIDDEN)
+
+
+class PortfolioAnalyticsTestCase(TestCase):
+    def setUp(self):
+        cache.delete(ANALYTICS_CACHE_KEY)
+        self.bp_user = User.objects.create_user(username='bp', password='pass', role='BP')
+        self.lc_user = User.objects.create_user(username='lc', password='pass', role='LC')
+        LoanConfig.objects.create(min_amount=1000, max_amount=20000, interest_rate=10, duration_months=12, compound_frequency='M')
+        LoanFund.objects.create(provider=self.bp_user, amount=20000, status='A')
+        self.today = date(2025, 6, 15)
+        # Eight installments due by the as-of date and nothing paid: delinquent.
+        self.late = Loan.objects.create(customer=self.lc_user, amount=1200, term_months=12, interest_rate=0,
+                                        remaining_amount=1200, status='A', start_date=date(2024, 10, 1))
+        # Starts today: nothing due yet.
+        self.current = Loan.objects.create(customer=self.lc_user, amount=6000, term_months=6, interest_rate=12,
+                                           remaining_amount=6000, status='A', start_date=self.today)
+        start_schedules([self.late, self.current])
+        Loan.objects.create(customer=self.lc_user, amount=3000, term_months=12, interest_rate=10, remaining_amount=3000)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.bp_user)
+
+    def test_summary(self):
+        summary = portfolio_summary(today=self.today)
+        self.assertEqual(summary['loans']['A']['count'], 2)
+        self.assertEqual(summary['loans']['P']['amount'], 3000)
+        self.assertEqual(summary['outstanding_principal'], 7200)
+        self.assertEqual(summary['funds'], {'approved': 20000, 'lent': 7200, 'available': 12800, 'utilization': 0.36})
+        self.assertEqual(summary['delinquency']['loans'], 1)
+        self.assertAlmostEqual(summary['delinquency']['arrears'], 8 * 100, places=2)
+
+    def test_delinquency_follows_the_overdue_installments(self):
+        self.assertEqual(set(scan_overdue(as_of=self.today, dry_run=True)[0]), {self.late.id})
+        Payment.objects.create(loan=self.late, amount=300, reference_number='LATE-1')
+        post_payment(self.late, Decimal('300'))
+        self.assertEqual(portfolio_summary(today=self.today)['delinquency']['arrears'], 500)
+        with override_settings(LOAN_OVERDUE_GRACE_DAYS=60):
+            # Only the installments due by mid-April are overdue then.
+            self.assertEqual(portfolio_summary(today=self.today)['delinquency']['arrears'], 300)
+        post_payment(self.late, Decimal('500'))
+        self.assertEqual(portfolio_summary(today=self.today)['delinquency'], {'loans': 0, 'arrears': 0, 'rate': 0})
+
+    def test_cash_flow_matches_schedules(self):
+        summary = portfolio_summary(today=self.today)
+        expected = {}
+        for loan in (self.late, self.current):
+            for row in amortize(loan.amount, loan.interest_rate, loan.term_months, start_date=loan.start_date).to_records():
+                if row['due_date'] > self.today.isoformat():
+                    month = row['due_date'][:7]
+                    expected[month] = expected.get(month, 0) + row['interest_payment']
+        by_month = {row['month']: row['interest'] for row in summary['cash_flow']}
+        self.assertLessEqual(set(expected), set(by_month))
+        for month, interest in expected.items():
+            self.assertAlmostEqual(by_month[month], interest, places=1)
+        total_principal = sum(row['principal'] for row in summary['cash_flow'])
+        self.assertAlmostEqual(total_principal, 6000 + 400, places=1)
+
+    def test_prepaid_loans_are_projected_from_their_schedules(self):
+        schedule = self.current.apply_prepayment(Decimal('3000'), Loan.REDUCE_EMI, today=self.today)
+        Loan.objects.filter(pk=self.current.pk).update(total_paid=3000)
+        summary = portfolio_summary(today=self.today)
+        self.assertEqual(summary['delinquency']['loans'], 1)
+        total_principal = sum(row['principal'] for row in summary['cash_flow'])
+        self.assertAlmostEqual(total_principal, 3000 + 400, places=1)
+        by_month = {row['month']: row['interest'] for row in summary['cash_flow']}
+        self.assertAlmostEqual(by_month[schedule[0]['due_date'][:7]], schedule[0]['interest_payment'], places=2)
+
+    def test_endpoint_is_cached(self):
+        url = reverse('portfolio-analytics')
+        first = self.client.get(url, format='json')
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        with self.assertNumQueries(0):
+            self.client.get(url, format='json')
+        self.client.force_authenticate(user=self.lc_user)
+        self.assertEqual(self.client.get(url, format='json').status_code, status.HTTP_403_FORBIDDEN)
+
+
 class SampleViewTestCase(TestCase):
     def setUp(self):
         self.client = APIClient()
@@ -159,3 +1276,735 @@ class SampleViewTestCase(TestCase):
         response = self.client.get(url, format='json')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data.get('message'), 'Hello, DRF is working with custom models!')
+
+class AmortizationEngineTestCase(TestCase):
+    def reference_schedule(self, amount, rate, term, interval):
+        n = -(-term // interval)
+        r = (rate / 100) / (12 / interval)
+        emi = amount * r * (1 + r) ** n / ((1 + r) ** n - 1) if r else amount / n
+        balance = amount
+        rows = []
+        for i in range(1, n + 1):
+            interest = balance * r
+            principal = emi - interest
+            balance -= principal
+            rows.append((emi, principal, interest, max(balance, 0)))
+        return rows
+
+    def test_schedule_matches_reference_loop(self):
+        for frequency, interval in (('M', 1), ('Q', 3), ('A', 12)):
+            schedule = amortize(12000, 10, 36, compound_frequency=frequency, start_date=date(2025, 1, 1))
+            expected = self.reference_schedule(12000, 10, 36, interval)
+            self.assertEqual(len(schedule), len(expected))
+            for row, (emi, principal, interest, balance) in zip(schedule.to_records(), expected):
+                self.assertAlmostEqual(row['total_installment'], emi, places=2)
+                self.assertAlmostEqual(row['principal_payment'], principal, places=2)
+                self.assertAlmostEqual(row['interest_payment'], interest, places=2)
+                self.assertAlmostEqual(row['remaining_balance'], balance, places=2)
+
+    def test_due_dates_step_by_interval(self):
+        records = amortize(1000, 5, 6, compound_frequency='Q', start_date=date(2025, 1, 1)).to_records()
+        self.assertEqual([r['due_date'] for r in records], [
+            (date(2025, 1, 1) + timedelta(days=90)).isoformat(),
+            (date(2025, 1, 1) + timedelta(days=180)).isoformat(),
+        ])
+
+    def test_zero_rate(self):
+        records = amortize(1200, 0, 12).to_records()
+        self.assertEqual(records[0]['total_installment'], 100.0)
+        self.assertEqual(records[-1]['remaining_balance'], 0.0)
+
+    def test_batch_matches_single_loans(self):
+        loans = [(5000, 10, 12), (12000, 7.5, 36), (800, 0, 6)]
+        batch = amortize_batch(*zip(*loans))
+        self.assertEqual(batch.payment.shape, (3, 36))
+        for i, (amount, rate, term) in enumerate(loans):
+            single = amortize(amount, rate, term)
+            n = batch.periods[i]
+            self.assertEqual(n, len(single))
+            self.assertTrue(np.allclose(batch.interest[i, :n], single.interest))
+            self.assertTrue(np.allclose(batch.balance[i, :n], single.balance))
+            self.assertFalse(batch.mask[i, n:].any())
+            self.assertEqual(batch.payment[i, n:].sum(), 0)
+
+
+class ExactAmortizationTestCase(TestCase):
+    """
+    Property checks over seeded random loans: every exact schedule must
+    balance to the cent, whatever the principal, rate, term or frequency.
+    """
+
+    def random_loans(self, count, seed):
+        rng = random.Random(seed)
+        return [
+            (
+                Decimal(rng.randrange(100, 100000000)) / 100,
+                Decimal(rng.randrange(0, 3000)) / 100,
+                rng.randrange(1, 481),
+                rng.choice('MQA'),
+            )
+            for _ in range(count)
+        ]
+
+    def test_installments_sum_to_principal_plus_interest(self):
+        for amount, rate, term, frequency in self.random_loans(300, seed=15):
+            with self.subTest(amount=amount, rate=rate, term=term, frequency=frequency):
+                schedule = amortize(amount, rate, term, compound_frequency=frequency, exact=True)
+                cents = int(amount * 100)
+                self.assertEqual(schedule.principal.sum(), cents)
+                self.assertEqual(schedule.payment.sum(), cents + schedule.interest.sum())
+                self.assertTrue((schedule.payment == schedule.principal + schedule.interest).all())
+                self.assertEqual(schedule.balance[-1], 0)
+                self.assertTrue((schedule.balance >= 0).all())
+                self.assertTrue((np.diff(np.concatenate(([cents], schedule.balance))) <= 0).all())
+
+    def test_interest_is_charged_on_the_actual_balance(self):
+        for amount, rate, term, frequency in self.random_loans(50, seed=16):
+            schedule = amortize(amount, rate, term, compound_frequency=frequency, exact=True)
+            r = (float(rate) / 100) / (12 / payment_interval(frequency))
+            opening = np.concatenate(([int(amount * 100)], schedule.balance[:-1]))
+            self.assertTrue((np.abs(schedule.interest - opening * r) <= 0.5 + 1e-6).all())
+
+    def test_only_the_last_installment_absorbs_the_residual(self):
+        for amount, rate, term, frequency in self.random_loans(100, seed=17):
+            if not rate:
+                continue
+            schedule = amortize(amount, rate, term, compound_frequency=frequency, exact=True)
+            self.assertTrue((schedule.payment[:-1] == schedule.payment[0]).all())
+            # Each period is off by at most a cent, compounded over the remaining term.
+            r = (float(rate) / 100) / (12 / payment_interval(frequency))
+            bound = ((1 + r) ** len(schedule) - 1) / r
+            self.assertLessEqual(abs(schedule.payment[-1] - schedule.payment[0]), bound)
+            if frequency == 'M':
+                self.assertEqual(schedule.payment[0], round(float(sophisticated_emi(amount, rate, term)) * 100))
+
+    def test_records_match_float_engine(self):
+        exact = amortize(12000, 10, 36, start_date=date(2025, 1, 1), exact=True).to_records()
+        approx = amortize(12000, 10, 36, start_date=date(2025, 1, 1)).to_records()
+        for exact_row, approx_row in zip(exact, approx):
+            self.assertEqual(exact_row['due_date'], approx_row['due_date'])
+            self.assertAlmostEqual(exact_row['remaining_balance'], approx_row['remaining_balance'], delta=0.2)
+        self.assertEqual(exact[-1]['remaining_balance'], 0.0)
+        total = sum(Decimal(str(row['total_installment'])) for row in exact)
+        interest = sum(Decimal(str(row['interest_payment'])) for row in exact)
+        self.assertEqual(total, Decimal('12000') + interest)
+
+    def test_batch_matches_single_loans(self):
+        loans = self.random_loans(40, seed=18)
+        for frequency in 'MQA':
+            amounts, rates, terms = zip(*[(a, r, t) for a, r, t, _ in loans])
+            batch = amortize_batch(amounts, rates, terms, frequency, exact=True)
+            for i, (amount, rate, term) in enumerate(zip(amounts, rates, terms)):
+                single = amortize(amount, rate, term, compound_frequency=frequency, exact=True)
+                n = batch.periods[i]
+                self.assertTrue((batch.payment[i, :n] == single.payment).all())
+                self.assertTrue((batch.balance[i, :n] == single.balance).all())
+                self.assertEqual(batch.payment[i, n:].sum(), 0)
+
+    @override_settings(LOAN_EXACT_AMORTIZATION=True)
+    def test_stored_schedule_uses_exact_mode(self):
+        customer = User.objects.create_user(username='lc', password='pass', role='LC')
+        LoanConfig.objects.create(min_amount=1000, max_amount=20000, interest_rate=10, duration_months=12, compound_frequency='M')
+        loan = Loan.objects.create(customer=customer, amount=Decimal('9999.99'), term_months=60, interest_rate=Decimal('13.37'),
+                                   remaining_amount=Decimal('9999.99'))
+        schedule = loan.generate_payment_schedule()
+        principal = sum(Decimal(str(row['principal_payment'])) for row in schedule)
+        self.assertEqual(principal, Decimal('9999.99'))
+        self.assertEqual(schedule[-1]['remaining_balance'], 0.0)
+        with override_settings(LOAN_EXACT_AMORTIZATION=False):
+            self.assertNotEqual(loan.schedule_cache_key(get_active_config()), loan.schedule_key)
+
+
+@override_settings(LOAN_RESPONSE_CACHE=True)
+class ResponseCacheTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        verified_keys.clear()
+        self.bp_user = User.objects.create_user(username='bp', password='pass', role='BP')
+        self.other_bp = User.objects.create_user(username='bp2', password='pass', role='BP')
+        self.lc_user = User.objects.create_user(username='lc', password='pass', role='LC')
+        self.other_lc = User.objects.create_user(username='lc2', password='pass', role='LC')
+        self.config = LoanConfig.objects.create(min_amount=1000, max_amount=20000, interest_rate=10, duration_months=12, compound_frequency='M')
+        LoanFund.objects.create(provider=self.bp_user, amount=50000, status='A')
+        self.loan = Loan.objects.create(customer=self.lc_user, amount=5000, term_months=12, interest_rate=10,
+                                        remaining_amount=5000, status='A', start_date=date.today())
+        self.pending = Loan.objects.create(customer=self.other_lc, amount=3000, term_months=12, interest_rate=10, remaining_amount=3000)
+        _, self.raw_key = ApiKey.issue(self.bp_user, name='poller')
+        self.client = APIClient()
+
+    def get(self, url, user=None, **headers):
+        self.client.force_authenticate(user=user or self.bp_user)
+        return self.client.get(url, format='json', **headers)
+
+    def test_conditional_get_with_etag(self):
+        response = self.get(reverse('loan-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Cache-Control'], 'private, no-cache')
+        again = self.get(reverse('loan-list'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(again.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(again.content, b'')
+
+    def test_conditional_get_with_last_modified(self):
+        response = self.get(reverse('loan-list'))
+        self.assertIn('Last-Modified', response)
+        again = self.get(reverse('loan-list'), HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(again.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_cache_hit_runs_no_queries(self):
+        headers = {'HTTP_AUTHORIZATION': f'Bearer {self.raw_key}'}
+        first = self.client.get(reverse('loan-list'), format='json', **headers)
+        with self.assertNumQueries(0):
+            second = self.client.get(reverse('loan-list'), format='json', **headers)
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second['ETag'], first['ETag'])
+
+    def test_customers_get_their_own_entries(self):
+        mine = json.loads(self.get(reverse('loan-list'), self.lc_user).content)
+        theirs = json.loads(self.get(reverse('loan-list'), self.other_lc).content)
+        self.assertEqual([row['id'] for row in mine['results']], [self.loan.id])
+        self.assertEqual([row['id'] for row in theirs['results']], [self.pending.id])
+
+    def test_bank_personnel_share_an_entry(self):
+        self.get(reverse('loan-list'))
+        self.client.force_authenticate(user=self.other_bp)
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('loan-list'), format='json')
+        self.assertEqual(len(json.loads(response.content)['results']), 2)
+
+    def remaining(self, user=None):
+        rows = json.loads(self.get(reverse('loan-list'), user).content)['results']
+        return {row['id']: float(row['remaining_amount']) for row in rows}
+
+    def test_payment_invalidates(self):
+        self.assertEqual(self.remaining(self.lc_user)[self.loan.id], 5000)
+        self.assertEqual(self.remaining()[self.loan.id], 5000)
+        self.client.force_authenticate(user=self.lc_user)
+        self.client.post(reverse('payment-create'), {'loan': self.loan.id, 'amount': 1000}, format='json')
+        self.assertEqual(self.remaining(self.lc_user)[self.loan.id], 4000)
+        self.assertEqual(self.remaining()[self.loan.id], 4000)
+
+    def test_payment_of_one_customer_keeps_the_others_cached(self):
+        self.remaining(self.other_lc)
+        post_payment(self.loan, Decimal('1000'))
+        self.client.force_authenticate(user=self.other_lc)
+        with self.assertNumQueries(0):
+            self.client.get(reverse('loan-list'), format='json')
+
+    def test_bulk_ingest_invalidates(self):
+        self.remaining(self.lc_user)
+        body = json.dumps({'loan': self.loan.id, 'amount': '500', 'reference_number': 'RC-1'})
+        self.client.force_authenticate(user=self.bp_user)
+        self.client.post(reverse('payment-bulk-create'), body, content_type='application/x-ndjson')
+        self.assertEqual(self.remaining(self.lc_user)[self.loan.id], 4500)
+
+    def test_approval_invalidates(self):
+        before = self.get(reverse('loan-list'), self.other_lc)
+        self.client.force_authenticate(user=self.bp_user)
+        self.client.patch(reverse('loanapproval-detail', args=[self.pending.id]), {'status': 'A'}, format='json')
+        after = self.get(reverse('loan-list'), self.other_lc, HTTP_IF_NONE_MATCH=before['ETag'])
+        self.assertEqual(after.status_code, status.HTTP_200_OK)
+        self.assertEqual(json.loads(after.content)['results'][0]['status'], 'A')
+
+    def test_fund_save_invalidates(self):
+        self.assertEqual(len(json.loads(self.get(reverse('loanfund-list')).content)['results']), 1)
+        LoanFund.objects.create(provider=self.bp_user, amount=1000, status='P')
+        self.assertEqual(len(json.loads(self.get(reverse('loanfund-list')).content)['results']), 2)
+
+    def test_new_config_version_keeps_cached_loans(self):
+        self.get(reverse('loan-list'))
+        self.client.patch(reverse('loanconfig-detail'), {'compound_frequency': 'Q'}, format='json')
+        with self.assertNumQueries(0):
+            self.client.get(reverse('loan-list'), format='json')
+
+    def test_schedule_is_cached_and_invalidated(self):
+        url = reverse('paymentschedule', args=[self.loan.id])
+        first = self.get(url, self.lc_user)
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertIn('Last-Modified', first)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url, format='json').content, first.content)
+        self.assertEqual(self.get(url, self.other_lc).status_code, status.HTTP_403_FORBIDDEN)
+        self.loan.refresh_from_db()
+        self.loan.apply_prepayment(Decimal('1000'))
+        self.assertNotEqual(self.get(url, self.lc_user).content, first.content)
+
+    @override_settings(LOAN_RESPONSE_CACHE=False)
+    def test_disabled_cache_renders_every_request(self):
+        first = self.get(reverse('loan-list'))
+        self.assertIn('ETag', first)
+        self.assertIn('Last-Modified', first)
+        with CaptureQueriesContext(connection) as ctx:
+            again = self.client.get(reverse('loan-list'), format='json', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(again.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertGreater(len(ctx.captured_queries), 0)
+        self.loan.amount = 6000
+        self.loan.save()
+        changed = self.client.get(reverse('loan-list'), format='json', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(changed.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(changed['ETag'], first['ETag'])
+
+    def test_check_requires_a_shared_cache(self):
+        self.assertEqual([error.id for error in check_response_cache(None)], ['loans.E001'])
+        redis = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://cache:6379'}}
+        with override_settings(CACHES=redis):
+            self.assertEqual(check_response_cache(None), [])
+        with override_settings(LOAN_RESPONSE_CACHE=False):
+            self.assertEqual(check_response_cache(None), [])
+
+
+class LoanOriginationTestCase(TestCase):
+    def setUp(self):
+        self.lc_user = User.objects.create_user(username='lc', password='pass', role='LC')
+        self.bp_user = User.objects.create_user(username='bp', password='pass', role='BP')
+        lp_user = User.objects.create_user(username='lp', password='pass', role='LP')
+        self.config = LoanConfig.objects.create(min_amount=1000, max_amount=20000, interest_rate=12, duration_months=36, compound_frequency='M')
+        LoanFund.objects.create(provider=lp_user, amount=15000, status='A')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.lc_user)
+
+    def apply(self, **data):
+        return self.client.post(reverse('loan-origination'), {'amount': 5000, 'term_months': 24, **data}, format='json')
+
+    def test_application_creates_a_pending_priced_loan(self):
+        response = self.apply()
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        loan = Loan.objects.get(pk=response.data['id'])
+        self.assertEqual((loan.customer, loan.config, loan.status), (self.lc_user, self.config, 'P'))
+        self.assertEqual((loan.interest_rate, loan.remaining_amount), (Decimal('12'), Decimal('5000')))
+        self.assertEqual(response.data['emi'], float(sophisticated_emi(5000, 12, 24)))
+
+    def test_application_is_validated_against_the_product_and_funds(self):
+        for data, field in (
+            ({'amount': 500}, 'amount'),
+            ({'amount': 25000}, 'amount'),
+            ({'amount': 16000}, 'amount'),
+            ({'term_months': 48}, 'term_months'),
+            ({'term_months': 0}, 'term_months'),
+            ({'product': 'missing'}, 'product'),
+        ):
+            response = self.apply(**data)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, data)
+            self.assertIn(field, response.data['message'], data)
+        self.assertFalse(Loan.objects.exists())
+
+    def test_only_customers_apply(self):
+        self.client.force_authenticate(user=self.bp_user)
+        self.assertEqual(self.apply().status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_quote_grid_matches_scalar_emi(self):
+        amounts = [1000 + 500 * i for i in range(50)]
+        terms = list(range(6, 56))
+        started = time.perf_counter()
+        response = self.client.get(reverse('loan-quote'), {
+            'amounts': ','.join(map(str, amounts)), 'terms': ','.join(map(str, terms)),
+        })
+        self.assertLess(time.perf_counter() - started, 0.5)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        emi = np.array(response.data['emi'])
+        self.assertEqual(emi.shape, (50, 50))
+        for i, j in ((0, 0), (10, 18), (49, 49)):
+            expected = float(sophisticated_emi(amounts[i], 12, terms[j]))
+            self.assertEqual(emi[i, j], expected)
+            self.assertAlmostEqual(response.data['total_interest'][i][j], expected * terms[j] - amounts[i], places=2)
+        eligible = np.array(response.data['eligible'])
+        self.assertTrue(eligible[0, 0])
+        self.assertFalse(eligible[0, 31])   # 37 months > duration
+        self.assertFalse(eligible[29, 0])   # 15500 > available funds
+        self.assertEqual(eligible.sum(), 29 * 31)
+
+    def test_quote_rejects_bad_grids(self):
+        url = reverse('loan-quote')
+        for params in (
+            {'terms': '12'},
+            {'amounts': '1000,abc', 'terms': '12'},
+            {'amounts': '1000', 'terms': '-12'},
+            {'amounts': ','.join(['1000'] * 51), 'terms': '12'},
+            {'amounts': 'nan', 'terms': '12'},
+            {'amounts': 'inf', 'terms': '12'},
+            {'amounts': '1000,-inf', 'terms': '12'},
+        ):
+            self.assertEqual(self.client.get(url, params).status_code, status.HTTP_400_BAD_REQUEST, params)
+        response = self.client.get(url, {'amounts': '1000', 'terms': '12', 'product': 'missing'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_quote_rejects_values_over_the_caps(self):
+        url = reverse('loan-quote')
+        for params in (
+            {'amounts': '1e308', 'terms': '12'},
+            {'amounts': '10000000000000', 'terms': '12'},
+            {'amounts': '1000', 'terms': '100000'},
+            {'amounts': '1000', 'terms': '99999999999999999999999'},
+        ):
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, params)
+            self.assertIn('at most', str(response.data))
+        response = self.client.get(url, {'amounts': '9999999999999.99', 'terms': '600'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(np.isfinite(response.data['emi']).all())
+
+    def test_quote_for_another_product(self):
+        LoanConfig.objects.create(product='yearly', min_amount=1000, max_amount=20000, interest_rate=6, duration_months=60, compound_frequency='A')
+        response = self.client.get(reverse('loan-quote'), {'amounts': '12000', 'terms': '48', 'product': 'yearly'})
+        self.assertEqual(response.data['compound_frequency'], 'A')
+        self.assertEqual(response.data['emi'], [[float(sophisticated_emi(12000, 6, 48, 'A'))]])
+
+
+class BulkApprovalTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.bp_user = User.objects.create_user(username='bp', password='pass', role='BP')
+        self.lp_user = User.objects.create_user(username='lp', password='pass', role='LP')
+        self.lc_user = User.objects.create_user(username='lc', password='pass', role='LC')
+        self.other_lc = User.objects.create_user(username='lc2', password='pass', role='LC')
+        LoanConfig.objects.create(min_amount=1000, max_amount=20000, interest_rate=10, duration_months=12, compound_frequency='M')
+        LoanFund.objects.create(provider=self.lp_user, amount=10000, status='A')
+        self.loans = [
+            Loan.objects.create(customer=customer, amount=amount, term_months=12, interest_rate=10, remaining_amount=amount)
+            for customer, amount in (
+                (self.lc_user, 4000), (self.other_lc, 5000), (self.lc_user, 3000), (self.lc_user, 1000),
+            )
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.bp_user)
+
+    def decide(self, url_name, **data):
+        return self.client.post(reverse(url_name), data, format='json')
+
+    def statuses(self):
+        return list(Loan.objects.order_by('id').values_list('status', flat=True))
+
+    def test_approvals_spend_capacity_in_id_order(self):
+        approved = Loan.objects.create(customer=self.lc_user, amount=1000, term_months=12, interest_rate=10,
+                                       remaining_amount=1000, status='R')
+        ids = [loan.id for loan in reversed(self.loans)] + [approved.id, 99999]
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.decide('loanapproval-bulk', ids=ids, status='A')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((response.data['approved'], response.data['skipped']), (3, 3))
+        outcomes = {result['id']: result['status'] for result in response.data['results']}
+        self.assertEqual([outcomes[loan.id] for loan in self.loans], ['approved', 'approved', 'skipped', 'approved'])
+        self.assertEqual([result['id'] for result in response.data['results']], ids)
+        self.assertIn('not found', str(response.data['results'][-1]['errors']))
+        self.assertEqual(self.statuses(), ['A', 'A', 'P', 'A', 'R'])
+        ledger = CapacityLedger.objects.get()
+        self.assertEqual(ledger.approved_loans, Decimal('10000'))
+        CapacityLedger.rebuild()
+        self.assertEqual(CapacityLedger.objects.get().approved_loans, ledger.approved_loans)
+        updates = [q for q in ctx.captured_queries if q['sql'].startswith('UPDATE "loans_loan" SET "status"')]
+        self.assertEqual(len(updates), 1)
+
+    def test_loans_that_do_not_fit_are_skipped_and_later_ones_still_approved(self):
+        # 10000 available: 4000 and 5000 fit, 3000 no longer does, 1000 still does.
+        response = self.decide('loanapproval-bulk', filter={}, status='A')
+        self.assertEqual([result['status'] for result in response.data['results']],
+                         ['approved', 'approved', 'skipped', 'approved'])
+        self.assertEqual(self.statuses(), ['A', 'A', 'P', 'A'])
+
+    def test_rejection_by_filter(self):
+        response = self.decide('loanapproval-bulk', filter={'customer': self.lc_user.id, 'max_amount': '3000'}, status='R')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([result['id'] for result in response.data['results']], [self.loans[2].id, self.loans[3].id])
+        self.assertEqual(self.statuses(), ['P', 'P', 'R', 'R'])
+        self.assertEqual(CapacityLedger.objects.get().approved_loans, 0)
+
+    def test_bulk_approval_invalidates_cached_listings(self):
+        self.client.force_authenticate(user=self.other_lc)
+        self.client.get(reverse('loan-list'), format='json')
+        self.client.force_authenticate(user=self.bp_user)
+        self.decide('loanapproval-bulk', filter={'customer': self.other_lc.id}, status='A')
+        self.client.force_authenticate(user=self.other_lc)
+        rows = json.loads(self.client.get(reverse('loan-list'), format='json').content)['results']
+        self.assertEqual([row['status'] for row in rows], ['A'])
+
+    def test_fund_approvals_add_capacity(self):
+        funds = [LoanFund.objects.create(provider=self.lp_user, amount=amount) for amount in (2000, 3000)]
+        response = self.decide('loanfundapproval-bulk', ids=[fund.id for fund in funds], status='A')
+        self.assertEqual(response.data['approved'], 2)
+        self.assertEqual(CapacityLedger.objects.get().approved_funds, Decimal('15000'))
+        response = self.decide('loanapproval-bulk', filter={}, status='A')
+        self.assertEqual(response.data['approved'], 4)
+
+    def test_invalid_requests(self):
+        for data in (
+            {'status': 'A'},
+            {'status': 'A', 'ids': [1], 'filter': {}},
+            {'status': 'X', 'ids': [1]},
+            {'status': 'A', 'ids': []},
+            {'status': 'A', 'filter': {'min_amount': 'lots'}},
+        ):
+            self.assertEqual(self.decide('loanapproval-bulk', **data).status_code, status.HTTP_400_BAD_REQUEST, data)
+        with override_settings(LOAN_BULK_DECISION_MAX=2):
+            self.assertEqual(self.decide('loanapproval-bulk', ids=[1, 2, 3], status='A').status_code,
+                             status.HTTP_400_BAD_REQUEST)
+            self.assertEqual(self.decide('loanapproval-bulk', filter={}, status='R').data['rejected'], 2)
+        self.client.force_authenticate(user=self.lc_user)
+        self.assertEqual(self.decide('loanapproval-bulk', ids=[1], status='A').status_code, status.HTTP_403_FORBIDDEN)
+
+
+class InstallmentTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.bp_user = User.objects.create_user(username='bp', password='pass', role='BP')
+        self.lp_user = User.objects.create_user(username='lp', password='pass', role='LP')
+        self.lc_user = User.objects.create_user(username='lc', password='pass', role='LC')
+        LoanConfig.objects.create(min_amount=1000, max_amount=20000, interest_rate=10, duration_months=12, compound_frequency='M')
+        LoanFund.objects.create(provider=self.lp_user, amount=50000, status='A')
+        self.loan = Loan.objects.create(customer=self.lc_user, amount=12000, term_months=12, interest_rate=10, remaining_amount=12000)
+        self.client = APIClient()
+
+    def started_loan(self, days_ago):
+        loan = Loan.objects.create(customer=self.lc_user, amount=6000, term_months=6, interest_rate=10,
+                                   remaining_amount=6000, status='A', start_date=date.today() - timedelta(days=days_ago))
+        start_schedules([loan])
+        return loan
+
+    def pay(self, loan, amount):
+        self.client.force_authenticate(user=self.lc_user)
+        return self.client.post(reverse('payment-create'), {'loan': loan.id, 'amount': amount}, format='json')
+
+    def test_approval_stores_installments(self):
+        self.client.force_authenticate(user=self.bp_user)
+        response = self.client.patch(reverse('loanapproval-detail', args=[self.loan.id]), {'status': 'A'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.loan.refresh_from_db()
+        self.assertEqual(self.loan.start_date, date.today())
+        installments = list(self.loan.installments.order_by('number'))
+        self.assertEqual(len(installments), 12)
+        self.assertEqual([i.due_date.isoformat() for i in installments], [row['due_date'] for row in self.loan.payment_schedule])
+        self.assertEqual(installments[-1].cumulative_due, sum(i.amount for i in installments))
+        self.assertEqual(self.loan.get_payment_schedule(), self.loan.payment_schedule)
+
+        response = self.client.patch(reverse('loanapproval-detail', args=[self.loan.id]), {'status': 'R'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(self.loan.installments.exists())
+
+    def test_bulk_approval_stores_installments(self):
+        self.client.force_authenticate(user=self.bp_user)
+        self.client.post(reverse('loanapproval-bulk'), {'ids': [self.loan.id], 'status': 'A'}, format='json')
+        self.loan.refresh_from_db()
+        self.assertEqual(self.loan.start_date, date.today())
+        self.assertFalse(self.loan.installments.exists())
+        run_pending()
+        self.assertEqual(self.loan.installments.count(), 12)
+
+    def test_payments_mark_installments_paid(self):
+        loan = self.started_loan(days_ago=0)
+        emi = loan.installments.get(number=1).amount
+        self.pay(loan, str(emi * 2))
+        self.assertEqual(list(loan.installments.filter(status=Installment.PAID).values_list('number', flat=True)), [1, 2])
+        self.pay(loan, '1.00')
+        self.assertEqual(loan.installments.filter(status=Installment.PAID).count(), 2)
+
+        response = self.client.post(reverse('payment-bulk-create'), [{'loan': loan.id, 'amount': str(emi)}], format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.client.force_authenticate(user=self.bp_user)
+        self.client.post(reverse('payment-bulk-create'), [{'loan': loan.id, 'amount': str(emi)}], format='json')
+        self.assertEqual(loan.installments.filter(status=Installment.PAID).count(), 3)
+
+    def test_prepayment_does_not_settle_later_installments(self):
+        loan = self.started_loan(days_ago=0)
+        self.client.force_authenticate(user=self.lc_user)
+        self.client.post(reverse('payment-create'), {'loan': loan.id, 'amount': '3000.00', 'prepayment': Loan.REDUCE_EMI},
+                         format='json')
+        loan.refresh_from_db()
+        installments = list(loan.installments.order_by('number'))
+        self.assertEqual([i.amount for i in installments], [Decimal(str(row['total_installment'])) for row in loan.payment_schedule])
+        self.assertEqual(installments[0].cumulative_due, Decimal('3000.00') + installments[0].amount)
+        self.assertFalse(loan.installments.filter(status=Installment.PAID).exists())
+
+    def test_prepayment_does_not_settle_overdue_installments(self):
+        loan = self.started_loan(days_ago=95)
+        overdue = sum(i.amount for i in loan.installments.filter(number__lte=3))
+        self.client.force_authenticate(user=self.lc_user)
+        response = self.client.post(reverse('payment-create'),
+                                    {'loan': loan.id, 'amount': '1000.00', 'prepayment': Loan.REDUCE_EMI}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        loan.refresh_from_db()
+        self.assertEqual(loan.prepayments, [{'installment': 4, 'amount': '1000.00', 'option': Loan.REDUCE_EMI, 'unpaid': 1}])
+        self.assertFalse(loan.installments.filter(status=Installment.PAID).exists())
+        self.assertEqual(scan_overdue()[0][loan.id][1], 3)
+
+        self.pay(loan, str(overdue))
+        self.assertEqual(list(loan.installments.filter(status=Installment.PAID).values_list('number', flat=True)), [1, 2, 3])
+        self.assertEqual(scan_overdue()[1], [loan.id])
+        stored = list(loan.installments.order_by('number').values_list('cumulative_due', flat=True))
+        loan.generate_payment_schedule()
+        self.assertEqual(list(loan.installments.order_by('number').values_list('cumulative_due', flat=True)), stored)
+
+    def test_scan_flags_and_clears_delinquent_loans(self):
+        late = self.started_loan(days_ago=95)
+        current = self.started_loan(days_ago=10)
+        with self.assertNumQueries(3):
+            delinquent, cured = scan_overdue()
+        first_due = late.installments.get(number=1).due_date
+        self.assertEqual(delinquent, {late.id: (first_due, 3)})
+        self.assertEqual(cured, [])
+        late.refresh_from_db()
+        current.refresh_from_db()
+        self.assertEqual(late.delinquent_since, first_due)
+        self.assertIsNone(current.delinquent_since)
+        self.assertEqual(scan_overdue(grace_days=10)[0][late.id][1], 2)
+
+        # Catching up clears the flag on the next scan.
+        self.pay(late, str(late.installments.get(number=3).cumulative_due))
+        delinquent, cured = scan_overdue()
+        self.assertEqual((delinquent, cured), ({}, [late.id]))
+        late.refresh_from_db()
+        self.assertIsNone(late.delinquent_since)
+
+    def test_overdue_query_uses_due_date_index(self):
+        overdue = Installment.objects.filter(status=Installment.DUE, due_date__lt=date.today())
+        plan = overdue.explain()
+        self.assertIn('installment_due_idx', plan)
+
+    def test_scan_overdue_command_backfills(self):
+        loan = Loan.objects.create(customer=self.lc_user, amount=6000, term_months=6, interest_rate=10,
+                                   remaining_amount=6000, status='A')
+        Loan.objects.filter(pk=loan.pk).update(created_at=timezone.now() - timedelta(days=65))
+        out = io.StringIO()
+        call_command('scan_overdue', '--dry-run', stdout=out)
+        self.assertIn('Found 0 delinquent loans', out.getvalue())
+        call_command('scan_overdue', '--backfill', stdout=out)
+        self.assertIn('Stored installments for 1 loans', out.getvalue())
+        self.assertIn(f'Loan {loan.id}: 2 overdue installments', out.getvalue())
+        loan.refresh_from_db()
+        self.assertEqual(loan.start_date, (timezone.now() - timedelta(days=65)).date())
+        self.assertIsNotNone(loan.delinquent_since)
+
+
+class _View:
+    def initial(self, request, *args, **kwargs):
+        pass
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        return response
+
+
+class ReplicaView(ReplicaReadMixin, _View):
+    pass
+
+
+class ReplicaRouterTestCase(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        # Any configured alias can play the replica for the routing decisions.
+        self.router = ReplicaRouter(replica='default')
+
+    def test_reads_use_the_replica_only_inside_replica_reads(self):
+        self.assertIsNone(self.router.db_for_read(Loan))
+        with replica_reads():
+            self.assertEqual(self.router.db_for_read(Loan), 'default')
+        with replica_reads(pinned=True):
+            self.assertIsNone(self.router.db_for_read(Loan))
+        with replica_reads():
+            self.assertIsNone(ReplicaRouter(replica='missing').db_for_read(Loan))
+
+    def test_write_pins_the_rest_of_the_request(self):
+        with replica_reads():
+            self.assertEqual(self.router.db_for_write(Loan), 'default')
+            self.assertIsNone(self.router.db_for_read(Loan))
+        with replica_reads():
+            self.assertEqual(self.router.db_for_read(Loan), 'default')
+
+    def test_replica_is_never_migrated(self):
+        self.assertFalse(self.router.allow_migrate('default', 'loans'))
+        self.assertIsNone(ReplicaRouter().allow_migrate('default', 'loans'))
+
+    def test_views_read_the_replica_only_with_a_shared_cache(self):
+        request = SimpleNamespace(user=SimpleNamespace(pk=7, is_authenticated=True))
+        for shared, database in ((True, 'default'), (False, None)):
+            view = ReplicaView()
+            with mock.patch('loans.routers.shared_cache', return_value=shared):
+                view.initial(request)
+                self.assertEqual(ReplicaRouter(replica='default').db_for_read(Loan), database)
+                view.finalize_response(request, None)
+            self.assertIsNone(self.router.db_for_read(Loan))
+
+    def test_replica_without_a_shared_cache_is_reported(self):
+        with mock.patch.dict(settings.DATABASES, {'replica': settings.DATABASES['default']}):
+            self.assertEqual([warning.id for warning in check_replica_pins(None)], ['loans.W001'])
+            with mock.patch('loans.checks.shared_cache', return_value=True):
+                self.assertEqual(check_replica_pins(None), [])
+
+    def test_middleware_pins_users_after_writes(self):
+        user = SimpleNamespace(pk=7, is_authenticated=True)
+        factory = RequestFactory()
+        for method, status_code, pinned in (('get', 200, False), ('post', 400, False), ('post', 201, True)):
+            cache.clear()
+            request = getattr(factory, method)('/api/loans/')
+            request.user = user
+            PrimaryPinMiddleware(lambda request: SimpleNamespace(status_code=status_code))(request)
+            self.assertEqual(is_pinned(user.pk), pinned)
+
+
+@skipUnless('replica' in settings.DATABASES, 'Set DATABASE_REPLICA_NAME to configure a replica alias.')
+# The test runs in one process, so its LocMem cache is shared by every "worker".
+@mock.patch('loans.routers.shared_cache', new=lambda: True)
+class ReplicaReadsTestCase(TransactionTestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        cache.clear()
+        self.bp_user = User.objects.create_user(username='bp', password='pass', role='BP')
+        self.lc_user = User.objects.create_user(username='lc', password='pass', role='LC')
+        LoanConfig.objects.create(min_amount=1000, max_amount=20000, interest_rate=10, duration_months=12, compound_frequency='M')
+        self.loan = Loan.objects.create(customer=self.lc_user, amount=5000, term_months=12, interest_rate=10,
+                                        remaining_amount=5000, status='A')
+        self.client = APIClient()
+
+    def replica_queries(self, url):
+        with CaptureQueriesContext(connections['replica']) as ctx:
+            response = self.client.get(url, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(ctx.captured_queries)
+
+    def test_list_schedule_and_analytics_read_the_replica(self):
+        self.client.force_authenticate(user=self.bp_user)
+        for url in (reverse('loan-list'), reverse('loanfund-list'), reverse('portfolio-analytics')):
+            self.assertGreater(self.replica_queries(url), 0, url)
+        self.client.force_authenticate(user=self.lc_user)
+        self.assertGreater(self.replica_queries(reverse('paymentschedule', args=[self.loan.id])), 0)
+
+    def test_reads_after_a_write_use_the_primary(self):
+        self.client.force_authenticate(user=self.lc_user)
+        response = self.client.post(reverse('payment-create'), {'loan': self.loan.id, 'amount': '100.00'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.replica_queries(reverse('loan-list')), 0)
+        cache.clear()
+        self.assertGreater(self.replica_queries(reverse('loan-list')), 0)
+
+
+class LoanConfigVersionsMigrationTestCase(TransactionTestCase):
+    migrate_from = ('loans', '0009_loan_updated_at')
+    migrate_to = ('loans', '0010_loanconfig_versions')
+
+    def migrate(self, target):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate([target])
+        return executor.loader.project_state(target).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes('loans'))
+
+    def test_config_in_use_becomes_current_version(self):
+        apps = self.migrate(self.migrate_from)
+        User = apps.get_model('loans', 'User')
+        LoanConfig = apps.get_model('loans', 'LoanConfig')
+        Loan = apps.get_model('loans', 'Loan')
+        customer = User.objects.create(username='lc', role='LC')
+        in_use = LoanConfig.objects.create(min_amount=1000, max_amount=20000, interest_rate=10, duration_months=12,
+                                           compound_frequency='M')
+        unused = LoanConfig.objects.create(min_amount=1000, max_amount=20000, interest_rate=25, duration_months=12,
+                                           compound_frequency='A')
+        loan = Loan.objects.create(customer=customer, amount=5000, term_months=12, interest_rate=10, remaining_amount=5000)
+
+        apps = self.migrate(self.migrate_to)
+        LoanConfig = apps.get_model('loans', 'LoanConfig')
+        Loan = apps.get_model('loans', 'Loan')
+        self.assertEqual(LoanConfig.objects.get(pk=in_use.pk).version, 2)
+        self.assertEqual(LoanConfig.objects.get(pk=unused.pk).version, 1)
+        self.assertEqual(LoanConfig.objects.order_by('-version').first().pk, in_use.pk)
+        self.assertEqual(Loan.objects.get(pk=loan.pk).config_id, in_use.pk)
@@ -5,22 +5,50 @@ from .views import (
     sample_view,
     LoanFundListView,
     LoanListView,
+    LoanOriginationView,
+    LoanQuoteView,
     PaymentCreateView,
+    PaymentBulkCreateView,
     LoanConfigDetailView,
+    LoanConfigListCreateView,
     LoanApprovalUpdateView,
     LoanFundApprovalUpdateView,
+    LoanBulkApprovalView,
+    LoanFundBulkApprovalView,
     PaymentScheduleView,
+    ExportView,
+    PortfolioAnalyticsView,
+    MetricsView,
+)
+
+from .async_views import (
+    AsyncLoanFundListView,
+    AsyncLoanListView,
+    AsyncPaymentScheduleView,
 )
 
 urlpatterns = [
     path('sample/', sample_view, name='sample'),
     path('loanfunds/', LoanFundListView.as_view(), name='loanfund-list'),
     path('loans/', LoanListView.as_view(), name='loan-list'),
+    path('loans/apply/', LoanOriginationView.as_view(), name='loan-origination'),
+    path('loans/quote/', LoanQuoteView.as_view(), name='loan-quote'),
     path('payments/', PaymentCreateView.as_view(), name='payment-create'),
+    path('payments/bulk/', PaymentBulkCreateView.as_view(), name='payment-bulk-create'),
     path('loanconfig/', LoanConfigDetailView.as_view(), name='loanconfig-detail'),
+    path('loanconfigs/', LoanConfigListCreateView.as_view(), name='loanconfig-list'),
+    path('loanconfigs/<str:product>/', LoanConfigDetailView.as_view(), name='loanconfig-product-detail'),
     path('loanapproval/<int:pk>/', LoanApprovalUpdateView.as_view(), name='loanapproval-detail'),
     path('loanfundapproval/<int:pk>/', LoanFundApprovalUpdateView.as_view(), name='loanfundapproval-detail'),
+    path('loanapproval/bulk/', LoanBulkApprovalView.as_view(), name='loanapproval-bulk'),
+    path('loanfundapproval/bulk/', LoanFundBulkApprovalView.as_view(), name='loanfundapproval-bulk'),
     path('paymentschedule/<int:loan_id>/', PaymentScheduleView.as_view(), name='paymentschedule'),
+    path('export/<str:resource>/', ExportView.as_view(), name='export'),
+    path('analytics/portfolio/', PortfolioAnalyticsView.as_view(), name='portfolio-analytics'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
+    path('async/loanfunds/', AsyncLoanFundListView.as_view(), name='async-loanfund-list'),
+    path('async/loans/', AsyncLoanListView.as_view(), name='async-loan-list'),
+    path('async/paymentschedule/<int:loan_id>/', AsyncPaymentScheduleView.as_view(), name='async-paymentschedule'),
 
 ]
 
@@ -1,13 +1,12 @@
 from rest_framework import generics, status
-import uuid
-from rest_framework.exceptions import ValidationError
+from rest_framework.exceptions import NotFound, ValidationError
 
-from django.db import transaction
+from django.db import IntegrityError, transaction
+from django.db.models import Max
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.decorators import api_view, permission_classes
-from django.db.models import Sum
-from .models import LoanFund, LoanConfig, Loan, Payment
+from .models import CapacityLedger, LoanFund, LoanConfig, Loan, Payment
 from .serializers import (
     LoanFundSerializer,
     LoanConfigSerializer,
@@ -15,9 +14,45 @@ from .serializers import (
     PaymentSerializer,
     LoanApprovalSerializer,
     LoanFundApprovalSerializer,
+    LoanApplicationSerializer,
+    BulkLoanDecisionSerializer,
+    BulkLoanFundDecisionSerializer,
 )
 from .permissions import IsLoanProvider, IsLoanCustomer, IsBankPersonnel
+from .pagination import IdCursorPagination
+from .payments import post_payment, ingest_payments, new_reference_number
+from .parsers import CSVParser, NDJSONParser
+from .projection import FieldProjectionMixin
 from rest_framework.views import APIView
+from rest_framework.parsers import JSONParser
+from django.http import StreamingHttpResponse
+from .export import EXPORTERS
+from .analytics import cached_portfolio_summary
+from .renderers import NDJSONRenderer, CSVRenderer, PrometheusRenderer, ndjson_lines, csv_lines
+from .profiling import metrics
+from .response_cache import FUNDS, LOANS, CachedResponseMixin
+from .cache import get_active_config
+from .quotes import max_amount, max_term, parse_axis, quote_grid
+from .approvals import decide_funds, decide_loans
+from .installments import start_schedules
+from .routers import ReplicaReadMixin
+from django.conf import settings
+
+
+def loan_funds_visible_to(user):
+    if user.role == 'LP':
+        return LoanFund.objects.filter(provider=user)
+    elif user.role == 'BP':
+        return LoanFund.objects.all()
+    return LoanFund.objects.none()
+
+
+def loans_visible_to(user):
+    if user.role == 'LC':
+        return Loan.objects.filter(customer=user)
+    elif user.role == 'BP':
+        return Loan.objects.all()
+    return Loan.objects.none()
 
 
 @api_view(['GET'])
@@ -26,84 +61,201 @@ def sample_view(request):
     return Response({'message': 'Hello, DRF is working with custom models!'})
 
 
-class LoanFundListView(generics.ListAPIView):
+class LoanFundListView(ReplicaReadMixin, CachedResponseMixin, FieldProjectionMixin, generics.ListAPIView):
     serializer_class = LoanFundSerializer
     permission_classes = [IsAuthenticated]
-    
+    pagination_class = IdCursorPagination
+    cache_scope = FUNDS
+
     def get_queryset(self):
-        user = self.request.user
-        if user.role == 'LP':
-            return LoanFund.objects.filter(provider=user)
-        elif user.role == 'BP':
-            return LoanFund.objects.all()
-        return LoanFund.objects.none()
+        return loan_funds_visible_to(self.request.user)
+
+    def get_last_modified(self):
+        return self.get_queryset().aggregate(last=Max('updated_at'))['last']
 
 
-class LoanListView(generics.ListAPIView):
+class LoanListView(ReplicaReadMixin, CachedResponseMixin, FieldProjectionMixin, generics.ListAPIView):
     serializer_class = LoanSerializer
     permission_classes = [IsAuthenticated]
-    
+    pagination_class = IdCursorPagination
+    deferred_fields = ('payment_schedule',)
+    cache_scope = LOANS
+
     def get_queryset(self):
-        user = self.request.user
-        if user.role == 'LC':
-            return Loan.objects.filter(customer=user)
-        elif user.role == 'BP':
-            return Loan.objects.all()
-        return Loan.objects.none()
+        return loans_visible_to(self.request.user)
+
+    def get_last_modified(self):
+        return self.get_queryset().aggregate(last=Max('updated_at'))['last']
+
+
+class LoanOriginationView(generics.CreateAPIView):
+    """
+    Loan applications. The loan is created pending, priced under the latest
+    version of the requested product. Available funds are checked without a
+    lock here; approval checks them again under the ledger lock.
+    """
+    serializer_class = LoanApplicationSerializer
+    permission_classes = [IsAuthenticated, IsLoanCustomer]
+
+    def perform_create(self, serializer):
+        amount = serializer.validated_data['amount']
+        ledger = CapacityLedger.objects.filter(pk=CapacityLedger.SINGLETON_ID).first()
+        if ledger is None or amount > ledger.available:
+            raise ValidationError({'amount': "Exceeds the funds available for loans."})
+        serializer.save(
+            customer=self.request.user,
+            interest_rate=serializer.validated_data['config'].interest_rate,
+            remaining_amount=amount,
+            status='P',
+        )
+
+
+class LoanQuoteView(APIView):
+    """
+    ``?amounts=1000,5000,...&terms=12,24,...[&product=...]``: EMI, total
+    interest and eligibility for every amount and term pair, as grids with
+    one row per amount and one column per term.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, format=None):
+        params = request.query_params
+        amounts = parse_axis(params.get('amounts'), 'amounts', float, max_amount())
+        terms = parse_axis(params.get('terms'), 'terms', int, max_term())
+        config = get_active_config(params.get('product') or LoanConfig.DEFAULT_PRODUCT)
+        if config is None:
+            raise NotFound("Unknown loan product.")
+        ledger = CapacityLedger.objects.filter(pk=CapacityLedger.SINGLETON_ID).first()
+        grid = quote_grid(config, amounts, terms, available=ledger.available if ledger else 0)
+        return Response({
+            'product': config.product,
+            'version': config.version,
+            'interest_rate': config.interest_rate,
+            'compound_frequency': config.compound_frequency,
+            'amounts': amounts,
+            'terms': terms,
+            'emi': grid['emi'].tolist(),
+            'total_interest': grid['total_interest'].tolist(),
+            'eligible': grid['eligible'].tolist(),
+        })
 
 
 class PaymentCreateView(generics.CreateAPIView):
     serializer_class = PaymentSerializer
     permission_classes = [IsAuthenticated, IsLoanCustomer]
 
+    def get_reference_number(self, serializer):
+        """
+        The Idempotency-Key header, when sent, is stored as the reference
+        number so a retried request maps onto the payment it already created.
+        """
+        key = self.request.headers.get('Idempotency-Key', '').strip()
+        if len(key) > Payment._meta.get_field('reference_number').max_length:
+            raise ValidationError({'Idempotency-Key': 'Ensure this header has no more than 50 characters.'})
+        ref = key or serializer.validated_data.get('reference_number', None)
+        if not ref or ref.strip() == "":
+            ref = new_reference_number()
+        return ref
+
     def perform_create(self, serializer):
+        loan = serializer.validated_data['loan']
+        amount = serializer.validated_data['amount']
+        prepayment = serializer.validated_data.pop('prepayment', None)
+
+        if loan.customer_id != self.request.user.id:
+            raise ValidationError("You can only make payments for your own loans.")
+
         with transaction.atomic():
-            loan = serializer.validated_data['loan']
-            amount = serializer.validated_data['amount']
-            
-            
-            if loan.customer != self.request.user:
-                raise ValidationError("You can only make payments for your own loans.")
-            
-           
-            if amount > loan.remaining_amount:
+            serializer.save()
+            # Re-amortize first: posting the payment marks installments paid,
+            # and none of them may be settled by prepaid principal.
+            if prepayment:
+                loan.apply_prepayment(amount, prepayment)
+            remaining = post_payment(loan, amount)
+            if remaining is None:
                 raise ValidationError("Payment exceeds remaining loan balance.")
-            
-            
-            loan.remaining_amount = float(loan.remaining_amount) - float(amount)
-            if loan.remaining_amount <= 0:
-               
+            if remaining <= 0:
+                loan.remaining_amount = remaining
                 loan.status = 'R'
-            loan.save()
-            
-           
-            ref = serializer.validated_data.get('reference_number', None)
-            if not ref or ref.strip() == "":
-                ref = f"PAY-{uuid.uuid4().hex[:8].upper()}"
-            
-            
-            serializer.save(reference_number=ref)
+                loan.save(update_fields=['remaining_amount', 'status'])
+        return remaining
 
     def create(self, request, *args, **kwargs):
-        
-        response = super().create(request, *args, **kwargs)
-       
-        loan_id = request.data.get('loan')
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        serializer.validated_data['reference_number'] = self.get_reference_number(serializer)
         try:
-            loan = Loan.objects.get(id=loan_id)
-            response.data['remaining_amount'] = loan.remaining_amount
-        except Loan.DoesNotExist:
-            response.data['remaining_amount'] = None
-        return response
+            remaining = self.perform_create(serializer)
+        except IntegrityError:
+            return self.replay(serializer.validated_data)
+
+        data = dict(serializer.data)
+        data['remaining_amount'] = remaining
+        return Response(data, status=status.HTTP_201_CREATED, headers=self.get_success_headers(data))
+
+    def replay(self, validated_data):
+        """
+        Answers a retried request with the payment stored under its reference.
+        """
+        payment = Payment.objects.select_related('loan').get(reference_number=validated_data['reference_number'])
+        if payment.loan_id != validated_data['loan'].id or payment.amount != validated_data['amount']:
+            return Response({'error': 'Reference number already used for a different payment.'}, status=status.HTTP_409_CONFLICT)
+        data = dict(self.get_serializer(payment).data)
+        data['remaining_amount'] = payment.loan.remaining_amount
+        return Response(data, status=status.HTTP_200_OK)
+
+class PaymentBulkCreateView(APIView):
+    """
+    Posts a settlement batch sent as a JSON list, NDJSON or CSV and returns a
+    per-row report.
+    """
+    permission_classes = [IsAuthenticated, IsBankPersonnel]
+    parser_classes = [JSONParser, NDJSONParser, CSVParser]
+
+    def post(self, request, format=None):
+        rows = request.data
+        if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+            raise ValidationError("Expected a list of payment rows.")
+        results = ingest_payments(rows)
+        created = sum(1 for result in results if result['status'] == 'created')
+        return Response({
+            'created': created,
+            'rejected': len(results) - created,
+            'results': results,
+        }, status=status.HTTP_200_OK)
+
+
+class LoanConfigListCreateView(generics.ListCreateAPIView):
+    """
+    Every version of every product (``?product=`` narrows it to one).
+    Creating publishes a new product, or the next version of an existing one.
+    """
+    serializer_class = LoanConfigSerializer
+    permission_classes = [IsAuthenticated, IsBankPersonnel]
+
+    def get_queryset(self):
+        configs = LoanConfig.objects.order_by('product', '-version')
+        product = self.request.query_params.get('product')
+        return configs.filter(product=product) if product else configs
+
 
 class LoanConfigDetailView(generics.RetrieveUpdateAPIView):
-    queryset = LoanConfig.objects.all()
+    """
+    The latest version of a product, the default one without ``product``.
+    Updating it publishes the next version; existing loans keep theirs.
+    """
     serializer_class = LoanConfigSerializer
     permission_classes = [IsAuthenticated, IsBankPersonnel]
 
-    
     def get_object(self):
-        return LoanConfig.objects.first()
+        config = LoanConfig.latest(self.kwargs.get('product', LoanConfig.DEFAULT_PRODUCT))
+        if config is None:
+            raise NotFound("Loan configuration not set.")
+        return config
+
+    def perform_update(self, serializer):
+        serializer.validated_data.pop('product', None)
+        serializer.instance = serializer.instance.revise(**serializer.validated_data)
 
 
 class LoanApprovalUpdateView(generics.UpdateAPIView):
@@ -112,15 +264,26 @@ class LoanApprovalUpdateView(generics.UpdateAPIView):
     permission_classes = [IsAuthenticated, IsBankPersonnel]
 
     def update(self, request, *args, **kwargs):
-        instance = self.get_object()
-        new_status = request.data.get('status', None)
-        
-        if new_status == 'A':
-            approved_funds_total = LoanFund.objects.filter(status='A').aggregate(total=Sum('amount'))['total'] or 0
-            approved_loans_total = Loan.objects.filter(status='A').aggregate(total=Sum('amount'))['total'] or 0
-            if (approved_loans_total + instance.amount) > approved_funds_total:
-                return Response({'error': 'Approving this loan exceeds available funds.'}, status=status.HTTP_400_BAD_REQUEST)
-        return super().update(request, *args, **kwargs)
+        with transaction.atomic():
+            instance = self.get_object()
+            new_status = request.data.get('status', None)
+
+            if new_status == 'A' and instance.status != 'A':
+                ledger = CapacityLedger.lock()
+                if ledger.approved_loans + instance.amount > ledger.approved_funds:
+                    return Response({'error': 'Approving this loan exceeds available funds.'}, status=status.HTTP_400_BAD_REQUEST)
+            return super().update(request, *args, **kwargs)
+
+    def perform_update(self, serializer):
+        was_approved = serializer.instance.status == 'A'
+        approve = serializer.validated_data.get('status') == 'A'
+        if approve:
+            serializer.instance.refresh_emi()
+        loan = serializer.save()
+        if approve and not was_approved:
+            start_schedules([loan])
+        elif was_approved and loan.status != 'A':
+            loan.installments.all().delete()
 
 
 class LoanFundApprovalUpdateView(generics.UpdateAPIView):
@@ -128,15 +291,123 @@ class LoanFundApprovalUpdateView(generics.UpdateAPIView):
     serializer_class = LoanFundApprovalSerializer
     permission_classes = [IsAuthenticated, IsBankPersonnel]
 
-class PaymentScheduleView(APIView):
+class BulkDecisionView(APIView):
+    """
+    Approves or rejects a batch of queued requests, listed by ``ids`` or
+    selected by ``filter``, and returns one outcome per request.
+    """
+    permission_classes = [IsAuthenticated, IsBankPersonnel]
+    serializer_class = None
+    model = None
+    # Filter parameter -> queryset lookup.
+    filter_lookups = {}
+    decide = None
+
+    def post(self, request, format=None):
+        serializer = self.serializer_class(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        queryset = None
+        if 'filter' in data:
+            queryset = self.model.objects.filter(
+                **{self.filter_lookups[name]: value for name, value in data['filter'].items()}
+            )
+        results = self.decide(
+            data['status'], ids=data.get('ids'), queryset=queryset, limit=settings.LOAN_BULK_DECISION_MAX,
+        )
+        counts = {'approved': 0, 'rejected': 0, 'skipped': 0}
+        for result in results:
+            counts[result['status']] += 1
+        return Response({**counts, 'results': results}, status=status.HTTP_200_OK)
+
+
+class LoanBulkApprovalView(BulkDecisionView):
+    serializer_class = BulkLoanDecisionSerializer
+    model = Loan
+    filter_lookups = {
+        'customer': 'customer_id',
+        'product': 'config__product',
+        'min_amount': 'amount__gte',
+        'max_amount': 'amount__lte',
+        'created_before': 'created_at__lt',
+    }
+    decide = staticmethod(decide_loans)
+
+
+class LoanFundBulkApprovalView(BulkDecisionView):
+    serializer_class = BulkLoanFundDecisionSerializer
+    model = LoanFund
+    filter_lookups = {
+        'provider': 'provider_id',
+        'min_amount': 'amount__gte',
+        'max_amount': 'amount__lte',
+        'created_before': 'created_at__lt',
+    }
+    decide = staticmethod(decide_funds)
+
+
+class PaymentScheduleView(ReplicaReadMixin, CachedResponseMixin, APIView):
     permission_classes = [IsAuthenticated]
+    cache_scope = LOANS
+
+    def cache_owner(self, user):
+        # Only customers are limited to their own loans here.
+        return user.pk if user.role == 'LC' else None
 
-    def get(self, request, loan_id):
+    def get_last_modified(self):
+        return self.loan.updated_at
+
+    def get_uncached(self, request, loan_id):
         try:
             loan = Loan.objects.get(id=loan_id)
             if request.user.role == 'LC' and loan.customer != request.user:
                 return Response({'error': 'Not allowed.'}, status=status.HTTP_403_FORBIDDEN)
-            schedule = loan.generate_payment_schedule()
+            schedule = loan.get_payment_schedule()
+            self.loan = loan
             return Response({'schedule': schedule})
         except Loan.DoesNotExist:
-            return Response({'error': 'Loan not found.'}, status=status.HTTP_404_NOT_FOUND)
\ No newline at end of file
+            return Response({'error': 'Loan not found.'}, status=status.HTTP_404_NOT_FOUND)
+
+
+class ExportView(APIView):
+    """
+    Streams every Loan, Payment or schedule row as NDJSON (default) or CSV.
+    """
+    permission_classes = [IsAuthenticated, IsBankPersonnel]
+    renderer_classes = [NDJSONRenderer, CSVRenderer]
+
+    def get(self, request, resource, format=None):
+        exporter = EXPORTERS.get(resource)
+        if exporter is None:
+            return Response({'error': 'Unknown export.'}, status=status.HTTP_404_NOT_FOUND)
+
+        columns, rows = exporter()
+        renderer = request.accepted_renderer
+        lines = csv_lines(columns, rows) if renderer.format == 'csv' else ndjson_lines(columns, rows)
+        response = StreamingHttpResponse(lines, content_type=f'{renderer.media_type}; charset={renderer.charset}')
+        response['Content-Disposition'] = f'attachment; filename="{resource}.{renderer.format}"'
+        return response
+
+
+class PortfolioAnalyticsView(ReplicaReadMixin, APIView):
+    """
+    Portfolio totals, fund utilization, delinquency and projected monthly
+    cash flows. Pass ?refresh=1 to bypass the cached report.
+    """
+    permission_classes = [IsAuthenticated, IsBankPersonnel]
+
+    def get(self, request, format=None):
+        refresh = request.query_params.get('refresh') in ('1', 'true')
+        return Response(cached_portfolio_summary(refresh=refresh))
+
+
+class MetricsView(APIView):
+    """
+    Request metrics of this process in the Prometheus text format, as
+    collected by ProfilingMiddleware. Empty unless LOAN_PROFILING is on.
+    """
+    permission_classes = [IsAuthenticated, IsBankPersonnel]
+    renderer_classes = [PrometheusRenderer]
+
+    def get(self, request, format=None):
+        return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')